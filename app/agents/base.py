@@ -8,6 +8,10 @@ class AgentResult:
     citations: list[str] = field(default_factory=list)
     assumptions: list[str] = field(default_factory=list)
     trace_id: str | None = None
+    # Run diagnostics (timings, step counts), kept with each evaluated item
+    trace: dict[str, Any] = field(default_factory=dict)
+    # Resources consumed (steps, tool calls, tokens, elapsed time)
+    budget: dict[str, Any] = field(default_factory=dict)
 
 
 class IAgent(Protocol):
@@ -1,15 +1,329 @@
+from __future__ import annotations
+
+import os
+from pathlib import Path
+from time import perf_counter
 from typing import Any
 
 from app.agents.base import AgentResult
+from app.search.fanout import FanOutReport, fan_out, hedge_delay
+from app.search.novelty import NoveltyTracker
+from app.search.relevance import prune_evidence
+from app.search.transport import CancelToken
+from app.tools.context_packer import context_budget, estimate_tokens
+from app.tools.fetch import canonicalize_url, page_fetcher
+from app.tools.search import SearchResult, web_search
+
+DEFAULT_QUERY_TEMPLATES = (
+    "{company} {question}",
+    "{company} company overview",
+    "{company} annual report",
+    "{company} latest news",
+)
 
 
 class AgentV002:
+    """Research agent: concurrent web search, then Gemini synthesis.
+
+    Expands the question into up to `steps` sub-queries from
+    `research.query_templates` and runs them in rounds of `batch_size`, each
+    round concurrently with `fan_out`, hedging slow provider calls. After
+    each round the new results are scored for novelty against what was
+    gathered so far; below `novelty.threshold` the loop stops early. The
+    pages behind the top results are fetched (`fetch`), and their text
+    replaces the search snippet. Results are deduplicated by canonical URL
+    and page content. With `context.prune`, their passages are ranked
+    against the question and packed into the token budget left by
+    `context.window_tokens`, `max_output_tokens` and the fixed prompt (see
+    `app.search.relevance`). The remaining sources are numbered, and the
+    model answers citing them as `[n]`. The returned citations are the
+    sources' canonical URLs in the same order.
+
+    `trace` records each search step, the steps used and why the loop
+    stopped, the passages and sources kept and dropped by pruning, and the
+    run's latency. The search time is the critical path of the rounds, with
+    the sequential sum alongside.
+    """
+
     def __init__(self, config: dict[str, Any]):
         self.config = config
+        self.model_name: str = str(self.config.get("model", "gemini-1.5-pro-latest"))
+        self.temperature: float = float(self.config.get("temperature", 0.2))
+        self.top_p: float = float(self.config.get("top_p", 0.95))
+        self.max_output_tokens: int = int(self.config.get("max_output_tokens", 1024))
+        self.steps: int = int(self.config.get("steps", 8))
+
+        search_cfg = dict(self.config.get("search", {}) or {})
+        self.provider: str = str(search_cfg.get("provider", "http"))
+        self.search_timeout_s: float = float(search_cfg.get("timeout_s", 10.0))
+        self.max_results: int = int(search_cfg.get("max_results", 5))
+
+        research_cfg = dict(self.config.get("research", {}) or {})
+        self.max_concurrency: int = int(research_cfg.get("max_concurrency", 4))
+        self.hedge_cfg: dict[str, Any] = dict(research_cfg.get("hedge", {}) or {})
+        novelty_cfg = dict(research_cfg.get("novelty", {}) or {})
+        self.early_stop: bool = bool(novelty_cfg.get("enabled", True))
+        self.novelty_threshold: float = float(novelty_cfg.get("threshold", 0.3))
+        self.shingle_size: int = int(novelty_cfg.get("shingle_size", 3))
+        self.batch_size: int = int(research_cfg.get("batch_size", 2))
+        self.query_templates: list[str] = [
+            str(t)
+            for t in research_cfg.get("query_templates") or DEFAULT_QUERY_TEMPLATES
+        ]
+
+        context_cfg = dict(self.config.get("context", {}) or {})
+        self.prune: bool = bool(context_cfg.get("prune", True))
+        self.window_tokens: int = int(context_cfg.get("window_tokens", 32768))
+        self.max_context_tokens: int = int(context_cfg.get("max_context_tokens", 0))
+        self.chars_per_token: float = float(context_cfg.get("chars_per_token", 4.0))
+        self.passage_chars: int = int(context_cfg.get("passage_chars", 600))
+
+        # Lazy import so other parts of the app don't require the dependency
+        import google.generativeai as genai  # type: ignore
+
+        api_key = self.config.get("google_api_key") or os.getenv("GOOGLE_API_KEY", "")
+        if not api_key:
+            raise RuntimeError(
+                "GOOGLE_API_KEY is not set; required for V002 model calls."
+            )
+        genai.configure(api_key=api_key)
+
+        self._genai = genai
+        self._model = genai.GenerativeModel(self.model_name)
+
+    def _load_system_prompt(self) -> str:
+        prompt_path = (
+            Path(__file__).resolve().parents[1] / "prompts" / "agent" / "v002.txt"
+        )
+        try:
+            return prompt_path.read_text(encoding="utf-8").strip()
+        except Exception:
+            return (
+                "Answer from the provided web search results only. "
+                "Include citations [n]."
+            )
+
+    def _queries(self, company: str, question: str) -> list[str]:
+        """Distinct sub-queries, in template order, at most `steps` of them."""
+        queries: list[str] = []
+        for template in self.query_templates:
+            query = " ".join(
+                template.format(company=company, question=question).split()
+            )
+            if query and query.lower() not in {q.lower() for q in queries}:
+                queries.append(query)
+        return queries[: max(1, self.steps)]
+
+    def _search(self, query: str, cancel: CancelToken) -> list[SearchResult]:
+        return web_search(
+            query,
+            timeout_s=self.search_timeout_s,
+            max_results=self.max_results,
+            config=self.config,
+            cancel=cancel,
+        )
+
+    def _research(
+        self, queries: list[str], started: float
+    ) -> tuple[FanOutReport, dict[str, Any]]:
+        """Run `queries` in rounds until novelty drops or they run out.
+
+        A round's novelty is that of its most novel step. If every step of
+        the first round fails the loop stops; a later round failing is
+        skipped, and the loop carries on with the evidence it has.
+
+        Returns:
+            tuple: All steps run, and `steps_used`, `stop_reason` and the
+                per-round `novelty` for the trace.
+        """
+        size = max(1, self.batch_size if self.early_stop else len(queries))
+        report = FanOutReport()
+        tracker = NoveltyTracker(self.shingle_size)
+        novelty: list[float] = []
+        stop_reason = "steps_exhausted"
+        for i in range(0, len(queries), size):
+            batch = fan_out(
+                queries[i : i + size],
+                self._search,
+                max_concurrency=self.max_concurrency,
+                hedge_after_s=hedge_delay(self.provider, self.hedge_cfg),
+                started=started,
+            )
+            report.steps.extend(batch.steps)
+            if i == 0 and all(s.error for s in batch.steps):
+                stop_reason = "search_failed"
+                break
+            # Steps are scored in query order against everything before them,
+            # so the first round can already show that more queries won't help
+            scores: list[float] = []
+            for step in batch.steps:
+                if step.error:
+                    continue
+                if tracker.empty:
+                    tracker.add(step.results or [])
+                else:
+                    scores.append(tracker.add(step.results or []))
+            if not scores:
+                continue
+            novelty.append(round(max(scores), 4))
+            if i + size < len(queries) and novelty[-1] < self.novelty_threshold:
+                stop_reason = "low_novelty"
+                break
+        return report, {
+            "steps_planned": len(queries),
+            "steps_used": len(report.steps),
+            "stop_reason": stop_reason,
+            "novelty": novelty,
+        }
+
+    @staticmethod
+    def _sources(report: FanOutReport) -> list[SearchResult]:
+        """Results of all steps, first occurrence of each URL, in step order."""
+        seen: set[str] = set()
+        sources: list[SearchResult] = []
+        for step in report.steps:
+            for result in step.results or []:
+                if result["url"] not in seen:
+                    seen.add(result["url"])
+                    sources.append(result)
+        return sources
+
+    def _evidence(
+        self, sources: list[SearchResult]
+    ) -> tuple[list[SearchResult], dict[str, float]]:
+        """Sources with fetched page text in place of snippets, deduplicated.
+
+        Returns:
+            tuple: Sources in search order under their canonical URLs, and
+                the fetcher's counters. A fetched page's text replaces the
+                snippet. Sources repeating an earlier canonical URL or page
+                content are dropped.
+        """
+        # One fetcher per run: the agent itself is shared by concurrent runs
+        fetcher = page_fetcher(self.config)
+        pages = (
+            {p.url: p for p in fetcher.fetch(s["url"] for s in sources)}
+            if fetcher is not None
+            else {}
+        )
+        evidence: list[SearchResult] = []
+        seen: set[str] = set()
+        for source in sources:
+            try:
+                key = canonicalize_url(source["url"])
+            except ValueError:
+                key = source["url"]
+            if key in seen or (fetcher is not None and key in fetcher.duplicates):
+                continue
+            seen.add(key)
+            page = pages.get(key)
+            snippet = page.text if page is not None else source["snippet"]
+            evidence.append({"title": source["title"], "url": key, "snippet": snippet})
+        return evidence, fetcher.stats() if fetcher is not None else {}
+
+    def _prune(
+        self, company: str, question: str, sources: list[SearchResult]
+    ) -> tuple[list[SearchResult], dict[str, int]]:
+        """Sources cut down to their passages that best fit the context budget.
+
+        Returns:
+            tuple: Kept sources in their original order, and the pruning
+                counters for the trace.
+        """
+        budget = context_budget(
+            window_tokens=self.window_tokens,
+            max_output_tokens=self.max_output_tokens,
+            prompt_tokens=estimate_tokens(
+                self._build_prompt(company, question, []), self.chars_per_token
+            ),
+            max_context_tokens=self.max_context_tokens,
+        )
+        pruned = prune_evidence(
+            f"{company} {question}",
+            sources,
+            budget,
+            passage_chars=self.passage_chars,
+            chars_per_token=self.chars_per_token,
+        )
+        return pruned.sources, pruned.stats()
+
+    @staticmethod
+    def _trace(
+        report: FanOutReport,
+        loop: dict[str, Any],
+        fetch_stats: dict[str, float],
+        prune_stats: dict[str, int],
+        started: float,
+    ) -> dict[str, Any]:
+        trace: dict[str, Any] = dict(loop)
+        trace.update({f"search_{k}": v for k, v in report.summary().items()})
+        trace.update({f"fetch_{k}": v for k, v in fetch_stats.items()})
+        trace.update({f"prune_{k}": v for k, v in prune_stats.items()})
+        trace["search_steps_detail"] = [
+            {
+                "query": s.query,
+                "start_s": round(s.start_s, 4),
+                "elapsed_s": round(s.elapsed_s, 4),
+                "results": len(s.results or []),
+                "hedged": s.hedged,
+                "hedge_won": s.hedge_won,
+                "error": s.error,
+            }
+            for s in report.steps
+        ]
+        trace["latency_s"] = perf_counter() - started
+        return trace
+
+    def _build_prompt(
+        self, company: str, question: str, sources: list[SearchResult]
+    ) -> str:
+        context = "\n\n".join(
+            f"[{n}] {s['title']}\n{s['url']}\n{s['snippet']}"
+            for n, s in enumerate(sources, start=1)
+        )
+        return (
+            f"{self._load_system_prompt()}\n\n"
+            f"Web search results:\n{context}\n\n"
+            f"Company: {company}\n"
+            f"Question: {question}\n"
+            "Answer concisely, citing the search results as [n]."
+        )
 
     def run(self, company: str, question: str) -> AgentResult:
-        answer = (
-            f"[V002] Deep research answer about {company}: {{search + synthesis here}}"
+        started = perf_counter()
+        report, loop = self._research(self._queries(company, question), started)
+        sources, fetch_stats = self._evidence(self._sources(report))
+        if not sources:
+            errors = [s.error for s in report.steps if s.error]
+            return AgentResult(
+                answer=f"[V002] No web search results found for {company}.",
+                assumptions=[
+                    f"Web search failed: {errors[0]}"
+                    if errors
+                    else "No search result matched the research queries"
+                ],
+                trace=self._trace(report, loop, fetch_stats, {}, started),
+            )
+
+        prune_stats: dict[str, int] = {}
+        if self.prune:
+            sources, prune_stats = self._prune(company, question, sources)
+        citations = [s["url"] for s in sources]
+        try:
+            response = self._model.generate_content(
+                self._build_prompt(company, question, sources),
+                generation_config={
+                    "temperature": self.temperature,
+                    "top_p": self.top_p,
+                    "max_output_tokens": self.max_output_tokens,
+                },
+            )
+            text = getattr(response, "text", None) or ""
+            answer = text.strip() or "(no response)"
+        except Exception as e:  # pragma: no cover - transient network/api
+            answer = f"[V002] Error: {e}"
+        return AgentResult(
+            answer=answer,
+            citations=citations,
+            trace=self._trace(report, loop, fetch_stats, prune_stats, started),
         )
-        citations = ["https://example.com/source1", "https://example.com/source2"]
-        return AgentResult(answer=answer, citations=citations)
@@ -1,17 +1,118 @@
+from __future__ import annotations
+
+import os
+from pathlib import Path
 from typing import Any
 
 from app.agents.base import AgentResult
+from app.tools.context_packer import (
+    context_budget,
+    estimate_tokens,
+    pack_context,
+    spans_from_result,
+)
+from app.tools.retriever import retrieve
 
 
 class AgentV003:
+    """RAG agent: answers from the company's index via Gemini.
+
+    Retrieves passages with `retrieve`, packs them into a token budget derived
+    from `context.window_tokens`, `max_output_tokens` and the fixed prompt, and
+    asks the model to answer citing the packed spans as `[n]`. The returned
+    citations are the spans' ids in the same order.
+    """
+
     def __init__(self, config: dict[str, Any]):
         self.config = config
+        self.model_name: str = str(self.config.get("model", "gemini-1.5-pro-latest"))
+        self.temperature: float = float(self.config.get("temperature", 0.2))
+        self.top_p: float = float(self.config.get("top_p", 0.95))
+        self.max_output_tokens: int = int(self.config.get("max_output_tokens", 1024))
+
+        retriever_cfg = dict(self.config.get("retriever", {}) or {})
+        self.top_k: int = int(retriever_cfg.get("top_k", 8))
+        self.min_score: float = float(retriever_cfg.get("min_score", 0.3))
+
+        context_cfg = dict(self.config.get("context", {}) or {})
+        self.window_tokens: int = int(context_cfg.get("window_tokens", 32768))
+        self.max_context_tokens: int = int(context_cfg.get("max_context_tokens", 0))
+        self.chars_per_token: float = float(context_cfg.get("chars_per_token", 4.0))
+
+        # Lazy import so other parts of the app don't require the dependency
+        import google.generativeai as genai  # type: ignore
+
+        api_key = self.config.get("google_api_key") or os.getenv("GOOGLE_API_KEY", "")
+        if not api_key:
+            raise RuntimeError(
+                "GOOGLE_API_KEY is not set; required for V003 model calls."
+            )
+        genai.configure(api_key=api_key)
+
+        self._genai = genai
+        self._model = genai.GenerativeModel(self.model_name)
+
+    def _load_system_prompt(self) -> str:
+        prompt_path = (
+            Path(__file__).resolve().parents[1] / "prompts" / "agent" / "v003.txt"
+        )
+        try:
+            return prompt_path.read_text(encoding="utf-8").strip()
+        except Exception:
+            return (
+                "Use only the provided retrieved context to answer. "
+                "Include citations [n]."
+            )
+
+    def _build_prompt(self, company: str, question: str, context: str) -> str:
+        return (
+            f"{self._load_system_prompt()}\n\n"
+            f"Retrieved context:\n{context}\n\n"
+            f"Company: {company}\n"
+            f"Question: {question}\n"
+            "Answer concisely, citing the context as [n]."
+        )
 
     def run(self, company: str, question: str) -> AgentResult:
-        # Placeholder: pretend we retrieved k passages
-        retrieved: list[str] = [
-            "doc://kb/acme/overview.md#chunk-1",
-            "doc://kb/acme/financials.pdf#chunk-12",
-        ]
-        answer = f"[V003] RAG-grounded answer about {company}: {{retrieved context + synthesis}}"
-        return AgentResult(answer=answer, citations=retrieved)
+        result = retrieve(
+            question,
+            top_k=self.top_k,
+            min_score=self.min_score,
+            company=company,
+            config=self.config,
+        )
+        if not len(result):
+            return AgentResult(
+                answer=f"[V003] No indexed context found for {company}.",
+                assumptions=[
+                    "Company index missing or no passage matched the question"
+                ],
+            )
+
+        budget = context_budget(
+            window_tokens=self.window_tokens,
+            max_output_tokens=self.max_output_tokens,
+            prompt_tokens=estimate_tokens(
+                self._build_prompt(company, question, ""), self.chars_per_token
+            ),
+            max_context_tokens=self.max_context_tokens,
+        )
+        packed = pack_context(
+            spans_from_result(result), budget, chars_per_token=self.chars_per_token
+        )
+        prompt = self._build_prompt(company, question, packed.render())
+
+        try:
+            response = self._model.generate_content(
+                prompt,
+                generation_config={
+                    "temperature": self.temperature,
+                    "top_p": self.top_p,
+                    "max_output_tokens": self.max_output_tokens,
+                },
+            )
+            text = getattr(response, "text", None) or ""
+            answer = text.strip() or "(no response)"
+            return AgentResult(answer=answer, citations=packed.citations)
+        except Exception as e:  # pragma: no cover - transient network/api
+            return AgentResult(answer=f"[V003] Error: {e}", citations=packed.citations)
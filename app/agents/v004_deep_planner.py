@@ -1,17 +1,199 @@
+from __future__ import annotations
+
+import asyncio
 from typing import Any
 
 from app.agents.base import AgentResult
+from app.orchestration.blackboard import Blackboard
+from app.orchestration.budget import BudgetLimits, PlanBudget
+from app.orchestration.executor import OK, StepHandler, run_plan
+from app.orchestration.planner import PlanStep, make_plan
+from app.search.transport import SearchError
+from app.tools.context_packer import estimate_tokens
+from app.tools.retriever import retrieve
+from app.tools.search import web_search
 
 
 class AgentV004:
+    """Deep-planning agent: plans the research, then executes it as a DAG.
+
+    The plan from `make_plan` runs on `run_plan`, at most
+    `planner.max_parallel_tasks` steps at a time, so RAG retrieval and web
+    search overlap. Both add their evidence to a per-run blackboard. The
+    synthesis step answers from the blackboard once both have finished. Web
+    search is optional: if it fails, the trace shows it `failed` and the
+    answer comes from the index alone.
+    `ask_user` has no handler in non-interactive runs and is skipped; the
+    assumptions policy stands in for the answers.
+
+    Each run is accounted against `planner.budget` (see
+    `app.orchestration.budget`); the plan's `max_steps` is the default hard
+    step limit. Past a soft limit the answer is synthesised from the
+    evidence gathered so far, and past a hard limit the run stops without
+    an answer. Synthesis is the only step that spends tokens, so the token
+    budget only guards it: the prompt built from the evidence is estimated
+    and refused over the hard `max_tokens`. Synthesis is still templated, so
+    no output tokens are counted. `budget` holds what the run consumed, and
+    `trace` the executor's summary: overall status, and status and timings
+    per step.
+    """
+
     def __init__(self, config: dict[str, Any]):
         self.config = config
+        planner_cfg = dict(self.config.get("planner", {}) or {})
+        self.max_steps: int = int(planner_cfg.get("max_steps", 20))
+        self.max_parallel_tasks: int = int(planner_cfg.get("max_parallel_tasks", 2))
+        self.max_user_questions: int = int(planner_cfg.get("max_user_questions", 3))
+        self.budget_cfg: dict[str, Any] = dict(planner_cfg.get("budget", {}) or {})
+
+        retriever_cfg = dict(self.config.get("retriever", {}) or {})
+        self.top_k: int = int(retriever_cfg.get("top_k", 8))
+        self.min_score: float = float(retriever_cfg.get("min_score", 0.3))
+
+        search_cfg = dict(self.config.get("search", {}) or {})
+        self.search_timeout_s: float = float(search_cfg.get("timeout_s", 10.0))
+        self.max_results: int = int(search_cfg.get("max_results", 5))
+
+    def _budget(self, plan: dict[str, Any]) -> PlanBudget:
+        max_steps = int((plan.get("budgets") or {}).get("max_steps", self.max_steps))
+        return PlanBudget(
+            soft=BudgetLimits.from_config(self.budget_cfg.get("soft")),
+            hard=BudgetLimits.from_config(
+                self.budget_cfg.get("hard"), max_steps=max_steps
+            ),
+        )
+
+    def _handlers(
+        self,
+        company: str,
+        question: str,
+        board: Blackboard,
+        budget: PlanBudget,
+        assumptions: list[str],
+    ) -> dict[str, StepHandler]:
+        """Step handlers for one run, writing to its own blackboard."""
+
+        def retrieve_rag(step: PlanStep, inputs: dict[str, Any]) -> int:
+            query = str((step.get("inputs") or {}).get("query", ""))
+            budget.charge_tool()
+            result = retrieve(
+                query,
+                top_k=self.top_k,
+                min_score=self.min_score,
+                company=company,
+                config=self.config,
+            )
+            for i in range(len(result)):
+                board.add(
+                    {
+                        "type": "rag",
+                        "text": str(result.record(i).get("text", "")),
+                        "source_uri": result.source_uri(i),
+                        "score": float(result.scores[i]),
+                    }
+                )
+            return len(result)
+
+        def search_web(step: PlanStep, inputs: dict[str, Any]) -> int:
+            query = str((step.get("inputs") or {}).get("query", ""))
+            budget.charge_tool()
+            try:
+                results = web_search(
+                    f"{company} {query}",
+                    timeout_s=self.search_timeout_s,
+                    max_results=self.max_results,
+                    config=self.config,
+                )
+            except SearchError as e:
+                # The step is optional: synthesis answers from the index alone
+                assumptions.append(f"Web search failed: {e}")
+                raise
+            for r in results:
+                board.add(
+                    {
+                        "type": "web",
+                        "text": r["snippet"],
+                        "source_uri": r["url"],
+                        "score": None,
+                    }
+                )
+            return len(results)
+
+        def synthesize(step: PlanStep, inputs: dict[str, Any]) -> dict[str, Any]:
+            # Snapshot: abandoned steps may still add evidence in the background
+            evidence = board.all()
+            context = "\n\n".join(
+                f"[{n}] {e['source_uri']}\n{e['text']}"
+                for n, e in enumerate(evidence, start=1)
+            )
+            # What a model prompt over this evidence would cost
+            prompt_tokens = estimate_tokens(f"{company}\n{question}\n\n{context}")
+            budget.reserve_tokens(prompt_tokens)
+            budget.charge_tokens(prompt_tokens)
+            rag = sum(1 for e in evidence if e["type"] == "rag")
+            answer = (
+                f"[V004] Planned answer about {company}: {len(evidence)} evidence"
+                f" items ({rag} indexed, {len(evidence) - rag} web)"
+            )
+            return {
+                "answer": answer,
+                "citations": list(dict.fromkeys(e["source_uri"] for e in evidence)),
+            }
+
+        return {
+            "retrieve_rag": retrieve_rag,
+            "search_web": search_web,
+            "synthesize": synthesize,
+        }
 
     def run(self, company: str, question: str) -> AgentResult:
-        answer = (
-            f"[V004] Planned answer about {company}: {{execution trace + synthesis}}"
+        plan = make_plan(
+            question, max_steps=self.max_steps, max_questions=self.max_user_questions
         )
+        board = Blackboard()
+        budget = self._budget(plan)
         assumptions = ["Assumed fiscal year = calendar year"]
+        execution = asyncio.run(
+            run_plan(
+                plan,
+                self._handlers(company, question, board, budget, assumptions),
+                max_parallel_tasks=self.max_parallel_tasks,
+                budget=budget,
+            )
+        )
+        synthesis = next(
+            (s for s in execution.steps.values() if s.type == "synthesize"), None
+        )
+        if synthesis is None or synthesis.status != OK:
+            if budget.stop_reason:
+                answer = (
+                    f"[V004] Budget exceeded for {company}: "
+                    f"{budget.stop_reason.removeprefix('hard:')}"
+                )
+            else:
+                failed = [s for s in execution.steps.values() if s.error]
+                answer = f"[V004] Plan failed for {company}: " + (
+                    f"{failed[0].id} ({failed[0].type}): {failed[0].error}"
+                    if failed
+                    else "no synthesis step"
+                )
+            return AgentResult(
+                answer=answer,
+                assumptions=assumptions,
+                trace=execution.summary(),
+                budget=execution.budget,
+            )
+
+        if budget.stop_reason:
+            assumptions.append(
+                "Answered from partial evidence: budget limit "
+                f"{budget.stop_reason.removeprefix('soft:')} reached"
+            )
         return AgentResult(
-            answer=answer, citations=[], assumptions=assumptions, trace_id="trace-0001"
+            answer=synthesis.output["answer"],
+            citations=synthesis.output["citations"],
+            assumptions=assumptions,
+            trace_id="trace-0001",
+            trace=execution.summary(),
+            budget=execution.budget,
         )
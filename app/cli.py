@@ -12,8 +12,15 @@ from app.agents.v002_research import AgentV002
 from app.agents.v003_rag import AgentV003
 from app.agents.v004_deep_planner import AgentV004
 from app.config import load_config
-from app.evaluation.runner import run_evaluation, run_evaluation_on_combined_datasets
+from app.evaluation.retrieval_bench import run_retrieval_benchmark
+from app.evaluation.runner import (
+    run_evaluation,
+    run_evaluation_on_combined_datasets,
+    warm_query_embeddings,
+)
 from app.logging.setup import setup_logging
+from app.search.cassette import SEARCH_MODES
+from app.tools.ingestion import ingest_from_config
 
 AGENT_BY_VERSION = {
     "v001": AgentV001,
@@ -47,6 +54,14 @@ def parse_args() -> argparse.Namespace:
         action="store_true",
         help="Run evaluation on combined datasets (original + transformed)",
     )
+    parser.add_argument(
+        "--bench-retrieval",
+        action="store_true",
+        help="Benchmark retrieval quality and latency on the QA datasets (V003)",
+    )
+    parser.add_argument(
+        "--bench-output", type=str, default="", help="Benchmark JSON report path"
+    )
     parser.add_argument(
         "--eval-profile",
         type=str,
@@ -73,6 +88,14 @@ def parse_args() -> argparse.Namespace:
         "--judge-temperature", type=float, default=0.0, help="Judge model temperature"
     )
     parser.add_argument("--steps", type=int, default=8, help="Default steps (V002)")
+    parser.add_argument(
+        "--search-mode",
+        type=str,
+        default="",
+        choices=SEARCH_MODES,
+        help="Web search and page fetches (V002): live, or record to / replay "
+        "from the cassette in search.cassette (default: search.mode)",
+    )
     parser.add_argument("--run-name", type=str, default="", help="MLflow run name")
     parser.add_argument("--profile", type=str, default=os.getenv("ADK_PROFILE", "dev"))
 
@@ -87,9 +110,26 @@ def parse_args() -> argparse.Namespace:
     )
     parser.add_argument("--explain-plan", action="store_true")
 
+    # Ingestion knobs (V003)
+    parser.add_argument(
+        "--source-dir",
+        type=str,
+        default="",
+        help="Source documents to ingest (default: data/sources/<company>)",
+    )
+    parser.add_argument("--chunk-size", type=int, default=None)
+    parser.add_argument("--chunk-overlap", type=int, default=None)
+    parser.add_argument("--index-version", type=str, default="")
+
     # Retriever knobs (V003)
     parser.add_argument("--retriever.top_k", type=int, default=8)
     parser.add_argument("--retriever.min_score", type=float, default=0.3)
+    parser.add_argument(
+        "--warm-embeddings",
+        action="store_true",
+        help="Embed the eval dataset questions into the query-embedding table "
+        "before answering (evaluation runs always do)",
+    )
 
     # Simple override mechanism: --set key=value pairs
     parser.add_argument(
@@ -185,11 +225,58 @@ def main() -> int:
     args = parse_args()
     overrides = parse_overrides(args.set)
     cfg = load_config(args.version, args.profile, overrides)
+    if args.search_mode:
+        cfg["search"] = {**(cfg.get("search", {}) or {}), "mode": args.search_mode}
     setup_logging(cfg.get("log_level", "INFO"))
 
-    # Mode dispatch (stubs for now)
     if args.ingest:
-        print("[INGEST] RAG ingestion requested. Implement in app.tools.ingestion.")
+        # Ingestion always uses the V003 (RAG) settings
+        ingest_cfg = (
+            cfg
+            if args.version == "v003"
+            else load_config("v003", args.profile, overrides)
+        )
+        chunking = dict(ingest_cfg.get("chunking", {}) or {})
+        if args.chunk_size is not None:
+            chunking["size"] = args.chunk_size
+        if args.chunk_overlap is not None:
+            chunking["overlap"] = args.chunk_overlap
+        ingest_cfg["chunking"] = chunking
+        if args.index_version:
+            ingest_cfg["index"] = {
+                **(ingest_cfg.get("index", {}) or {}),
+                "version": args.index_version,
+            }
+
+        reports = ingest_from_config(
+            ingest_cfg, company=args.company, source_dir=args.source_dir
+        )
+        if not reports:
+            print("[INGEST] No company sources found.", file=sys.stderr)
+            return 1
+        for report in reports:
+            print(f"[INGEST] {report.summary()}")
+        return 0
+
+    if args.bench_retrieval:
+        bench_cfg = (
+            cfg
+            if args.version == "v003"
+            else load_config("v003", args.profile, overrides)
+        )
+        report = run_retrieval_benchmark(
+            bench_cfg,
+            datasets=[Path(args.dataset)] if args.dataset else None,
+            output=Path(args.bench_output) if args.bench_output else None,
+        )
+        quality = report["quality"]
+        latency = report["latency_ms"]
+        print(
+            f"[BENCH] {quality['queries']} queries: "
+            + ", ".join(f"{k} {v:.3f}" for k, v in quality.items() if k != "queries")
+            + f", p50 {latency['p50']:.2f}ms p95 {latency['p95']:.2f}ms"
+            f" p99 {latency['p99']:.2f}ms, build {report['build_s']:.1f}s"
+        )
         return 0
 
     if args.eval:
@@ -226,6 +313,12 @@ def main() -> int:
         if args.run_name:
             eval_config["mlflow"]["run_name"] = args.run_name
 
+        if args.search_mode:
+            eval_config["search"] = {
+                **(eval_config.get("search", {}) or {}),
+                "mode": args.search_mode,
+            }
+
         # Determine which evaluation function to call
         if eval_config["datasets"]["use_combined"]:
             run_evaluation_on_combined_datasets(
@@ -256,6 +349,8 @@ def main() -> int:
         return 1
 
     agent = agent_cls(cfg)
+    if args.version == "v003" and args.warm_embeddings:
+        warm_query_embeddings(cfg)
     result: AgentResult = agent.run(company=args.company, question=args.question)
 
     print("\n=== Answer ===")
@@ -0,0 +1,351 @@
+"""Retrieval quality and latency benchmark over the company QA datasets.
+
+The QA datasets carry no source documents, so a corpus is synthesised from
+them: every expected answer becomes a fact paragraph in one of its company's
+documents, surrounded by filler paragraphs and by facts about other companies
+(hard negatives). The character span of each fact is recorded, so a retrieved
+chunk counts as relevant when it covers most of its question's fact.
+
+Indexes are built with the regular ingestion pipeline, then every question is
+replayed through `retrieve`. The report (recall@k, MRR, query latency
+percentiles, build time) is written as JSON together with the settings that
+produced it, so runs across backends and parameters can be compared directly.
+"""
+
+from __future__ import annotations
+
+import csv
+import json
+import logging
+import random
+import shutil
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+from app.evaluation.runner import (
+    ORIGINAL_DATASET_PATH,
+    TRANSFORMED_DATASET_PATH,
+    read_json_objects,
+)
+from app.retrieval.index_cache import default_index_cache, get_index_cache
+from app.retrieval.layout import company_slug
+from app.tools.ingestion import ingest_company
+from app.tools.retriever import RetrievalResult, retrieve, retrieve_many
+
+logger = logging.getLogger(__name__)
+
+COMPANIES_CSV_PATH = (
+    Path(__file__).parent.parent.parent
+    / "data"
+    / "datasets"
+    / "external"
+    / "companies-2023-q4-sm.csv"
+)
+
+_FILLER = [
+    "The board reviewed the quarterly operating plan and approved the agenda.",
+    "Management continues to monitor macroeconomic conditions and input costs.",
+    "This section summarises general corporate information for reference.",
+    "Forward-looking statements are subject to risks and uncertainties.",
+    "Employees completed the annual compliance and security training.",
+    "The company maintains policies on data privacy and responsible sourcing.",
+    "Historical figures are unaudited and may be revised in later filings.",
+    "Further details are available from the investor relations office.",
+]
+
+# A retrieved chunk is relevant if it covers at least this share of the fact
+_MIN_FACT_COVERAGE = 0.5
+
+
+@dataclass
+class BenchQuestion:
+    dataset: str
+    item_id: str
+    company: str
+    question: str
+    answer: str
+    doc: str = ""
+    fact_start: int = 0
+    fact_end: int = 0
+
+
+def load_questions(datasets: list[Path]) -> list[BenchQuestion]:
+    questions = []
+    for path in datasets:
+        if not path.exists():
+            logger.warning(f"Dataset not found: {path}")
+            continue
+        for raw in read_json_objects(path):
+            if raw.get("company") and raw.get("question"):
+                questions.append(
+                    BenchQuestion(
+                        dataset=path.stem,
+                        item_id=str(raw.get("id", "")),
+                        company=str(raw["company"]),
+                        question=str(raw["question"]),
+                        answer=str(raw.get("expected_answer", "")),
+                    )
+                )
+    return questions
+
+
+def _csv_profiles(path: Path) -> dict[str, str]:
+    """One profile paragraph per company in the companies CSV, if present."""
+    if not path.exists():
+        return {}
+    profiles = {}
+    with path.open(encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            name = row.get("name")
+            if name:
+                fields = ", ".join(
+                    f"{k}: {v}" for k, v in row.items() if k != "name" and v
+                )
+                profiles[name] = f"{name} company profile. {fields}."
+    return profiles
+
+
+def build_corpus(
+    questions: list[BenchQuestion],
+    source_root: Path,
+    *,
+    docs_per_company: int = 3,
+    filler_paragraphs: int = 2,
+    hard_negatives: int = 2,
+    seed: int = 13,
+) -> dict[str, int]:
+    """Write synthetic source documents and set each question's fact span.
+
+    Returns:
+        dict[str, int]: Corpus size (companies, documents, bytes).
+    """
+    rng = random.Random(seed)
+    profiles = _csv_profiles(COMPANIES_CSV_PATH)
+    by_company: dict[str, list[BenchQuestion]] = defaultdict(list)
+    for q in questions:
+        by_company[q.company].append(q)
+    all_facts = [q.answer for q in questions]
+
+    shutil.rmtree(source_root, ignore_errors=True)
+    documents = 0
+    size = 0
+    for company, items in by_company.items():
+        company_dir = source_root / company_slug(company)
+        company_dir.mkdir(parents=True, exist_ok=True)
+        order = list(items)
+        rng.shuffle(order)
+        n_docs = max(1, min(docs_per_company, len(order)))
+        for d in range(n_docs):
+            rel = f"doc-{d + 1}.md"
+            parts: list[str] = [f"# {company}"]
+            if d == 0 and company in profiles:
+                parts.append(profiles[company])
+            offset = len("\n\n".join(parts)) + 2
+            for q in order[d::n_docs]:
+                fact = q.answer
+                noise = rng.sample(_FILLER, min(filler_paragraphs, len(_FILLER)))
+                noise += [
+                    f
+                    for f in rng.sample(all_facts, min(hard_negatives, len(all_facts)))
+                    if f != fact
+                ]
+                rng.shuffle(noise)
+                for paragraph in noise:
+                    parts.append(paragraph)
+                    offset += len(paragraph) + 2
+                parts.append(fact)
+                q.doc, q.fact_start, q.fact_end = rel, offset, offset + len(fact)
+                offset += len(fact) + 2
+            text = "\n\n".join(parts)
+            (company_dir / rel).write_text(text, encoding="utf-8")
+            documents += 1
+            size += len(text)
+    return {"companies": len(by_company), "documents": documents, "bytes": size}
+
+
+def _first_relevant(result: RetrievalResult, q: BenchQuestion) -> int | None:
+    """1-based rank of the first chunk covering `q`'s fact, if any."""
+    need = _MIN_FACT_COVERAGE * (q.fact_end - q.fact_start)
+    for i in range(len(result)):
+        record = result.record(i)
+        if record.get("doc") != q.doc:
+            continue
+        overlap = min(q.fact_end, int(record.get("end", 0))) - max(
+            q.fact_start, int(record.get("start", 0))
+        )
+        if overlap >= need:
+            return i + 1
+    return None
+
+
+def _quality(ranks: list[int | None], k: int) -> dict[str, float]:
+    n = max(1, len(ranks))
+    quality: dict[str, float] = {"queries": len(ranks)}
+    for cutoff in sorted({c for c in (1, 3, 5) if c < k} | {k}):
+        quality[f"recall@{cutoff}"] = (
+            sum(1 for r in ranks if r is not None and r <= cutoff) / n
+        )
+    quality["mrr"] = sum(1.0 / r for r in ranks if r is not None) / n
+    return quality
+
+
+def _latency(samples_s: list[float]) -> dict[str, float]:
+    if not samples_s:
+        return {}
+    ms = np.asarray(samples_s) * 1000.0
+    return {
+        "mean": float(ms.mean()),
+        "p50": float(np.percentile(ms, 50)),
+        "p95": float(np.percentile(ms, 95)),
+        "p99": float(np.percentile(ms, 99)),
+    }
+
+
+def run_retrieval_benchmark(
+    config: dict[str, Any],
+    *,
+    datasets: list[Path] | None = None,
+    output: Path | None = None,
+) -> dict[str, Any]:
+    """Build the synthetic corpus and indexes, replay the questions, report.
+
+    Settings come from the V003 `benchmark` config section (work dir,
+    embedding model, top_k, corpus shape) plus the `retriever`, `index` and
+    `chunking` sections under test.
+
+    Args:
+        config: App config (V003).
+        datasets: QA datasets to replay; defaults to the original and
+            transformed company datasets.
+        output: JSON report path; defaults to `<benchmark.dir>/report.json`.
+
+    Returns:
+        dict[str, Any]: The report written to `output`.
+    """
+    bench_cfg = dict(config.get("benchmark", {}) or {})
+    work_dir = Path(str(bench_cfg.get("dir", "data/benchmarks/retrieval")))
+    index_root = work_dir / "indexes"
+    top_k = int(bench_cfg.get("top_k", 10))
+    index_cfg = {**(config.get("index", {}) or {}), "dir": str(index_root)}
+    retriever_cfg = {
+        **(config.get("retriever", {}) or {}),
+        # Every replayed query must hit the index, not a cached result
+        "cache": {"enabled": False},
+    }
+    embedding_model = str(
+        bench_cfg.get("embedding_model")
+        or (config.get("embedding", {}) or {}).get("model", "text-embedding-004")
+    )
+    chunk_cfg = dict(config.get("chunking", {}) or {})
+    run_cfg = {
+        **config,
+        "index": index_cfg,
+        "retriever": retriever_cfg,
+        "embedding": {"model": embedding_model},
+    }
+    existing = default_index_cache()
+    if existing is not None and existing.index_root != index_root:
+        raise RuntimeError(
+            f"Index cache already serves {existing.index_root}; "
+            "run the benchmark in its own process"
+        )
+
+    questions = load_questions(
+        datasets or [ORIGINAL_DATASET_PATH, TRANSFORMED_DATASET_PATH]
+    )
+    max_companies = int(bench_cfg.get("max_companies", 0))
+    if max_companies > 0:
+        keep = list(dict.fromkeys(q.company for q in questions))[:max_companies]
+        questions = [q for q in questions if q.company in set(keep)]
+    if not questions:
+        raise FileNotFoundError("No benchmark questions found in the datasets")
+
+    corpus = build_corpus(
+        questions,
+        work_dir / "sources",
+        docs_per_company=int(bench_cfg.get("docs_per_company", 3)),
+        filler_paragraphs=int(bench_cfg.get("filler_paragraphs", 2)),
+        hard_negatives=int(bench_cfg.get("hard_negatives", 2)),
+    )
+
+    shutil.rmtree(index_root, ignore_errors=True)
+    companies = list(dict.fromkeys(q.company for q in questions))
+    t0 = time.perf_counter()
+    chunks = 0
+    for company in companies:
+        report = ingest_company(
+            company,
+            work_dir / "sources" / company_slug(company),
+            index_root,
+            embedding_model=embedding_model,
+            chunk_size=int(chunk_cfg.get("size", 800)),
+            chunk_overlap=int(chunk_cfg.get("overlap", 150)),
+            index_version=str(index_cfg.get("version", "v1")),
+            quantization=str(index_cfg.get("quantization", "none")),
+            pq_subvectors=int(index_cfg.get("pq_subvectors", 16)),
+        )
+        chunks += report.chunks_embedded
+    build_s = time.perf_counter() - t0
+
+    cache = get_index_cache(run_cfg)
+    index_bytes = 0
+    for company in companies:
+        index_bytes += cache.get(company, str(index_cfg.get("version", "v1"))).nbytes
+
+    ranks: dict[str, list[int | None]] = defaultdict(list)
+    latencies: list[float] = []
+    min_score = float(retriever_cfg.get("min_score", 0.3))
+    for q in questions:
+        t = time.perf_counter()
+        result = retrieve(
+            q.question,
+            top_k=top_k,
+            min_score=min_score,
+            company=q.company,
+            config=run_cfg,
+        )
+        latencies.append(time.perf_counter() - t)
+        ranks[q.dataset].append(_first_relevant(result, q))
+
+    by_company: dict[str, list[str]] = defaultdict(list)
+    for q in questions:
+        by_company[q.company].append(q.question)
+    t = time.perf_counter()
+    for company, texts in by_company.items():
+        retrieve_many(
+            texts, top_k=top_k, min_score=min_score, company=company, config=run_cfg
+        )
+    batch_s = time.perf_counter() - t
+
+    all_ranks = [r for dataset_ranks in ranks.values() for r in dataset_ranks]
+    report_data: dict[str, Any] = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "settings": {
+            "top_k": top_k,
+            "embedding_model": embedding_model,
+            "retriever": {k: v for k, v in retriever_cfg.items() if k != "cache"},
+            "index": {k: v for k, v in index_cfg.items() if k != "dir"},
+            "chunking": chunk_cfg,
+            "benchmark": bench_cfg,
+        },
+        "corpus": {**corpus, "chunks": chunks, "index_bytes": index_bytes},
+        "build_s": build_s,
+        "quality": _quality(all_ranks, top_k),
+        "quality_by_dataset": {
+            name: _quality(dataset_ranks, top_k)
+            for name, dataset_ranks in ranks.items()
+        },
+        "latency_ms": _latency(latencies),
+        "batch_qps": len(questions) / batch_s if batch_s > 0 else 0.0,
+    }
+
+    output = output or work_dir / "report.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report_data, indent=2), encoding="utf-8")
+    logger.info(f"Retrieval benchmark report written to {output}")
+    return report_data
@@ -15,6 +15,9 @@ from app.agents.v001_minimal import AgentV001
 from app.agents.v002_research import AgentV002
 from app.agents.v003_rag import AgentV003
 from app.agents.v004_deep_planner import AgentV004
+from app.retrieval.embedding_table import get_embedding_table
+from app.tools.retriever import retrieval_stats
+from app.tools.search import search_stats
 
 logger = logging.getLogger(__name__)
 
@@ -54,7 +57,7 @@ class EvalItem:
 _TRAILING_COMMA_BEFORE_BRACE = re.compile(r",\s*}\s*$")
 
 
-def _read_json_objects(path: Path) -> Iterable[dict[str, Any]]:
+def read_json_objects(path: Path) -> Iterable[dict[str, Any]]:
     """Read a file containing one JSON object after another, possibly with trailing commas.
 
     This is tolerant of the provided dataset format, which is not strict JSONL.
@@ -118,7 +121,7 @@ def _load_eval_items(dataset: Path | None = None) -> list[EvalItem]:
 
     if dataset is not None:
         # Load from specific dataset if provided
-        for raw in _read_json_objects(dataset):
+        for raw in read_json_objects(dataset):
             items.append(
                 EvalItem(
                     item_id=str(raw.get("id", "")),
@@ -134,7 +137,7 @@ def _load_eval_items(dataset: Path | None = None) -> list[EvalItem]:
         for dataset_path in datasets_to_load:
             if dataset_path.exists():
                 logger.info(f"Loading dataset: {dataset_path}")
-                for raw in _read_json_objects(dataset_path):
+                for raw in read_json_objects(dataset_path):
                     items.append(
                         EvalItem(
                             item_id=str(raw.get("id", "")),
@@ -163,7 +166,7 @@ def get_dataset_stats() -> dict[str, Any]:
 
     # Check original dataset
     if ORIGINAL_DATASET_PATH.exists():
-        original_items = list(_read_json_objects(ORIGINAL_DATASET_PATH))
+        original_items = list(read_json_objects(ORIGINAL_DATASET_PATH))
         stats["original_dataset"] = {
             "path": str(ORIGINAL_DATASET_PATH),
             "item_count": len(original_items),
@@ -183,7 +186,7 @@ def get_dataset_stats() -> dict[str, Any]:
 
     # Check transformed dataset
     if TRANSFORMED_DATASET_PATH.exists():
-        transformed_items = list(_read_json_objects(TRANSFORMED_DATASET_PATH))
+        transformed_items = list(read_json_objects(TRANSFORMED_DATASET_PATH))
         stats["transformed_dataset"] = {
             "path": str(TRANSFORMED_DATASET_PATH),
             "item_count": len(transformed_items),
@@ -203,8 +206,8 @@ def get_dataset_stats() -> dict[str, Any]:
 
     # Combined stats
     if ORIGINAL_DATASET_PATH.exists() and TRANSFORMED_DATASET_PATH.exists():
-        combined_items = list(_read_json_objects(ORIGINAL_DATASET_PATH)) + list(
-            _read_json_objects(TRANSFORMED_DATASET_PATH)
+        combined_items = list(read_json_objects(ORIGINAL_DATASET_PATH)) + list(
+            read_json_objects(TRANSFORMED_DATASET_PATH)
         )
         stats["combined"] = {
             "total_items": len(combined_items),
@@ -238,6 +241,34 @@ def run_evaluation_on_combined_datasets(
     run_evaluation(dataset_path=None, version=version, config=config, run_name=run_name)
 
 
+def warm_query_embeddings(
+    config: dict[str, Any], items: list[EvalItem] | None = None
+) -> int:
+    """Warm the V003 query-embedding table with the eval dataset questions.
+
+    Args:
+        config: App config; supplies `retriever.embedding_table` and the
+            `embedding` model.
+        items: Items whose questions to embed; defaults to both hardcoded
+            datasets.
+
+    Returns:
+        int: Number of questions embedded; 0 if the table is disabled, already
+            warm, or the embedding call failed.
+    """
+    table = get_embedding_table(config)
+    if table is None:
+        return 0
+    model = str((config.get("embedding", {}) or {}).get("model", "text-embedding-004"))
+    if items is None:
+        items = _load_eval_items()
+    try:
+        return table.warm(model, [item.question for item in items])
+    except Exception as exc:
+        logger.warning(f"Query embedding warm-up skipped: {exc}")
+        return 0
+
+
 def _get_agent_prompt(version: str) -> str:
     """Get the agent prompt for the given version.
 
@@ -292,6 +323,8 @@ def _eval_one(
             "num_citations": len(agent_result.citations or []),
             "status": "success",
             "judge": judge,
+            "trace": agent_result.trace,
+            "budget": agent_result.budget,
         }
     except Exception as e:
         return {
@@ -452,6 +485,172 @@ def _compute_operational_metrics(results: list[dict[str, Any]]) -> dict[str, flo
     }
 
 
+def _compute_search_metrics(
+    before: dict[str, float], after: dict[str, float]
+) -> dict[str, float]:
+    """Compute search cache, cassette and HTTP scheduler metrics for one run.
+
+    Args:
+        before: `search_stats()` taken before the run.
+        after: `search_stats()` taken after the run.
+
+    Returns:
+        dict[str, float]: `search.*` metrics, or an empty dict if the run did
+            no web search.
+    """
+    counters = (
+        "hits",
+        "disk_hits",
+        "stale_hits",
+        "misses",
+        "refreshes",
+        "refresh_errors",
+        # http_scheduler.*
+        "requests",
+        "waited",
+        "wait_s",
+        "backoffs",
+        # cassette.* (also hits and misses)
+        "recorded",
+    )
+    delta = {
+        k: after[k] - before.get(k, 0.0)
+        for k in after
+        if k.rsplit(".", 1)[-1] in counters
+    }
+    hits = delta.get("search_cache.hits", 0.0) + delta.get(
+        "search_cache.disk_hits", 0.0
+    )
+    stale = delta.get("search_cache.stale_hits", 0.0)
+    lookups = hits + stale + delta.get("search_cache.misses", 0.0)
+    # Recording and replaying bypass the cache
+    replayed = any(v for k, v in delta.items() if k.startswith("cassette."))
+    if not lookups and not replayed:
+        return {}
+
+    metrics = {f"search.{k}": v for k, v in delta.items()}
+    if lookups:
+        metrics["search.cache.hit_rate"] = hits / lookups
+        metrics["search.cache.stale_rate"] = stale / lookups
+        metrics["search.cache.miss_rate"] = (
+            delta.get("search_cache.misses", 0.0) / lookups
+        )
+    return metrics
+
+
+def _compute_research_metrics(results: list[dict[str, Any]]) -> dict[str, float]:
+    """Compute research latency metrics from per-item agent traces.
+
+    Args:
+        results: List of evaluation result dictionaries.
+
+    Returns:
+        dict[str, float]: `research.*` means of the numeric trace values, the
+            share of items per stop reason, and p50/p95 of the end-to-end
+            latency, or an empty dict if no item reported a search trace.
+    """
+    traces = [r["trace"] for r in results if "search_steps" in (r.get("trace") or {})]
+    if not traces:
+        return {}
+
+    metrics: dict[str, float] = {}
+    # Early returns (no sources, fetching off) leave keys out of some traces
+    for key in dict.fromkeys(k for t in traces for k in t):
+        values = [
+            float(t[key])
+            for t in traces
+            if isinstance(t.get(key), int | float) and not isinstance(t[key], bool)
+        ]
+        if values:
+            metrics[f"research.{key}.mean"] = sum(values) / len(values)
+    reasons = [str(t["stop_reason"]) for t in traces if t.get("stop_reason")]
+    for reason in sorted(set(reasons)):
+        metrics[f"research.stop_reason.{reason}"] = reasons.count(reason) / len(traces)
+    latencies = sorted(float(t.get("latency_s", 0.0)) for t in traces)
+    for q in (50, 95):
+        idx = min(len(latencies) - 1, int(q / 100 * len(latencies)))
+        metrics[f"research.latency_s.p{q}"] = latencies[idx]
+    return metrics
+
+
+def _compute_budget_metrics(results: list[dict[str, Any]]) -> dict[str, float]:
+    """Compute plan budget metrics from per-item budget usage.
+
+    Args:
+        results: List of evaluation result dictionaries.
+
+    Returns:
+        dict[str, float]: `budget.*` means and maxima of the numeric usage
+            values and the share of items stopped by each limit, or an empty
+            dict if no item reported a budget.
+    """
+    budgets = [r["budget"] for r in results if r.get("budget")]
+    if not budgets:
+        return {}
+
+    metrics: dict[str, float] = {}
+    for key in dict.fromkeys(k for b in budgets for k in b):
+        values = [
+            float(b[key])
+            for b in budgets
+            if isinstance(b.get(key), int | float) and not isinstance(b[key], bool)
+        ]
+        if values:
+            metrics[f"budget.{key}.mean"] = sum(values) / len(values)
+            metrics[f"budget.{key}.max"] = max(values)
+    reasons = [str(b["stop_reason"]) for b in budgets if b.get("stop_reason")]
+    for reason in sorted(set(reasons)):
+        metrics[f"budget.stop_reason.{reason}"] = reasons.count(reason) / len(budgets)
+    return metrics
+
+
+def _compute_retrieval_metrics(
+    before: dict[str, float], after: dict[str, float]
+) -> dict[str, float]:
+    """Compute retrieval cache metrics for one run from cumulative counters.
+
+    Args:
+        before: `retrieval_stats()` taken before the run.
+        after: `retrieval_stats()` taken after the run.
+
+    Returns:
+        dict[str, float]: `retrieval.*` metrics, or an empty dict if the run
+            did no retrieval.
+    """
+    counters = ("hits", "disk_hits", "misses", "opens", "evictions")
+    delta = {
+        k: after[k] - before.get(k, 0.0)
+        for k in after
+        if k.rsplit(".", 1)[-1] in counters
+    }
+    lookups = sum(v for k, v in delta.items() if k.endswith(("hits", "misses")))
+    if not lookups:
+        return {}
+
+    metrics = {f"retrieval.{k}": v for k, v in delta.items()}
+    q_hits = delta.get("query_cache.hits", 0.0) + delta.get(
+        "query_cache.disk_hits", 0.0
+    )
+    q_lookups = q_hits + delta.get("query_cache.misses", 0.0)
+    metrics["retrieval.query_cache.hit_rate"] = q_hits / q_lookups if q_lookups else 0.0
+    i_lookups = delta.get("index_cache.hits", 0.0) + delta.get(
+        "index_cache.misses", 0.0
+    )
+    metrics["retrieval.index_cache.hit_rate"] = (
+        delta.get("index_cache.hits", 0.0) / i_lookups if i_lookups else 0.0
+    )
+    t_lookups = delta.get("embedding_table.hits", 0.0) + delta.get(
+        "embedding_table.misses", 0.0
+    )
+    metrics["retrieval.embedding_table.hit_rate"] = (
+        delta.get("embedding_table.hits", 0.0) / t_lookups if t_lookups else 0.0
+    )
+    metrics["retrieval.index_cache.resident_bytes"] = after.get(
+        "index_cache.resident_bytes", 0.0
+    )
+    return metrics
+
+
 def _build_genai_eval_df(results: list[dict[str, Any]]):
     """Build a pandas DataFrame for MLflow GenAI evaluation.
 
@@ -513,6 +712,11 @@ def _log_mlflow(
         mlflow.log_metric("successful_items", float(metrics["successful_items"]))  # type: ignore[attr-defined]
         # LLM judge metric
         mlflow.log_metric("judge_pass_rate", float(metrics.get("judge_pass_rate", 0.0)))  # type: ignore[attr-defined]
+        # Retrieval (V003), search cache and research latency (V002) and
+        # plan budget (V004) metrics
+        for key, value in metrics.items():
+            if key.startswith(("retrieval.", "search.", "research.", "budget.")):
+                mlflow.log_metric(key, float(value))  # type: ignore[attr-defined]
 
         # GenAI evaluation (heuristic metrics, optional judge if configured)
         try:
@@ -636,6 +840,10 @@ def run_evaluation(
             mlflow = None
 
     agent = agent_cls(config)
+    if version == "v003":
+        warmed = warm_query_embeddings(config, items)
+        if warmed:
+            logger.info(f"Embedded {warmed} new questions into the embedding table")
     logger.info(f"Processing {len(items)} items with {version} agent...")
 
     max_workers = min(8, len(items))
@@ -643,10 +851,16 @@ def run_evaluation(
     config = {**config, "max_workers": max_workers}
 
     judge_cfg = dict(config.get("judge", {})) if isinstance(config, dict) else {}
+    retrieval_before = retrieval_stats()
+    search_before = search_stats()
     results = _evaluate_in_parallel(agent, items, max_workers, judge_cfg)
 
     # Calculate basic metrics
     metrics = _compute_operational_metrics(results)
+    metrics.update(_compute_retrieval_metrics(retrieval_before, retrieval_stats()))
+    metrics.update(_compute_search_metrics(search_before, search_stats()))
+    metrics.update(_compute_research_metrics(results))
+    metrics.update(_compute_budget_metrics(results))
 
     # Log to MLflow
     if mlflow is not None:
@@ -663,6 +877,46 @@ def run_evaluation(
     # Console summary via logging
     logger.info(f"Completed {len(results)} examples")
     logger.info(f"Success rate: {metrics['success_rate']:.1%}")
+    if "retrieval.query_cache.hit_rate" in metrics:
+        logger.info(
+            f"Retrieval cache hit rate: {metrics['retrieval.query_cache.hit_rate']:.1%}"
+        )
+    if "search.cache.hit_rate" in metrics:
+        logger.info(
+            f"Search cache hit rate: {metrics['search.cache.hit_rate']:.1%}"
+            f" (stale {metrics['search.cache.stale_rate']:.1%})"
+        )
+    if metrics.get("search.cassette.misses"):
+        logger.warning(
+            f"Search cassette misses: {int(metrics['search.cassette.misses'])}"
+            " calls were not recorded and failed in replay"
+        )
+    if "research.steps_used.mean" in metrics:
+        logger.info(
+            f"Research steps used: {metrics['research.steps_used.mean']:.1f}"
+            f" of {metrics['research.steps_planned.mean']:.1f} (mean per item)"
+        )
+    if "research.search_critical_path_s.mean" in metrics:
+        logger.info(
+            f"Research search time: {metrics['research.search_critical_path_s.mean']:.2f}s"
+            f" critical path vs {metrics['research.search_sequential_s.mean']:.2f}s"
+            " sequential (mean per item)"
+        )
+    if "budget.steps.mean" in metrics:
+        logger.info(
+            f"Plan budget: {metrics['budget.steps.mean']:.1f} steps,"
+            f" {metrics['budget.tool_calls.mean']:.1f} tool calls,"
+            f" {metrics['budget.tokens.mean']:.0f} tokens,"
+            f" {metrics['budget.elapsed_s.mean']:.2f}s (mean per item),"
+            f" worst {metrics['budget.elapsed_s.max']:.2f}s"
+        )
+    if "research.prune_tokens.mean" in metrics:
+        logger.info(
+            f"Research evidence: {metrics['research.prune_tokens.mean']:.0f}"
+            f" of {metrics['research.prune_tokens_in.mean']:.0f} tokens sent,"
+            f" {metrics['research.prune_sources_kept.mean']:.1f} sources kept"
+            " (mean per item)"
+        )
     successes = int(metrics["successful_items"]) if metrics else 0
     if successes:
         logger.info(f"Successful evaluations: {successes}")
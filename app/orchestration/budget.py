@@ -0,0 +1,177 @@
+"""Budgets for V004 plan runs: what one run consumes, and its limits.
+
+`PlanBudget` counts the steps started, tool calls, model tokens (prompt and
+output) and elapsed time of one plan run. It checks them against two sets of
+`BudgetLimits`, where 0 means no limit:
+
+- soft: once reached, the executor starts no further research steps,
+  abandons running ones, and goes straight to synthesis with the evidence
+  gathered so far. Only limits on what research steps consume can take
+  effect here: tokens charged by the synthesis step itself come too late;
+- hard: bound the run. Tool calls and model prompts over the limit are
+  refused up front (`charge_tool` and `reserve_tokens` raise
+  `BudgetExceeded`). Once the step count, tokens or elapsed time is spent,
+  the executor stops the run without synthesis.
+"""
+
+from __future__ import annotations
+
+import threading
+from dataclasses import dataclass
+from time import perf_counter
+from typing import Any
+
+
+class BudgetExceeded(RuntimeError):
+    """A call refused because it would exceed a hard limit."""
+
+    def __init__(self, limit: str, message: str):
+        super().__init__(message)
+        self.limit = limit
+
+
+@dataclass
+class BudgetLimits:
+    max_steps: int = 0
+    max_tool_calls: int = 0
+    max_tokens: int = 0
+    max_elapsed_s: float = 0.0
+
+    @classmethod
+    def from_config(
+        cls, cfg: dict[str, Any] | None, *, max_steps: int = 0
+    ) -> BudgetLimits:
+        """Limits from a `planner.budget.soft`/`hard` section.
+
+        `max_steps` applies when the section doesn't set one.
+        """
+        cfg = dict(cfg or {})
+        return cls(
+            max_steps=int(cfg.get("max_steps", max_steps)),
+            max_tool_calls=int(cfg.get("max_tool_calls", 0)),
+            max_tokens=int(cfg.get("max_tokens", 0)),
+            max_elapsed_s=float(cfg.get("max_elapsed_s", 0.0)),
+        )
+
+
+class PlanBudget:
+    """Consumption of one plan run against its soft and hard limits.
+
+    Shared by the executor and the step handlers, which may run in parallel
+    threads.
+    """
+
+    def __init__(
+        self, soft: BudgetLimits | None = None, hard: BudgetLimits | None = None
+    ):
+        self.soft = soft or BudgetLimits()
+        self.hard = hard or BudgetLimits()
+        self._lock = threading.Lock()
+        self.steps = 0
+        self.tool_calls = 0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+        self.started = perf_counter()
+        self.finished: float | None = None
+        # Hard limit a call was refused for
+        self.refused = ""
+        # `soft:<limit>` or `hard:<limit>` once a limit stopped the research
+        self.stop_reason = ""
+
+    @property
+    def tokens(self) -> int:
+        return self.prompt_tokens + self.output_tokens
+
+    @property
+    def elapsed_s(self) -> float:
+        return (self.finished or perf_counter()) - self.started
+
+    def start(self) -> None:
+        """Start the clock; called by the executor as the plan starts."""
+        self.started = perf_counter()
+        self.finished = None
+
+    def finish(self) -> None:
+        """Stop the clock; called by the executor as the plan ends."""
+        self.finished = perf_counter()
+
+    def can_start(self, limits: BudgetLimits) -> bool:
+        """Whether `limits` allow another step."""
+        return not limits.max_steps or self.steps < limits.max_steps
+
+    def charge_step(self) -> None:
+        with self._lock:
+            self.steps += 1
+
+    def charge_tool(self, n: int = 1) -> None:
+        """Account `n` tool calls about to be made.
+
+        Raises:
+            BudgetExceeded: If they would exceed the hard limit; nothing is
+                charged.
+        """
+        with self._lock:
+            limit = self.hard.max_tool_calls
+            if limit and self.tool_calls + n > limit:
+                self.refused = self.refused or "max_tool_calls"
+                raise BudgetExceeded(
+                    "max_tool_calls", f"tool call budget of {limit} spent"
+                )
+            self.tool_calls += n
+
+    def reserve_tokens(self, prompt_tokens: int) -> None:
+        """Check a model call's prompt against the hard token limit.
+
+        Raises:
+            BudgetExceeded: If the prompt alone would exceed the limit.
+        """
+        with self._lock:
+            limit = self.hard.max_tokens
+            if limit and self.tokens + prompt_tokens > limit:
+                self.refused = self.refused or "max_tokens"
+                raise BudgetExceeded("max_tokens", f"token budget of {limit} spent")
+
+    def charge_tokens(self, prompt_tokens: int, output_tokens: int = 0) -> None:
+        with self._lock:
+            self.prompt_tokens += prompt_tokens
+            self.output_tokens += output_tokens
+
+    def _reached(self, limits: BudgetLimits, *, strict: bool) -> str:
+        def over(used: float, limit: float) -> bool:
+            return bool(limit) and (used > limit if strict else used >= limit)
+
+        if over(self.tool_calls, limits.max_tool_calls):
+            return "max_tool_calls"
+        if over(self.tokens, limits.max_tokens):
+            return "max_tokens"
+        if limits.max_elapsed_s and self.elapsed_s >= limits.max_elapsed_s:
+            return "max_elapsed_s"
+        return ""
+
+    def soft_limit(self) -> str:
+        """Name of the first soft limit reached, or ""."""
+        return self._reached(self.soft, strict=False)
+
+    def hard_limit(self) -> str:
+        """Name of the first hard limit exceeded or refused, or ""."""
+        return self.refused or self._reached(self.hard, strict=True)
+
+    def remaining_s(self, *, soft: bool = True) -> float | None:
+        """Seconds until the next elapsed-time limit, or None without one."""
+        limits = [self.hard.max_elapsed_s]
+        if soft:
+            limits.append(self.soft.max_elapsed_s)
+        deadlines = [limit - self.elapsed_s for limit in limits if limit]
+        return max(0.0, min(deadlines)) if deadlines else None
+
+    def usage(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "steps": self.steps,
+                "tool_calls": self.tool_calls,
+                "prompt_tokens": self.prompt_tokens,
+                "output_tokens": self.output_tokens,
+                "tokens": self.tokens,
+                "elapsed_s": round(self.elapsed_s, 4),
+                "stop_reason": self.stop_reason,
+            }
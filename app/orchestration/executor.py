@@ -1,6 +1,389 @@
+"""Dependency-aware execution of V004 plans.
+
+Each plan step names the steps it needs in `depends_on`; together they form a
+DAG. A step without `depends_on` follows the step before it, so plans
+written as plain sequences run as before. `run_plan` starts every step
+whose dependencies have finished, at most `max_parallel_tasks` at a time,
+on an asyncio loop. Handlers are looked up by step type and get the step and
+the outputs of its dependencies. Coroutine handlers are awaited; blocking
+ones run in worker threads, so independent retrieval and search steps
+overlap.
+
+- A step whose handler raises is `failed`. Every step depending on it,
+  directly or transitively, is `blocked` and never runs. Independent steps
+  carry on.
+- A failed step marked `optional` blocks nothing: its dependents run
+  without its output, and the plan still succeeds.
+- A step type without a handler is `skipped`; its dependents still run.
+
+A `PlanBudget` accounts the run (see `app.orchestration.budget`). Once a soft
+limit is reached, steps not in `degrade_to` (synthesis) are abandoned if
+running (`cancelled`) and never started if pending (`over_budget`), and the
+synthesis steps run with what the finished steps gathered. Once a hard limit
+is hit, every unfinished step is abandoned and the plan stops. Abandoned
+steps run on the plan's own worker threads, which are left to finish in the
+background, so a stop returns at once. A soft limit swaps in a fresh pool of
+threads, so synthesis doesn't queue behind the steps it abandoned.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import inspect
+from collections.abc import Callable, Iterable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from time import perf_counter
 from typing import Any
 
+from app.orchestration.budget import PlanBudget
+from app.orchestration.planner import PlanStep
+
+StepHandler = Callable[[PlanStep, dict[str, Any]], Any]
+
+OK, FAILED, BLOCKED, SKIPPED = "ok", "failed", "blocked", "skipped"
+CANCELLED, OVER_BUDGET = "cancelled", "over_budget"
+
+
+class PlanError(ValueError):
+    """A plan whose steps don't form a valid DAG."""
+
+
+def plan_dependencies(steps: list[PlanStep]) -> dict[str, list[str]]:
+    """Dependencies of each step, by id, in plan order.
+
+    Raises:
+        PlanError: On a duplicate or missing id, an unknown dependency, or a
+            cycle.
+    """
+    deps: dict[str, list[str]] = {}
+    previous: str | None = None
+    for step in steps:
+        sid = str(step.get("id") or "")
+        if not sid:
+            raise PlanError("Plan step without an id")
+        if sid in deps:
+            raise PlanError(f"Duplicate plan step id: {sid}")
+        declared = step.get("depends_on")
+        if declared is None:
+            deps[sid] = [previous] if previous is not None else []
+        else:
+            deps[sid] = list(dict.fromkeys(str(d) for d in declared))
+        previous = sid
+    for sid, needs in deps.items():
+        unknown = [d for d in needs if d not in deps]
+        if unknown:
+            raise PlanError(f"Plan step {sid} depends on unknown steps: {unknown}")
+
+    # Kahn's algorithm: whatever can't be ordered lies on a cycle
+    remaining = {sid: len(needs) for sid, needs in deps.items()}
+    dependents: dict[str, list[str]] = {sid: [] for sid in deps}
+    for sid, needs in deps.items():
+        for d in needs:
+            dependents[d].append(sid)
+    ready = [sid for sid, n in remaining.items() if n == 0]
+    while ready:
+        for d in dependents[ready.pop()]:
+            remaining[d] -= 1
+            if remaining[d] == 0:
+                ready.append(d)
+    cyclic = [sid for sid, n in remaining.items() if n > 0]
+    if cyclic:
+        raise PlanError(f"Plan steps form a cycle: {cyclic}")
+    return deps
+
+
+@dataclass
+class StepResult:
+    """Outcome of one plan step; times are seconds since the plan started."""
+
+    id: str
+    type: str
+    depends_on: list[str] = field(default_factory=list)
+    optional: bool = False
+    status: str = ""
+    output: Any = None
+    error: str = ""
+    start_s: float = 0.0
+    end_s: float = 0.0
+
+    @property
+    def elapsed_s(self) -> float:
+        return self.end_s - self.start_s
+
+    @property
+    def blocking(self) -> bool:
+        """Whether the step's outcome keeps its dependents from running."""
+        return self.status == BLOCKED or (self.status == FAILED and not self.optional)
+
+
+@dataclass
+class PlanExecution:
+    """Per-step results of one plan run, in plan order."""
+
+    steps: dict[str, StepResult] = field(default_factory=dict)
+    # Steps in the order they finished
+    completed: list[str] = field(default_factory=list)
+    elapsed_s: float = 0.0
+    # `PlanBudget.usage()` at the end of the run
+    budget: dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def status(self) -> str:
+        if str(self.budget.get("stop_reason", "")).startswith("hard:"):
+            return OVER_BUDGET
+        return FAILED if any(s.blocking for s in self.steps.values()) else OK
+
+    @property
+    def outputs(self) -> dict[str, Any]:
+        return {sid: s.output for sid, s in self.steps.items() if s.status == OK}
+
+    @property
+    def sequential_s(self) -> float:
+        """Time the steps would have taken one after another."""
+        return sum(s.elapsed_s for s in self.steps.values())
+
+    def summary(self) -> dict[str, Any]:
+        return {
+            "status": self.status,
+            "steps_executed": [
+                sid for sid in self.completed if self.steps[sid].status == OK
+            ],
+            "failed": [s.id for s in self.steps.values() if s.status == FAILED],
+            "blocked": [s.id for s in self.steps.values() if s.status == BLOCKED],
+            "skipped": [s.id for s in self.steps.values() if s.status == SKIPPED],
+            "abandoned": [
+                s.id
+                for s in self.steps.values()
+                if s.status in (CANCELLED, OVER_BUDGET)
+            ],
+            "budget": self.budget,
+            "elapsed_s": self.elapsed_s,
+            "sequential_s": self.sequential_s,
+            "steps": [
+                {
+                    "id": s.id,
+                    "type": s.type,
+                    "depends_on": s.depends_on,
+                    "optional": s.optional,
+                    "status": s.status,
+                    "start_s": round(s.start_s, 4),
+                    "elapsed_s": round(s.elapsed_s, 4),
+                    "error": s.error,
+                }
+                for s in self.steps.values()
+            ],
+        }
+
+
+async def _run_step(
+    step: PlanStep,
+    result: StepResult,
+    handler: StepHandler,
+    inputs: dict[str, Any],
+    started: float,
+    threads: ThreadPoolExecutor,
+) -> None:
+    result.start_s = perf_counter() - started
+    try:
+        if inspect.iscoroutinefunction(handler):
+            result.output = await handler(step, inputs)
+        else:
+            result.output = await asyncio.get_running_loop().run_in_executor(
+                threads, handler, step, inputs
+            )
+        result.status = OK
+    except asyncio.CancelledError:
+        result.status = CANCELLED
+        raise
+    except Exception as exc:
+        result.status = FAILED
+        result.error = str(exc) or type(exc).__name__
+    finally:
+        result.end_s = perf_counter() - started
+
+
+async def _abandon(
+    running: dict[asyncio.Task[None], str],
+    tasks: Iterable[asyncio.Task[None]],
+    results: dict[str, StepResult],
+) -> list[str]:
+    """Cancel `tasks` and drop them from `running`; returns their step ids."""
+    tasks = list(tasks)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    ids = [running.pop(task) for task in tasks]
+    for sid in ids:
+        # Cancelled before the step got to run
+        results[sid].status = results[sid].status or CANCELLED
+    return ids
+
+
+async def run_plan(
+    plan: dict[str, Any],
+    handlers: dict[str, StepHandler],
+    *,
+    max_parallel_tasks: int = 2,
+    budget: PlanBudget | None = None,
+    degrade_to: tuple[str, ...] = ("synthesize",),
+) -> PlanExecution:
+    """Run the steps of `plan` in dependency order, concurrently where possible.
+
+    Args:
+        plan: Plan from `make_plan`; its `plan` list holds the steps.
+        handlers: Step handler per step type.
+        max_parallel_tasks: Most steps running at once.
+        budget: Limits and accounting for the run; unlimited if None.
+        degrade_to: Step types still run once a soft limit is reached.
+
+    Returns:
+        PlanExecution: Status, output and timings of every step, and the
+            budget consumed.
+
+    Raises:
+        PlanError: If the steps don't form a DAG; nothing is run.
+    """
+    steps: list[PlanStep] = list(plan.get("plan", []) or [])
+    deps = plan_dependencies(steps)
+    by_id = {str(s["id"]): s for s in steps}
+    execution = PlanExecution(
+        steps={
+            sid: StepResult(
+                id=sid,
+                type=str(by_id[sid].get("type", "")),
+                depends_on=d,
+                optional=bool(by_id[sid].get("optional", False)),
+            )
+            for sid, d in deps.items()
+        }
+    )
+    results = execution.steps
+    budget = budget or PlanBudget()
+    budget.start()
+    started = budget.started
+    running: dict[asyncio.Task[None], str] = {}
+    pending = list(deps)
+    limit = max(1, max_parallel_tasks)
+
+    def new_threads() -> ThreadPoolExecutor:
+        return ThreadPoolExecutor(max_workers=limit, thread_name_prefix="plan-step")
+
+    threads = new_threads()
+
+    def settle(sid: str, status: str, error: str = "") -> None:
+        results[sid].status = status
+        results[sid].error = error
+        pending.remove(sid)
+        execution.completed.append(sid)
+
+    async def degrade(reason: str) -> None:
+        nonlocal threads
+        budget.stop_reason = f"soft:{reason}"
+        research = [
+            t for t, sid in running.items() if results[sid].type not in degrade_to
+        ]
+        abandoned = await _abandon(running, research, results)
+        execution.completed.extend(abandoned)
+        if abandoned:
+            # Their handlers still hold the old threads until they return
+            threads.shutdown(wait=False)
+            threads = new_threads()
+        for sid in list(pending):
+            if results[sid].type not in degrade_to:
+                settle(sid, OVER_BUDGET, f"soft limit {reason}")
+
+    async def stop(reason: str) -> None:
+        budget.stop_reason = f"hard:{reason}"
+        execution.completed.extend(await _abandon(running, list(running), results))
+        for sid in list(pending):
+            settle(sid, OVER_BUDGET, f"hard limit {reason}")
+
+    try:
+        while pending or running:
+            reason = budget.hard_limit()
+            if reason:
+                await stop(reason)
+                break
+            if not budget.stop_reason:
+                reason = budget.soft_limit()
+                if reason:
+                    await degrade(reason)
+            for sid in list(pending):
+                if len(running) >= limit or budget.stop_reason.startswith("hard:"):
+                    break
+                if sid not in pending:
+                    continue  # settled by a degrade in this pass
+                needs = [results[d] for d in deps[sid]]
+                if any(not d.status for d in needs):
+                    continue
+                result = results[sid]
+                failed = [d.id for d in needs if d.blocking]
+                if failed:
+                    settle(sid, BLOCKED, "dependency failed: " + ", ".join(failed))
+                    continue
+                handler = handlers.get(result.type)
+                if handler is None:
+                    settle(sid, SKIPPED)
+                    continue
+                if result.type not in degrade_to:
+                    if not budget.stop_reason and not budget.can_start(budget.soft):
+                        await degrade("max_steps")
+                    if budget.stop_reason:
+                        if sid in pending:
+                            settle(sid, OVER_BUDGET, budget.stop_reason)
+                        continue
+                if not budget.can_start(budget.hard):
+                    await stop("max_steps")
+                    break
+                pending.remove(sid)
+                budget.charge_step()
+                inputs = {d.id: d.output for d in needs if d.status == OK}
+                task = asyncio.create_task(
+                    _run_step(by_id[sid], result, handler, inputs, started, threads)
+                )
+                running[task] = sid
+            if budget.stop_reason.startswith("hard:"):
+                break
+            if not running:
+                # Blocked, skipped and abandoned steps settled; look again
+                continue
+            done, _ = await asyncio.wait(
+                running,
+                timeout=budget.remaining_s(soft=not budget.stop_reason),
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            for task in done:
+                execution.completed.append(running.pop(task))
+        if not budget.stop_reason.startswith("hard:"):
+            # A refusal in the last step to run ends the loop unseen
+            reason = budget.hard_limit()
+            if reason:
+                budget.stop_reason = f"hard:{reason}"
+    finally:
+        # Abandoned handlers finish in the background; don't wait for them
+        threads.shutdown(wait=False, cancel_futures=True)
+        budget.finish()
+    execution.elapsed_s = budget.elapsed_s
+    execution.budget = budget.usage()
+    return execution
+
+
+def execute_plan(
+    plan: dict[str, Any],
+    handlers: dict[str, StepHandler] | None = None,
+    *,
+    max_parallel_tasks: int = 2,
+    budget: PlanBudget | None = None,
+) -> dict[str, Any]:
+    """Run `plan` with `run_plan` on a new event loop and summarise it.
 
-def execute_plan(plan: dict[str, Any]) -> dict[str, Any]:
-    steps: list[dict[str, Any]] = plan.get("plan", [])
-    return {"status": "ok", "steps_executed": [s.get("id") for s in steps]}
+    Returns:
+        dict: `PlanExecution.summary()`: overall status, the ids of the steps
+            run, per-step status and timings, and the budget consumed.
+    """
+    return asyncio.run(
+        run_plan(
+            plan, handlers or {}, max_parallel_tasks=max_parallel_tasks, budget=budget
+        )
+    ).summary()
@@ -1,4 +1,4 @@
-from typing import Any, TypedDict
+from typing import Any, NotRequired, TypedDict
 
 
 class PlanStep(TypedDict):
@@ -6,6 +6,10 @@ class PlanStep(TypedDict):
     type: str  # retrieve_rag | search_web | ask_user | read | synthesize
     inputs: dict[str, Any] | None
     when: str | None
+    # Ids of the steps this one needs; absent means the previous step
+    depends_on: NotRequired[list[str]]
+    # If it fails, its dependents still run, without its output
+    optional: NotRequired[bool]
 
 
 def make_plan(
@@ -18,20 +22,30 @@ def make_plan(
                 "type": "retrieve_rag",
                 "inputs": {"query": question},
                 "when": None,
+                "depends_on": [],
             },
             {
                 "id": "step-2",
                 "type": "search_web",
                 "inputs": {"query": question},
                 "when": "if recall low",
+                "depends_on": [],
+                "optional": True,
             },
             {
                 "id": "step-3",
                 "type": "ask_user",
                 "inputs": None,
                 "when": "if ambiguity blocks synthesis",
+                "depends_on": ["step-1", "step-2"],
+            },
+            {
+                "id": "step-4",
+                "type": "synthesize",
+                "inputs": None,
+                "when": None,
+                "depends_on": ["step-1", "step-2", "step-3"],
             },
-            {"id": "step-4", "type": "synthesize", "inputs": None, "when": None},
         ],
         "budgets": {"max_steps": max_steps, "max_questions": max_questions},
     }
@@ -1 +1,21 @@
-"""Retrieval backends (faiss/chroma/sqlite) — stubs."""
+"""Retrieval backends.
+
+`flat` is an exact, memory-mapped numpy index; other backends can be
+registered in `BACKENDS` under the name used by the `index.backend` setting.
+"""
+
+from pathlib import Path
+
+from .flat import FlatIndex
+
+BACKENDS = {"flat": FlatIndex}
+
+
+def open_index(index_dir: Path, backend: str = "flat") -> FlatIndex:
+    cls = BACKENDS.get(backend)
+    if cls is None:
+        raise ValueError(f"Unsupported index backend: {backend}")
+    return cls.open(index_dir)
+
+
+__all__ = ["BACKENDS", "FlatIndex", "open_index"]
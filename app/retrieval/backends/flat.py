@@ -0,0 +1,358 @@
+from __future__ import annotations
+
+import json
+import sys
+import weakref
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+from app.retrieval.indexing.manifest import IndexManifest
+from app.retrieval.indexing.segments import (
+    acquire_chunk_file,
+    release_chunk_file,
+    segment_paths,
+)
+from app.retrieval.indexing.snapshots import current_snapshot, load_snapshot
+from app.retrieval.lexical import SegmentPostings, assign_idf, bm25_scores, tokenize
+from app.retrieval.metadata import MetadataIndex
+from app.retrieval.quantization import load_quantizer
+
+# Cap on the (queries x rows) score matrix materialised per batch, in cells
+_SCORE_BLOCK_CELLS = 1 << 24
+# Opens of a snapshot retried when garbage collection removes it meanwhile
+_OPEN_ATTEMPTS = 3
+
+
+class _Segment:
+    def __init__(
+        self,
+        index_dir: Path,
+        name: str,
+        row_start: int,
+        rows: int,
+        dim: int,
+        codes: str = "",
+    ):
+        paths = segment_paths(index_dir, name, codes)
+        self.name = name
+        self.row_start = row_start
+        self.rows = rows
+        self.vectors = np.memmap(
+            paths["vectors"], dtype=np.float32, mode="r", shape=(rows, dim)
+        )
+        self.offsets = np.fromfile(paths["offsets"], dtype=np.int64)
+        self.live = np.ones(rows, dtype=bool)
+        self.postings = SegmentPostings(paths["lexical"], rows)
+        self.quantizer = load_quantizer(paths["quantizer"]) if codes else None
+        self.codes = np.load(paths["codes"]) if self.quantizer is not None else None
+        # Acquired last, so a segment that fails to open holds nothing. Held
+        # until the segment is gone: its handle and every result read from it
+        # reference it, so records stay readable after the files are collected
+        self.chunks = acquire_chunk_file(paths["chunks"])
+        self._release = weakref.finalize(self, release_chunk_file, self.chunks)
+
+    def record(self, local: int) -> dict[str, Any]:
+        return json.loads(self.chunks.read(int(self.offsets[local])))
+
+    def close(self) -> None:
+        self._release()
+
+    def scores(
+        self, queries: np.ndarray, local: np.ndarray | None = None
+    ) -> np.ndarray:
+        """Scores of every row (or of the `local` rows) against each of `queries`.
+
+        Returns:
+            np.ndarray: Shape (n_queries, rows or len(local)).
+        """
+        if self.codes is not None:
+            codes = self.codes if local is None else self.codes[local]
+            return self.quantizer.scores(codes, queries)
+        vectors = self.vectors if local is None else self.vectors[local]
+        return queries @ vectors.T
+
+    @property
+    def nbytes(self) -> int:
+        # With codes, float rows are only paged in for re-scoring
+        vectors = self.codes if self.codes is not None else self.vectors
+        return int(
+            vectors.nbytes
+            + self.offsets.nbytes
+            + self.live.nbytes
+            + self.postings.nbytes
+        )
+
+
+def _read_chunk(segments: list[_Segment], row: int) -> dict[str, Any]:
+    for seg in segments:
+        if seg.row_start <= row < seg.row_start + seg.rows:
+            return seg.record(row - seg.row_start)
+    raise IndexError(f"row {row} not in index")
+
+
+class FlatIndex:
+    """Exact inner-product index over the memory-mapped segments of one index dir.
+
+    Vectors are L2-normalised at ingestion, so inner product is cosine
+    similarity. Each segment also carries BM25 postings for lexical search.
+    Tombstoned rows are masked out of every search. A handle reads one index
+    snapshot for its whole life; `snapshot` names it. Its chunk files stay
+    open until neither the handle nor any result read from it is left, so
+    records stay readable after `collect_garbage` removes the files.
+    """
+
+    def __init__(
+        self, index_dir: Path, manifest: IndexManifest, snapshot: str | None = None
+    ):
+        self.index_dir = index_dir
+        self.manifest = manifest
+        self.snapshot = snapshot
+        self.segments: list[_Segment] = []
+        try:
+            for s in manifest.segments:
+                self.segments.append(
+                    _Segment(
+                        index_dir,
+                        s.name,
+                        s.row_start,
+                        s.rows,
+                        manifest.dim,
+                        manifest.codes_tag,
+                    )
+                )
+        except BaseException:
+            self.close()
+            raise
+        for start, end in manifest.tombstones:
+            for seg in self.segments:
+                lo = max(start, seg.row_start) - seg.row_start
+                hi = min(end, seg.row_start + seg.rows) - seg.row_start
+                if hi > lo:
+                    seg.live[lo:hi] = False
+        assign_idf([seg.postings for seg in self.segments])
+        self.sources, self.row_sources = self._source_table()
+        self.metadata = MetadataIndex(manifest)
+
+    @classmethod
+    def open(cls, index_dir: Path) -> FlatIndex:
+        """Open the snapshot `index_dir` currently points at.
+
+        If garbage collection removes the snapshot's segment files while it is
+        being opened, the snapshot `CURRENT` has moved on to is opened instead.
+        """
+        attempts = _OPEN_ATTEMPTS
+        while True:
+            snapshot, manifest = load_snapshot(index_dir)
+            if manifest is None:
+                raise FileNotFoundError(f"No index manifest in {index_dir}")
+            try:
+                return cls(index_dir, manifest, snapshot)
+            except FileNotFoundError:
+                attempts -= 1
+                if not attempts or current_snapshot(index_dir) == snapshot:
+                    raise
+
+    def _source_table(self) -> tuple[list[str], np.ndarray]:
+        """Interned source URIs and the index into them of every row (-1 if unknown)."""
+        end = max((s.row_start + s.rows for s in self.manifest.segments), default=0)
+        row_sources = np.full(end, -1, dtype=np.int32)
+        ids: dict[str, int] = {}
+        for entry in self.manifest.documents.values():
+            if entry.source_uri:
+                sid = ids.setdefault(sys.intern(entry.source_uri), len(ids))
+                row_sources[entry.chunk_start : entry.chunk_end] = sid
+        return list(ids), row_sources
+
+    @property
+    def nbytes(self) -> int:
+        return sum(seg.nbytes for seg in self.segments) + int(self.row_sources.nbytes)
+
+    @property
+    def dim(self) -> int:
+        return self.manifest.dim
+
+    def __len__(self) -> int:
+        return self.manifest.live_rows
+
+    @property
+    def quantized(self) -> bool:
+        return any(seg.codes is not None for seg in self.segments)
+
+    def filter_rows(self, filters: dict[str, Any] | None) -> np.ndarray | None:
+        """Sorted live rows allowed by metadata `filters`; None if unfiltered."""
+        rows = self.metadata.rows(filters or {})
+        if rows is None:
+            return None
+        keep = np.zeros(len(rows), dtype=bool)
+        for seg in self.segments:
+            lo, hi = np.searchsorted(rows, [seg.row_start, seg.row_start + seg.rows])
+            keep[lo:hi] = seg.live[rows[lo:hi] - seg.row_start]
+        return rows[keep]
+
+    def search(
+        self,
+        query: np.ndarray,
+        top_k: int,
+        *,
+        rescore_factor: int = 0,
+        rows: np.ndarray | None = None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Return (rows, scores) of the `top_k` live rows, best first.
+
+        On a quantized index scores are approximate unless `rescore_factor` is
+        set, in which case the best `top_k * rescore_factor` candidates are
+        re-scored exactly against their float32 vectors. `rows` (from
+        `filter_rows`) restricts scoring to those rows.
+        """
+        found, scores = self.search_many(
+            np.asarray(query)[None, :], top_k, rescore_factor=rescore_factor, rows=rows
+        )
+        keep = found[0] >= 0
+        return found[0][keep], scores[0][keep]
+
+    def search_many(
+        self,
+        queries: np.ndarray,
+        top_k: int,
+        *,
+        rescore_factor: int = 0,
+        rows: np.ndarray | None = None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Batched `search`: one matrix product for all `queries` (n, dim).
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: Rows and scores of shape
+            (n, <= top_k), best first per query. Queries with fewer live rows
+            than `top_k` are padded with row -1 and score -inf.
+        """
+        q = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        total = sum(seg.rows for seg in self.segments) if rows is None else len(rows)
+        if not total or top_k <= 0:
+            return (
+                np.zeros((len(q), 0), dtype=np.int64),
+                np.zeros((len(q), 0), dtype=np.float32),
+            )
+        rescore = rescore_factor > 0 and self.quantized
+        k = top_k * rescore_factor if rescore else top_k
+        step = max(1, _SCORE_BLOCK_CELLS // total)
+        parts = [self._top(q[lo : lo + step], k, rows) for lo in range(0, len(q), step)]
+        found = np.concatenate([p[0] for p in parts])
+        scores = np.concatenate([p[1] for p in parts])
+        if rescore:
+            scores = self._exact_scores(found, q)
+            order = np.argsort(-scores, axis=1, kind="stable")[:, :top_k]
+            found = np.take_along_axis(found, order, axis=1)
+            scores = np.take_along_axis(scores, order, axis=1)
+        return found, scores.astype(np.float32)
+
+    def _top(
+        self, q: np.ndarray, k: int, rows: np.ndarray | None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        if rows is None:
+            scores = np.concatenate(
+                [np.where(seg.live, seg.scores(q), -np.inf) for seg in self.segments],
+                axis=1,
+            )
+        else:
+            # `rows` are sorted and live, so each segment's share is one slice
+            parts = []
+            for seg in self.segments:
+                lo, hi = np.searchsorted(
+                    rows, [seg.row_start, seg.row_start + seg.rows]
+                )
+                if hi > lo:
+                    parts.append(seg.scores(q, rows[lo:hi] - seg.row_start))
+            scores = np.concatenate(parts, axis=1)
+        k = min(k, scores.shape[1])
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind="stable")
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        ids = self._global_rows(top) if rows is None else rows[top]
+        return np.where(np.isfinite(top_scores), ids, -1), top_scores
+
+    def _global_rows(self, positions: np.ndarray) -> np.ndarray:
+        """Map positions in the concatenated segments to global row ids."""
+        sizes = np.fromiter((seg.rows for seg in self.segments), dtype=np.int64)
+        starts = np.fromiter((seg.row_start for seg in self.segments), dtype=np.int64)
+        bounds = np.cumsum(sizes)
+        which = np.searchsorted(bounds, positions, side="right")
+        return positions - (bounds - sizes)[which] + starts[which]
+
+    def _exact_scores(self, rows: np.ndarray, q: np.ndarray) -> np.ndarray:
+        """Float32 scores of `rows` (n, c) against `q` (n, dim); -inf where row is -1."""
+        flat = rows.ravel()
+        owner = np.repeat(np.arange(len(q)), rows.shape[1])
+        scores = np.full(len(flat), -np.inf, dtype=np.float32)
+        valid = flat >= 0
+        scores[valid] = np.einsum(
+            "ij,ij->i", self.row_vectors(flat[valid]), q[owner[valid]]
+        )
+        return scores.reshape(rows.shape)
+
+    def row_vectors(self, rows: np.ndarray) -> np.ndarray:
+        """Float32 vectors of global `rows`, shape (len(rows), dim)."""
+        rows = np.asarray(rows, dtype=np.int64)
+        out = np.empty((len(rows), self.dim), dtype=np.float32)
+        starts = np.fromiter((seg.row_start for seg in self.segments), dtype=np.int64)
+        which = np.searchsorted(starts, rows, side="right") - 1
+        for i in np.unique(which):
+            seg = self.segments[i]
+            mask = which == i
+            out[mask] = seg.vectors[rows[mask] - seg.row_start]
+        return out
+
+    def search_lexical(
+        self, query: str, top_k: int, *, rows: np.ndarray | None = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Return (rows, BM25 scores) of the `top_k` best lexical matches.
+
+        `rows` (from `filter_rows`) restricts matches to those rows.
+        """
+        terms = tokenize(query)
+        allowed = rows
+        row_parts: list[np.ndarray] = []
+        score_parts: list[np.ndarray] = []
+        for seg in self.segments:
+            rows, scores = bm25_scores(seg.postings, terms)
+            keep = seg.live[rows]
+            if allowed is not None:
+                keep &= np.isin(rows + seg.row_start, allowed, assume_unique=True)
+            row_parts.append(rows[keep] + seg.row_start)
+            score_parts.append(scores[keep])
+        if not row_parts or top_k <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        rows = np.concatenate(row_parts)
+        scores = np.concatenate(score_parts)
+        if len(scores) > top_k:
+            top = np.argpartition(-scores, top_k - 1)[:top_k]
+            rows, scores = rows[top], scores[top]
+        order = np.argsort(-scores, kind="stable")
+        return rows[order], scores[order]
+
+    def chunk(self, row: int) -> dict[str, Any]:
+        """Read the chunk record stored for `row`."""
+        return _read_chunk(self.segments, row)
+
+    def chunk_reader(self) -> Callable[[int], dict[str, Any]]:
+        """Return a `chunk` lookup bound to the current segments.
+
+        It keeps working after the index is closed (e.g. evicted from the
+        index cache), so results can resolve their records lazily.
+        """
+        segments = self.segments
+        return lambda row: _read_chunk(segments, row)
+
+    def close(self) -> None:
+        """Release the chunk files now rather than with the last reference.
+
+        Only for an owner that knows nothing else reads from the handle:
+        afterwards records are read by opening the files, which fails once
+        `collect_garbage` has removed them. Idempotent.
+        """
+        for seg in self.segments:
+            seg.close()
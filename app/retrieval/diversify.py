@@ -0,0 +1,107 @@
+"""Post-retrieval diversification.
+
+Overlapping chunks and boilerplate shared across documents tend to fill the
+top-k with near-copies of one passage. Candidates are first collapsed onto the
+best-ranked member of each near-duplicate group (by embedding cosine or by
+shingled MinHash Jaccard), then re-ranked with maximal marginal relevance
+(MMR), which trades relevance against similarity to passages already chosen.
+
+All functions work on candidate positions in rank order, best first.
+"""
+
+from __future__ import annotations
+
+import zlib
+
+import numpy as np
+
+from app.retrieval.lexical import tokenize
+
+DEDUP_METHODS = ("none", "cosine", "minhash")
+# Universal hashing (a * x + b) mod p over 32-bit shingle hashes; with a, b
+# below 2^32 the product fits in uint64
+_MINHASH_PRIME = np.uint64((1 << 61) - 1)
+
+
+def collapse_duplicates(similarity: np.ndarray, threshold: float) -> np.ndarray:
+    """Keep mask that drops every candidate too similar to a better-ranked kept one.
+
+    Args:
+        similarity: Pairwise similarity of the candidates, shape (n, n).
+        threshold: Candidates at or above this similarity are duplicates.
+    """
+    keep = np.ones(len(similarity), dtype=bool)
+    for i in range(len(similarity)):
+        if keep[i]:
+            keep[i + 1 :] &= similarity[i, i + 1 :] < threshold
+    return keep
+
+
+def minhash_signatures(
+    texts: list[str], *, shingle_size: int = 5, num_perm: int = 64, seed: int = 0
+) -> np.ndarray:
+    """MinHash signatures of the word shingles of `texts`, shape (n, num_perm)."""
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, 1 << 32, size=num_perm, dtype=np.uint64)
+    b = rng.integers(0, 1 << 32, size=num_perm, dtype=np.uint64)
+    signatures = np.empty((len(texts), num_perm), dtype=np.uint64)
+    for i, text in enumerate(texts):
+        tokens = tokenize(text)
+        n = max(1, len(tokens) - shingle_size + 1)
+        shingles = np.fromiter(
+            (
+                zlib.crc32(" ".join(tokens[j : j + shingle_size]).encode("utf-8"))
+                for j in range(n)
+            ),
+            dtype=np.uint64,
+            count=n,
+        )
+        signatures[i] = ((shingles[:, None] * a + b) % _MINHASH_PRIME).min(axis=0)
+    return signatures
+
+
+def minhash_similarity(signatures: np.ndarray) -> np.ndarray:
+    """Estimated pairwise Jaccard similarity from MinHash signatures."""
+    return (signatures[:, None, :] == signatures[None, :, :]).mean(axis=2)
+
+
+def mmr_select(
+    relevance: np.ndarray, similarity: np.ndarray, k: int, lambda_: float
+) -> np.ndarray:
+    """Pick `k` positions by maximal marginal relevance.
+
+    Each step takes the candidate maximising
+    `lambda_ * relevance - (1 - lambda_) * max similarity to those picked`.
+
+    Args:
+        relevance: Relevance per candidate, ideally scaled to [0, 1].
+        similarity: Pairwise similarity of the candidates, shape (n, n).
+        k: Number of positions to pick.
+        lambda_: 1.0 ranks by relevance alone, 0.0 by diversity alone.
+
+    Returns:
+        np.ndarray: Picked positions, in pick order.
+    """
+    n = len(relevance)
+    k = min(k, n)
+    picked = np.empty(k, dtype=np.int64)
+    max_sim = np.zeros(n)
+    available = np.ones(n, dtype=bool)
+    for step in range(k):
+        gain = lambda_ * relevance - (1.0 - lambda_) * max_sim
+        gain[~available] = -np.inf
+        best = int(np.argmax(gain))
+        picked[step] = best
+        available[best] = False
+        np.maximum(max_sim, similarity[best], out=max_sim)
+    return picked
+
+
+def scale_scores(scores: np.ndarray) -> np.ndarray:
+    """Min-max scale scores to [0, 1] so BM25, RRF and cosine mix alike in MMR."""
+    if not len(scores):
+        return scores.astype(np.float64)
+    lo, hi = float(scores.min()), float(scores.max())
+    if hi <= lo:
+        return np.ones(len(scores))
+    return (scores - lo) / (hi - lo)
@@ -0,0 +1,214 @@
+"""Persistent table of query embeddings (V003).
+
+Evaluation datasets and live traffic repeat a small set of question templates
+across companies. Each company has its own query-cache entry, but the
+question's embedding is the same for all of them. This table maps (embedding
+model, normalised query) to its vector, so a recurring question skips the
+embedding call.
+
+The table is an LRU with one `.npz` file per embedding model under
+`retriever.embedding_table.dir`. It is warmed from the eval datasets at
+startup and grows from live traffic. New entries are flushed to disk every
+`flush_every` misses and when the process exits.
+"""
+
+from __future__ import annotations
+
+import atexit
+import logging
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+from app.retrieval.indexing.embeddings import embed_matrix
+from app.retrieval.query_cache import normalize_query
+
+logger = logging.getLogger(__name__)
+
+
+def _model_file(model: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", model) + ".npz"
+
+
+class EmbeddingTable:
+    """LRU of query embeddings keyed by (model, normalised query)."""
+
+    def __init__(
+        self,
+        max_entries: int = 8192,
+        disk_dir: Path | None = None,
+        flush_every: int = 64,
+    ):
+        self.max_entries = max(1, max_entries)
+        self.disk_dir = disk_dir
+        self.flush_every = max(1, flush_every)
+        self._entries: OrderedDict[tuple[str, str], np.ndarray] = OrderedDict()
+        self._loaded: set[str] = set()
+        self._dirty: set[str] = set()
+        self._unflushed = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _load(self, model: str) -> None:
+        # Caller holds the lock
+        if model in self._loaded:
+            return
+        self._loaded.add(model)
+        if self.disk_dir is None:
+            return
+        path = self.disk_dir / _model_file(model)
+        if not path.exists():
+            return
+        try:
+            with np.load(path) as data:
+                queries, vectors = data["queries"], data["vectors"]
+        except (OSError, ValueError, KeyError) as exc:
+            logger.warning(f"Ignoring unreadable embedding table {path}: {exc}")
+            return
+        for query, vector in zip(queries.tolist(), vectors):
+            self._entries.setdefault((model, query), vector)
+        self._evict()
+
+    def _evict(self) -> None:
+        while len(self._entries) > self.max_entries:
+            (model, _), _ = self._entries.popitem(last=False)
+            self._dirty.add(model)
+
+    def get_many(self, model: str, queries: list[str]) -> list[np.ndarray | None]:
+        """Vectors of already normalised `queries`; None where missing."""
+        out: list[np.ndarray | None] = []
+        with self._lock:
+            self._load(model)
+            for query in queries:
+                vector = self._entries.get((model, query))
+                if vector is None:
+                    self.misses += 1
+                else:
+                    self._entries.move_to_end((model, query))
+                    self.hits += 1
+                out.append(vector)
+        return out
+
+    def put_many(self, model: str, queries: list[str], vectors: np.ndarray) -> None:
+        with self._lock:
+            self._load(model)
+            for query, vector in zip(queries, vectors):
+                self._entries[(model, query)] = vector
+                self._entries.move_to_end((model, query))
+            self._evict()
+            self._dirty.add(model)
+            self._unflushed += len(queries)
+            flush = self._unflushed >= self.flush_every
+        if flush:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write the models changed since the last flush to disk."""
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            self._unflushed = 0
+            snapshot = {
+                model: [(q, v) for (m, q), v in self._entries.items() if m == model]
+                for model in dirty
+            }
+        if self.disk_dir is None:
+            return
+        self.disk_dir.mkdir(parents=True, exist_ok=True)
+        for model, entries in snapshot.items():
+            path = self.disk_dir / _model_file(model)
+            if not entries:
+                path.unlink(missing_ok=True)
+                continue
+            tmp = path.with_suffix(f".{threading.get_ident()}.tmp.npz")
+            np.savez(
+                tmp,
+                queries=np.asarray([q for q, _ in entries]),
+                vectors=np.stack([v for _, v in entries]).astype(np.float32),
+            )
+            tmp.replace(path)
+
+    def warm(self, model: str, queries: list[str]) -> int:
+        """Embed the `queries` missing from the table in one call, then flush.
+
+        Returns:
+            int: Number of queries embedded.
+        """
+        texts = list(dict.fromkeys(normalize_query(q) for q in queries if q.strip()))
+        with self._lock:
+            self._load(model)
+            missing = [t for t in texts if (model, t) not in self._entries]
+        if missing:
+            self.put_many(model, missing, embed_matrix(missing, model))
+        self.flush()
+        return len(missing)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._loaded.clear()
+            self._dirty.clear()
+            self._unflushed = 0
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+def embed_queries(
+    queries: list[str], model: str, table: EmbeddingTable | None = None
+) -> np.ndarray:
+    """Embed normalised `queries`, serving repeats from `table`.
+
+    Queries missing from the table are embedded in one call and added to it.
+    """
+    texts = [normalize_query(q) for q in queries]
+    if table is None:
+        return embed_matrix(texts, model)
+    found = table.get_many(model, texts)
+    missing = list(dict.fromkeys(t for t, v in zip(texts, found) if v is None))
+    if missing:
+        vectors = embed_matrix(missing, model)
+        table.put_many(model, missing, vectors)
+        fresh = dict(zip(missing, vectors))
+        found = [fresh[t] if v is None else v for t, v in zip(texts, found)]
+    return np.stack(found) if found else np.zeros((0, 0), dtype=np.float32)
+
+
+_default_table: EmbeddingTable | None = None
+_default_lock = threading.Lock()
+
+
+def get_embedding_table(config: dict[str, Any] | None = None) -> EmbeddingTable | None:
+    """Return the process-wide table configured by `retriever.embedding_table`, if enabled."""
+    global _default_table
+    table_cfg = dict(
+        ((config or {}).get("retriever", {}) or {}).get("embedding_table", {}) or {}
+    )
+    if not table_cfg.get("enabled", True):
+        return None
+    with _default_lock:
+        if _default_table is None:
+            disk_dir = str(table_cfg.get("dir", "") or "")
+            _default_table = EmbeddingTable(
+                max_entries=int(table_cfg.get("max_entries", 8192)),
+                disk_dir=Path(disk_dir) if disk_dir else None,
+                flush_every=int(table_cfg.get("flush_every", 64)),
+            )
+            atexit.register(_default_table.flush)
+        return _default_table
+
+
+def default_embedding_table() -> EmbeddingTable | None:
+    """Return the process-wide table if one has been created, without creating it."""
+    return _default_table
@@ -0,0 +1,171 @@
+"""Process-level LRU of open per-company index handles.
+
+Every query is scoped to one company, so each (company slug, version) index is
+opened on its own and only the recently used ones stay resident. The cache is
+bounded both by the number of open handles and by their resident bytes.
+
+Dropped handles (evicted, reloaded or cleared) are not closed: a request or
+a lazily resolved result may still read from one. Each handle's segments
+hold their chunk files, which are released as soon as the last reference to
+the handle or its results is gone (see `app.retrieval.backends.flat`).
+
+Handles follow re-ingestion without a restart: at most every
+`reload_interval_s` a hit re-reads the index's `CURRENT` snapshot pointer and,
+if it moved, the new snapshot is opened and swapped in. Callers keep the handle
+they got for the whole request, which pins the snapshot they read.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any
+
+from app.retrieval.backends import FlatIndex, open_index
+from app.retrieval.indexing.snapshots import current_snapshot
+from app.retrieval.layout import company_slug, index_dir_for
+
+
+class IndexCache:
+    def __init__(
+        self,
+        index_root: Path,
+        *,
+        backend: str = "flat",
+        max_open: int = 16,
+        max_bytes: int = 512 * 1024 * 1024,
+        reload_interval_s: float = 1.0,
+    ):
+        self.index_root = index_root
+        self.backend = backend
+        self.max_open = max(1, max_open)
+        self.max_bytes = max_bytes
+        self.reload_interval_s = reload_interval_s
+        self._handles: OrderedDict[tuple[str, str], FlatIndex] = OrderedDict()
+        # Monotonic time each handle's snapshot pointer was last checked
+        self._checked: dict[tuple[str, str], float] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.opens = 0
+        self.reloads = 0
+        self.evictions = 0
+
+    @property
+    def resident_bytes(self) -> int:
+        return sum(h.nbytes for h in self._handles.values())
+
+    def get(self, company: str, version: str = "v1") -> FlatIndex:
+        """Return the open index for `company`, opening it on first use.
+
+        Raises:
+            FileNotFoundError: If the company has not been ingested.
+        """
+        # Keyed like the directory, so every spelling of a company shares a handle
+        key = (company_slug(company), version)
+        index_dir = index_dir_for(self.index_root, company, version)
+        now = time.monotonic()
+        with self._lock:
+            handle = self._handles.get(key)
+            if handle is not None:
+                self._handles.move_to_end(key)
+                self.hits += 1
+                if now - self._checked[key] < self.reload_interval_s:
+                    return handle
+                self._checked[key] = now
+            else:
+                self.misses += 1
+
+        if handle is not None:
+            if current_snapshot(index_dir) == handle.snapshot:
+                return handle
+            stale = handle
+        else:
+            stale = None
+
+        # Open outside the lock so a slow open doesn't block hits on other indexes
+        handle = open_index(index_dir, self.backend)
+        with self._lock:
+            existing = self._handles.get(key)
+            if existing is not None and existing is not stale:
+                self._handles.move_to_end(key)
+                return existing
+            if stale is not None:
+                self.reloads += 1
+            else:
+                self.opens += 1
+            self._handles[key] = handle
+            self._checked[key] = now
+            self._evict(keep=key)
+        return handle
+
+    def _evict(self, keep: tuple[str, str]) -> None:
+        # The handle just opened always stays, even if it alone exceeds max_bytes
+        while len(self._handles) > 1 and (
+            len(self._handles) > self.max_open or self.resident_bytes > self.max_bytes
+        ):
+            key = next(iter(self._handles))
+            if key == keep:
+                break
+            del self._handles[key]
+            self._checked.pop(key, None)
+            self.evictions += 1
+
+    def evict(self, company: str, version: str | None = None) -> int:
+        """Drop open handles for `company` (all versions unless one is given)."""
+        slug = company_slug(company)
+        with self._lock:
+            keys = [
+                k
+                for k in self._handles
+                if k[0] == slug and (version is None or k[1] == version)
+            ]
+            for key in keys:
+                del self._handles[key]
+                self._checked.pop(key, None)
+            self.evictions += len(keys)
+            return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._handles.clear()
+            self._checked.clear()
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "open": len(self._handles),
+                "resident_bytes": self.resident_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "opens": self.opens,
+                "reloads": self.reloads,
+                "evictions": self.evictions,
+            }
+
+
+_default_cache: IndexCache | None = None
+_default_lock = threading.Lock()
+
+
+def get_index_cache(config: dict[str, Any] | None = None) -> IndexCache:
+    """Return the process-wide cache, creating it from the `index` config section."""
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            index_cfg = dict((config or {}).get("index", {}) or {})
+            _default_cache = IndexCache(
+                Path(str(index_cfg.get("dir", "data/indexes"))),
+                backend=str(index_cfg.get("backend", "flat")),
+                max_open=int(index_cfg.get("max_open", 16)),
+                max_bytes=int(index_cfg.get("max_resident_mb", 512)) * 1024 * 1024,
+                reload_interval_s=float(index_cfg.get("reload_interval_s", 1.0)),
+            )
+        return _default_cache
+
+
+def default_index_cache() -> IndexCache | None:
+    """Return the process-wide cache if one has been created, without creating it."""
+    return _default_cache
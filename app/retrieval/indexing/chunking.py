@@ -1,5 +1,83 @@
-def chunk_text(text: str, size: int = 800, overlap: int = 150) -> list[str]:
+from __future__ import annotations
+
+from collections.abc import Iterable, Iterator
+
+
+def chunk_spans(
+    text: str, size: int = 800, overlap: int = 150
+) -> list[tuple[int, int]]:
+    """Split `text` into overlapping [start, end) character windows.
+
+    Window ends are pulled back to the last whitespace in the window's tail so
+    words are not cut in half; the next window starts `overlap` characters
+    before the previous end.
+    """
     if not text:
         return []
-    # Minimal placeholder chunker
-    return [text[:size]]
+    if size <= 0:
+        raise ValueError("chunk size must be positive")
+    overlap = max(0, min(overlap, size - 1))
+
+    spans: list[tuple[int, int]] = []
+    start = 0
+    n = len(text)
+    while start < n:
+        end = min(start + size, n)
+        if end < n:
+            cut = text.rfind(" ", start + size // 2, end)
+            if cut > start:
+                end = cut
+        spans.append((start, end))
+        if end >= n:
+            break
+        start = max(end - overlap, start + 1)
+    return spans
+
+
+def chunk_text(text: str, size: int = 800, overlap: int = 150) -> list[str]:
+    return [text[s:e] for s, e in chunk_spans(text, size, overlap)]
+
+
+def iter_chunks(
+    pieces: Iterable[str], size: int = 800, overlap: int = 150
+) -> Iterator[tuple[int, int, str]]:
+    """Streaming `chunk_spans`: yield (start, end, text) over consecutive pieces.
+
+    The pieces are treated as one text; only the current window and its
+    lookahead are buffered, so memory does not grow with the document. Spans
+    are identical to `chunk_spans` over the concatenated text.
+    """
+    if size <= 0:
+        raise ValueError("chunk size must be positive")
+    overlap = max(0, min(overlap, size - 1))
+
+    buf = ""
+    base = 0  # offset of buf[0] in the whole text
+    start = 0
+    pieces_iter = iter(pieces)
+    exhausted = False
+    while True:
+        # A window's end is final once text exists beyond start + size
+        while not exhausted and len(buf) <= start - base + size:
+            piece = next(pieces_iter, None)
+            if piece is None:
+                exhausted = True
+            else:
+                buf += piece
+        n = base + len(buf)
+        if start >= n:
+            return
+        end = min(start + size, n)
+        if end < n:
+            cut = buf.rfind(" ", start - base + size // 2, end - base)
+            if cut > start - base:
+                end = base + cut
+        yield start, end, buf[start - base : end - base]
+        if end >= n:
+            return
+        start = max(end - overlap, start + 1)
+        # Drop consumed text only once it dominates the buffer, so large
+        # pieces aren't copied once per window
+        if start - base > len(buf) // 2:
+            buf = buf[start - base :]
+            base = start
@@ -1,5 +1,64 @@
+from __future__ import annotations
+
+import os
+import zlib
+
+import numpy as np
+
+from app.retrieval.lexical import tokenize
+
+# Local, deterministic feature-hashing embeddings ("hash-<dim>") need no API
+# key; they are meant for tests, benchmarks and offline development.
+_HASH_PREFIX = "hash"
+_DEFAULT_HASH_DIM = 256
+_API_BATCH = 100
+
+
+def _hash_dim(model: str) -> int:
+    _, _, suffix = model.partition("-")
+    return int(suffix) if suffix.isdigit() else _DEFAULT_HASH_DIM
+
+
+def _hash_embed(texts: list[str], dim: int) -> np.ndarray:
+    out = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for token in tokenize(text):
+            h = zlib.crc32(token.encode("utf-8"))
+            out[row, h % dim] += 1.0 if (h >> 31) & 1 else -1.0
+    return out
+
+
+def _api_embed(texts: list[str], model: str) -> np.ndarray:
+    # Lazy import so other parts of the app don't require the dependency
+    import google.generativeai as genai  # type: ignore
+
+    api_key = os.getenv("GOOGLE_API_KEY", "")
+    if not api_key:
+        raise RuntimeError("GOOGLE_API_KEY is not set; required for embedding calls.")
+    genai.configure(api_key=api_key)
+
+    name = model if model.startswith("models/") else f"models/{model}"
+    rows: list[list[float]] = []
+    for i in range(0, len(texts), _API_BATCH):
+        response = genai.embed_content(model=name, content=texts[i : i + _API_BATCH])
+        rows.extend(response["embedding"])
+    return np.asarray(rows, dtype=np.float32)
+
+
+def embed_matrix(texts: list[str], model: str = "text-embedding-004") -> np.ndarray:
+    """Embed `texts` into an L2-normalised float32 matrix of shape (n, dim)."""
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32)
+    if model.startswith(_HASH_PREFIX):
+        vectors = _hash_embed(texts, _hash_dim(model))
+    else:
+        vectors = _api_embed(texts, model)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
 def embed_texts(
     texts: list[str], model: str = "text-embedding-004"
 ) -> list[list[float]]:
-    # Placeholder embedding vectors
-    return [[0.0, 0.0, 0.0] for _ in texts]
+    return embed_matrix(texts, model).tolist()
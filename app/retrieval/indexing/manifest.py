@@ -1,4 +1,35 @@
-from dataclasses import dataclass
+from __future__ import annotations
+
+import json
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any
+
+from app.retrieval.quantization import codes_tag
+
+MANIFEST_FILENAME = "manifest.json"
+
+
+@dataclass
+class DocumentEntry:
+    """One ingested source document and the index rows holding its chunks."""
+
+    content_hash: str
+    segment: str
+    chunk_start: int
+    chunk_end: int  # exclusive
+    source_uri: str = ""
+    # company, source_type and date; see app.retrieval.metadata
+    metadata: dict[str, str] = field(default_factory=dict)
+
+
+@dataclass
+class SegmentEntry:
+    """An append-only batch of chunk rows written by one ingestion run."""
+
+    name: str
+    row_start: int
+    rows: int
 
 
 @dataclass
@@ -8,3 +39,67 @@ class IndexManifest:
     embedding_model: str
     chunk_size: int
     chunk_overlap: int
+    dim: int = 0
+    generation: int = 0
+    # Random id of the build the generations count from; a new one whenever
+    # the index is built from scratch, so a rebuilt index never reuses keys
+    build_id: str = ""
+    # Vector codes searched instead of float32 rows: none | int8 | pq
+    quantization: str = "none"
+    pq_subvectors: int = 0
+    documents: dict[str, DocumentEntry] = field(default_factory=dict)
+    segments: list[SegmentEntry] = field(default_factory=list)
+    # [start, end) row ranges whose chunks belong to changed or deleted documents
+    tombstones: list[list[int]] = field(default_factory=list)
+
+    @property
+    def total_rows(self) -> int:
+        return sum(s.rows for s in self.segments)
+
+    @property
+    def codes_tag(self) -> str:
+        return codes_tag(self.quantization, self.pq_subvectors)
+
+    @property
+    def live_rows(self) -> int:
+        return self.total_rows - sum(end - start for start, end in self.tombstones)
+
+    def same_settings(self, other: IndexManifest) -> bool:
+        """Whether chunks embedded under `other` can be reused under this manifest."""
+        return (
+            self.embedding_model == other.embedding_model
+            and self.chunk_size == other.chunk_size
+            and self.chunk_overlap == other.chunk_overlap
+        )
+
+    def tombstone(self, start: int, end: int) -> None:
+        if end > start:
+            self.tombstones.append([start, end])
+
+    def to_dict(self) -> dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, raw: dict[str, Any]) -> IndexManifest:
+        data = dict(raw)
+        data["documents"] = {
+            k: DocumentEntry(**v) for k, v in (raw.get("documents") or {}).items()
+        }
+        data["segments"] = [SegmentEntry(**s) for s in raw.get("segments") or []]
+        data["tombstones"] = [list(r) for r in raw.get("tombstones") or []]
+        return cls(**data)
+
+    def save(self, index_dir: Path) -> Path:
+        index_dir.mkdir(parents=True, exist_ok=True)
+        path = index_dir / MANIFEST_FILENAME
+        tmp = path.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps(self.to_dict(), indent=2), encoding="utf-8")
+        tmp.replace(path)
+        return path
+
+    @classmethod
+    def load(cls, index_dir: Path) -> IndexManifest | None:
+        path = index_dir / MANIFEST_FILENAME
+        if not path.exists():
+            return None
+        return cls.from_dict(json.loads(path.read_text(encoding="utf-8")))
@@ -0,0 +1,167 @@
+from __future__ import annotations
+
+import json
+import threading
+from pathlib import Path
+from typing import Any, BinaryIO
+
+import numpy as np
+
+from app.retrieval.lexical import PostingsBuilder
+from app.retrieval.quantization import codes_tag, encode_blocks, train_quantizer
+
+SEGMENTS_DIRNAME = "segments"
+
+
+def segment_paths(index_dir: Path, name: str, codes: str = "") -> dict[str, Path]:
+    """Files making up one segment: raw float32 rows, chunk records, record
+    offsets, BM25 postings and, given a `codes_tag`, quantized codes."""
+    base = index_dir / SEGMENTS_DIRNAME / name
+    paths = {
+        "vectors": base.with_suffix(".f32"),
+        "chunks": base.with_suffix(".jsonl"),
+        "offsets": base.with_suffix(".off"),
+        "lexical": base.with_suffix(".lex.npz"),
+    }
+    if codes:
+        paths["codes"] = base.with_suffix(f".{codes}.codes.npy")
+        paths["quantizer"] = base.with_suffix(f".{codes}.quant.npz")
+    return paths
+
+
+def write_codes(
+    index_dir: Path,
+    name: str,
+    rows: int,
+    dim: int,
+    scheme: str,
+    *,
+    pq_subvectors: int = 16,
+) -> None:
+    """Build a segment's quantized codes for `scheme` from its float32 vectors.
+
+    Each file is written under a temporary name and renamed into place.
+    """
+    paths = segment_paths(index_dir, name, codes_tag(scheme, pq_subvectors))
+    if scheme == "none" or not rows:
+        return
+    vectors = np.memmap(paths["vectors"], dtype=np.float32, mode="r", shape=(rows, dim))
+    quantizer = train_quantizer(vectors, scheme, pq_subvectors=pq_subvectors)
+    tmp = paths["codes"].with_suffix(".tmp")
+    with tmp.open("wb") as f:
+        np.save(f, encode_blocks(quantizer, vectors))
+    tmp.replace(paths["codes"])
+    tmp = paths["quantizer"].with_suffix(".tmp")
+    quantizer.save(tmp)
+    tmp.replace(paths["quantizer"])
+
+
+class ChunkFile:
+    """Open chunk-record file of one segment, shared by its readers.
+
+    Snapshots share segment files, so the handles of successive snapshots of
+    one index share one file descriptor. It stays open while anything holds
+    it, which keeps the records readable after the file is unlinked, and
+    `collect_garbage` leaves files held in this process in place. Reads after
+    the last release open the file per record.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.file: BinaryIO | None = path.open("rb")
+        self.refs = 0
+        self.lock = threading.Lock()
+
+    def read(self, offset: int) -> bytes:
+        with self.lock:
+            if self.file is not None:
+                self.file.seek(offset)
+                return self.file.readline()
+        with self.path.open("rb") as f:
+            f.seek(offset)
+            return f.readline()
+
+
+_chunk_files: dict[Path, ChunkFile] = {}
+_chunk_files_lock = threading.Lock()
+
+
+def acquire_chunk_file(path: Path) -> ChunkFile:
+    """Take a hold on the shared open `ChunkFile` for `path`."""
+    path = path.resolve()
+    with _chunk_files_lock:
+        chunks = _chunk_files.get(path)
+        if chunks is None:
+            chunks = _chunk_files[path] = ChunkFile(path)
+        chunks.refs += 1
+        return chunks
+
+
+def release_chunk_file(chunks: ChunkFile) -> None:
+    """Drop a hold; the last one closes the file."""
+    with _chunk_files_lock:
+        chunks.refs -= 1
+        if chunks.refs > 0:
+            return
+        if _chunk_files.get(chunks.path) is chunks:
+            del _chunk_files[chunks.path]
+    with chunks.lock:
+        if chunks.file is not None:
+            chunks.file.close()
+            chunks.file = None
+
+
+def held_chunk_files() -> set[Path]:
+    """Resolved paths of the chunk files held open in this process."""
+    with _chunk_files_lock:
+        return set(_chunk_files)
+
+
+class SegmentWriter:
+    """Append-only writer for one segment.
+
+    Vectors are appended as raw float32 rows and chunk records as JSON lines, so
+    a segment can be written batch by batch without holding it in memory. The
+    byte offset of every record is kept so readers can fetch single chunks, and
+    the chunk texts feed the segment's BM25 postings.
+    """
+
+    def __init__(self, index_dir: Path, name: str, dim: int = 0):
+        self.name = name
+        self.dim = dim
+        self.rows = 0
+        self._paths = segment_paths(index_dir, name)
+        self._paths["vectors"].parent.mkdir(parents=True, exist_ok=True)
+        self._vectors = self._paths["vectors"].open("wb")
+        self._chunks = self._paths["chunks"].open("wb")
+        self._offsets: list[int] = []
+        self._postings = PostingsBuilder()
+
+    def append(self, vectors: np.ndarray, records: list[dict[str, Any]]) -> None:
+        if len(vectors) != len(records):
+            raise ValueError("vectors and records must have the same length")
+        if not records:
+            return
+        if not self.dim:
+            self.dim = int(vectors.shape[1])
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"expected dim {self.dim}, got {vectors.shape[1]}")
+        self._vectors.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        for record in records:
+            self._offsets.append(self._chunks.tell())
+            self._chunks.write(json.dumps(record, ensure_ascii=False).encode("utf-8"))
+            self._chunks.write(b"\n")
+            self._postings.add(record.get("text", ""))
+        self.rows += len(records)
+
+    def close(self) -> None:
+        self._vectors.close()
+        self._chunks.close()
+        np.asarray(self._offsets, dtype=np.int64).tofile(self._paths["offsets"])
+        self._postings.write(self._paths["lexical"])
+
+    def discard(self) -> None:
+        self._vectors.close()
+        self._chunks.close()
+        for path in self._paths.values():
+            path.unlink(missing_ok=True)
@@ -0,0 +1,127 @@
+"""Immutable index snapshots behind an atomically swapped pointer.
+
+Layout of one index dir:
+
+    CURRENT                      name of the live snapshot, e.g. `gen-000007`
+    snapshots/gen-000007/manifest.json
+    segments/seg-000003.*        segment files, shared between snapshots
+
+Segment files are never rewritten once a snapshot references them, and a
+snapshot directory is never modified after it is published. Ingestion
+publishes a new snapshot and then replaces `CURRENT` with a rename, so a
+reader sees either the old or the new index, never a mix. Snapshots beyond
+the newest `keep` (and the segment files only they referenced) are removed
+afterwards; readers holding an older snapshot open keep their mapped and
+open files, and segments still held open in this process are left for a
+later collection.
+"""
+
+from __future__ import annotations
+
+import shutil
+from pathlib import Path
+
+from app.retrieval.indexing.manifest import MANIFEST_FILENAME, IndexManifest
+from app.retrieval.indexing.segments import (
+    SEGMENTS_DIRNAME,
+    held_chunk_files,
+    segment_paths,
+)
+
+CURRENT_FILENAME = "CURRENT"
+SNAPSHOTS_DIRNAME = "snapshots"
+# Reads of `CURRENT` and its manifest while garbage collection races them
+_LOAD_ATTEMPTS = 3
+
+
+def snapshot_name(generation: int) -> str:
+    return f"gen-{generation:06d}"
+
+
+def current_snapshot(index_dir: Path) -> str | None:
+    """Name of the snapshot `CURRENT` points at, or None before the first publish."""
+    try:
+        name = (index_dir / CURRENT_FILENAME).read_text(encoding="utf-8").strip()
+    except FileNotFoundError:
+        return None
+    return name or None
+
+
+def load_snapshot(index_dir: Path) -> tuple[str | None, IndexManifest | None]:
+    """Resolve `CURRENT` and load that snapshot's manifest.
+
+    Index dirs written before snapshots existed keep their manifest at the top
+    level; it is returned with a snapshot name of None. If `collect_garbage`
+    removes the snapshot between reading `CURRENT` and its manifest, the
+    pointer is read again.
+    """
+    name = current_snapshot(index_dir)
+    for _ in range(_LOAD_ATTEMPTS):
+        if name is None:
+            return None, IndexManifest.load(index_dir)
+        try:
+            manifest = IndexManifest.load(index_dir / SNAPSHOTS_DIRNAME / name)
+        except FileNotFoundError:
+            manifest = None
+        latest = current_snapshot(index_dir)
+        if manifest is not None or latest == name:
+            return name, manifest
+        name = latest
+    return name, None
+
+
+def publish_snapshot(manifest: IndexManifest, index_dir: Path) -> str:
+    """Write `manifest` as a new snapshot and point `CURRENT` at it."""
+    name = snapshot_name(manifest.generation)
+    manifest.save(index_dir / SNAPSHOTS_DIRNAME / name)
+    pointer = index_dir / CURRENT_FILENAME
+    tmp = pointer.with_suffix(".tmp")
+    tmp.write_text(name, encoding="utf-8")
+    tmp.replace(pointer)
+    (index_dir / MANIFEST_FILENAME).unlink(missing_ok=True)
+    return name
+
+
+def collect_garbage(index_dir: Path, keep: int = 3) -> int:
+    """Remove all but the newest `keep` snapshots and unreferenced segment files.
+
+    Returns:
+        int: Number of snapshots removed.
+    """
+    root = index_dir / SNAPSHOTS_DIRNAME
+    if not root.is_dir():
+        return 0
+    current = current_snapshot(index_dir)
+    names = sorted(p.name for p in root.iterdir() if p.is_dir())
+    kept = set(names[-max(1, keep) :])
+    if current is not None:
+        kept.add(current)
+
+    removed = 0
+    for name in names:
+        if name not in kept:
+            shutil.rmtree(root / name, ignore_errors=True)
+            removed += 1
+
+    referenced: set[Path] = set()
+    for name in kept:
+        manifest = IndexManifest.load(root / name)
+        if manifest is None:
+            continue
+        for segment in manifest.segments:
+            referenced.update(
+                segment_paths(index_dir, segment.name, manifest.codes_tag).values()
+            )
+    segments_dir = index_dir / SEGMENTS_DIRNAME
+    if segments_dir.is_dir():
+        # Segments an open handle in this process still reads stay until a
+        # later collection
+        held = {
+            p.name.split(".", 1)[0]
+            for p in held_chunk_files()
+            if p.parent == segments_dir.resolve()
+        }
+        for path in segments_dir.iterdir():
+            if path not in referenced and path.name.split(".", 1)[0] not in held:
+                path.unlink(missing_ok=True)
+    return removed
@@ -0,0 +1,14 @@
+"""On-disk layout of indexes: `<index_root>/<company-slug>/<version>/`."""
+
+import re
+from pathlib import Path
+
+_SLUG_RE = re.compile(r"[^a-z0-9]+")
+
+
+def company_slug(company: str) -> str:
+    return _SLUG_RE.sub("-", company.lower()).strip("-") or "unknown"
+
+
+def index_dir_for(index_root: Path, company: str, version: str) -> Path:
+    return index_root / company_slug(company) / version
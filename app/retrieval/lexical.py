@@ -0,0 +1,169 @@
+"""Compact BM25 inverted index.
+
+Each segment gets its own postings file, written at ingestion time: a sorted
+term array, CSR-style term offsets, and parallel arrays of row ids and term
+frequencies. IDF is computed once per opened index over the document
+frequencies of all its segments, so queries only touch the postings of their
+own terms.
+"""
+
+from __future__ import annotations
+
+import re
+from array import array
+from pathlib import Path
+
+import numpy as np
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def tokenize(text: str) -> list[str]:
+    return TOKEN_RE.findall(text.lower())
+
+
+class PostingsBuilder:
+    """Accumulates term frequencies for the rows of one segment.
+
+    Postings are kept in flat typed arrays (term id, row, tf) rather than
+    per-term Python lists, so a large segment costs ~12 bytes per posting.
+    """
+
+    def __init__(self) -> None:
+        self._term_ids: dict[str, int] = {}
+        self._terms = array("I")
+        self._rows = array("I")
+        self._tfs = array("I")
+        self._doc_len = array("I")
+
+    def add(self, text: str) -> None:
+        row = len(self._doc_len)
+        tokens = tokenize(text)
+        counts: dict[str, int] = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        for term, tf in counts.items():
+            self._terms.append(self._term_ids.setdefault(term, len(self._term_ids)))
+            self._rows.append(row)
+            self._tfs.append(tf)
+        self._doc_len.append(len(tokens))
+
+    def write(self, path: Path) -> None:
+        vocab = np.asarray(list(self._term_ids), dtype=np.str_)
+        by_term = np.argsort(vocab, kind="stable")
+        rank = np.empty(len(vocab), dtype=np.int64)
+        rank[by_term] = np.arange(len(vocab))
+        keys = rank[np.frombuffer(self._terms, dtype=np.uint32)]
+        # Stable sort keeps each term's postings in row order
+        order = np.argsort(keys, kind="stable")
+        offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(keys, minlength=len(vocab)), out=offsets[1:])
+        tfs = np.frombuffer(self._tfs, dtype=np.uint32)[order]
+        if tfs.size == 0 or tfs.max() <= np.iinfo(np.uint16).max:
+            tfs = tfs.astype(np.uint16)
+        with path.open("wb") as f:
+            np.savez(
+                f,
+                terms=vocab[by_term],
+                offsets=offsets,
+                rows=np.frombuffer(self._rows, dtype=np.uint32)[order].astype(np.int32),
+                tfs=tfs,
+                doc_len=np.frombuffer(self._doc_len, dtype=np.uint32).astype(np.int32),
+            )
+
+
+class SegmentPostings:
+    def __init__(self, path: Path | None, rows: int):
+        if path is not None and path.exists():
+            with np.load(path) as data:
+                self.terms = data["terms"]
+                self.offsets = data["offsets"]
+                self.rows = data["rows"]
+                self.tfs = data["tfs"].astype(np.float32)
+                self.doc_len = data["doc_len"].astype(np.float32)
+        else:
+            self.terms = np.zeros(0, dtype=np.str_)
+            self.offsets = np.zeros(1, dtype=np.int64)
+            self.rows = np.zeros(0, dtype=np.int32)
+            self.tfs = np.zeros(0, dtype=np.float32)
+            self.doc_len = np.zeros(rows, dtype=np.float32)
+        self.idf = np.zeros(len(self.terms), dtype=np.float32)
+        # BM25 length normalisation per row; set together with idf
+        self.norm = np.full(len(self.doc_len), BM25_K1, dtype=np.float32)
+
+    @property
+    def doc_freq(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    @property
+    def nbytes(self) -> int:
+        return int(
+            self.terms.nbytes
+            + self.offsets.nbytes
+            + self.rows.nbytes
+            + self.tfs.nbytes
+            + self.doc_len.nbytes
+            + self.idf.nbytes
+            + self.norm.nbytes
+        )
+
+    def lookup(self, term: str) -> int:
+        i = int(np.searchsorted(self.terms, term))
+        return i if i < len(self.terms) and self.terms[i] == term else -1
+
+
+def assign_idf(segments: list[SegmentPostings]) -> None:
+    """Precompute IDF and length normalisation for every segment of an index.
+
+    Document frequencies and the average chunk length are taken over all
+    segments together, so scores are comparable across segments.
+    """
+    n_docs = sum(len(s.doc_len) for s in segments)
+    if not n_docs:
+        return
+    avg_doc_len = max(float(sum(s.doc_len.sum() for s in segments) / n_docs), 1e-9)
+    for s in segments:
+        s.norm = (BM25_K1 * (1 - BM25_B + BM25_B * s.doc_len / avg_doc_len)).astype(
+            np.float32
+        )
+    all_terms = np.concatenate([s.terms for s in segments])
+    if len(all_terms):
+        _, inverse = np.unique(all_terms, return_inverse=True)
+        df = np.bincount(
+            inverse, weights=np.concatenate([s.doc_freq for s in segments])
+        )
+        idf = np.log1p((n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+        start = 0
+        for s in segments:
+            s.idf = idf[inverse[start : start + len(s.terms)]]
+            start += len(s.terms)
+
+
+def bm25_scores(
+    postings: SegmentPostings, terms: list[str]
+) -> tuple[np.ndarray, np.ndarray]:
+    """Score the rows of one segment that contain any of `terms`.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: Local row ids and their BM25 scores.
+    """
+    row_parts: list[np.ndarray] = []
+    score_parts: list[np.ndarray] = []
+    for term in set(terms):
+        i = postings.lookup(term)
+        if i < 0:
+            continue
+        lo, hi = postings.offsets[i], postings.offsets[i + 1]
+        rows = postings.rows[lo:hi]
+        tf = postings.tfs[lo:hi]
+        row_parts.append(rows)
+        score_parts.append(
+            postings.idf[i] * tf * (BM25_K1 + 1) / (tf + postings.norm[rows])
+        )
+    if not row_parts:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    rows, inverse = np.unique(np.concatenate(row_parts), return_inverse=True)
+    scores = np.bincount(inverse, weights=np.concatenate(score_parts))
+    return rows.astype(np.int64), scores.astype(np.float32)
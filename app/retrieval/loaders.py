@@ -0,0 +1,193 @@
+"""Streaming source document loaders (V003 ingestion).
+
+A loader yields a document's text lazily as `Section`s. The concatenated
+section texts are the document's text. Chunk offsets (and the `#char=`
+citations built from them) index into that text:
+
+- Text and Markdown (`.txt`, `.md`, `.csv`, `.json`, ...): the file is
+  memory-mapped and decoded block by block. Newlines are normalised as in
+  `Path.read_text`, so offsets match a text-mode read of the file.
+- HTML: fed block by block to a stream parser that drops tags, scripts and
+  styles and breaks lines at block elements. Offsets index the extracted
+  text.
+- PDF: extracted one page at a time with `pypdf` (an optional dependency).
+  Pages are separated by a blank line, and each section carries its page
+  number.
+
+Nothing holds a whole document, so chunking memory is bounded by the block
+size and the chunk window (see `app.retrieval.indexing.chunking.iter_chunks`).
+"""
+
+from __future__ import annotations
+
+import codecs
+import importlib.util
+import io
+import mmap
+import re
+from collections.abc import Iterator
+from dataclasses import dataclass
+from html.parser import HTMLParser
+from pathlib import Path
+
+TEXT_SUFFIXES = {".txt", ".md", ".markdown", ".csv", ".json"}
+HTML_SUFFIXES = {".html", ".htm"}
+PDF_SUFFIXES = {".pdf"}
+BLOCK_CHARS = 1 << 20
+
+HTML_SKIP_TAGS = frozenset({"script", "style", "noscript", "template", "head"})
+_HTML_BLOCK = {
+    "address", "article", "aside", "blockquote", "br", "dd", "div", "dl", "dt",
+    "figcaption", "figure", "footer", "form", "h1", "h2", "h3", "h4", "h5",
+    "h6", "header", "hr", "li", "main", "nav", "ol", "p", "pre", "section",
+    "table", "td", "th", "tr", "ul",
+}  # fmt: skip
+_SPACES = re.compile(r"\s+")
+
+
+@dataclass(frozen=True)
+class Section:
+    """A slice of a document's text.
+
+    Attributes:
+        text: The slice.
+        start: Offset of `text[0]` in the document's text.
+        page: 1-based page number for paged formats (PDF), else None.
+    """
+
+    text: str
+    start: int
+    page: int | None = None
+
+
+def pdf_available() -> bool:
+    return importlib.util.find_spec("pypdf") is not None
+
+
+def supported_suffixes() -> set[str]:
+    """File suffixes with a loader; PDF only when `pypdf` is installed."""
+    suffixes = TEXT_SUFFIXES | HTML_SUFFIXES
+    if pdf_available():
+        suffixes |= PDF_SUFFIXES
+    return suffixes
+
+
+def iter_sections(path: Path, block_chars: int = BLOCK_CHARS) -> Iterator[Section]:
+    """Yield the sections of `path` with the loader for its suffix.
+
+    Raises:
+        ValueError: If no loader handles the suffix.
+    """
+    suffix = path.suffix.lower()
+    if suffix in TEXT_SUFFIXES:
+        pieces = _iter_text(path, block_chars)
+    elif suffix in HTML_SUFFIXES:
+        pieces = _iter_html(path, block_chars)
+    elif suffix in PDF_SUFFIXES:
+        yield from _iter_pdf(path)
+        return
+    else:
+        raise ValueError(f"No loader for {suffix or 'files without a suffix'}")
+    offset = 0
+    for text in pieces:
+        if text:
+            yield Section(text, offset)
+            offset += len(text)
+
+
+def load_text(path: Path) -> str:
+    """Whole extracted text of `path`; for small documents and previews."""
+    return "".join(section.text for section in iter_sections(path))
+
+
+def _iter_text(path: Path, block_chars: int) -> Iterator[str]:
+    with path.open("rb") as f:
+        if not path.stat().st_size:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            decoder = io.IncrementalNewlineDecoder(
+                codecs.getincrementaldecoder("utf-8")(errors="replace"),
+                translate=True,
+            )
+            for pos in range(0, len(mm), block_chars):
+                yield decoder.decode(mm[pos : pos + block_chars])
+            yield decoder.decode(b"", final=True)
+
+
+class HtmlTextExtractor(HTMLParser):
+    """Collects visible text; `drain()` hands over what was parsed so far.
+
+    Text inside `skip_tags` is dropped (scripts and styles by default).
+    """
+
+    def __init__(self, skip_tags: frozenset[str] = HTML_SKIP_TAGS):
+        super().__init__(convert_charrefs=True)
+        self.skip_tags = skip_tags
+        self._parts: list[str] = []
+        self._skip = 0
+        # Pending line break, emitted before the next text so none trail
+        self._break = False
+        self._started = False
+        self._space = False
+
+    def handle_starttag(self, tag: str, attrs: list) -> None:
+        if tag in self.skip_tags:
+            self._skip += 1
+        elif tag in _HTML_BLOCK:
+            self._break = True
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag in self.skip_tags:
+            self._skip = max(0, self._skip - 1)
+        elif tag in _HTML_BLOCK:
+            self._break = True
+
+    def handle_data(self, data: str) -> None:
+        if self._skip:
+            return
+        text = _SPACES.sub(" ", data)
+        # Data may arrive split across feeds; don't double a space at the seam
+        if self._break or not self._started or self._space:
+            text = text.lstrip()
+        if not text:
+            return
+        if self._break and self._started:
+            self._parts.append("\n")
+        self._parts.append(text)
+        self._space = text.endswith(" ")
+        self._break = False
+        self._started = True
+
+    def drain(self) -> str:
+        text = "".join(self._parts)
+        self._parts = []
+        return text
+
+
+def _iter_html(path: Path, block_chars: int) -> Iterator[str]:
+    parser = HtmlTextExtractor()
+    with path.open(encoding="utf-8", errors="replace") as f:
+        while block := f.read(block_chars):
+            parser.feed(block)
+            yield parser.drain()
+    parser.close()
+    yield parser.drain()
+
+
+def _iter_pdf(path: Path) -> Iterator[Section]:
+    try:
+        from pypdf import PdfReader  # type: ignore
+    except ImportError as e:
+        raise RuntimeError("pypdf is required to load PDF sources") from e
+
+    offset = 0
+    with path.open("rb") as f:
+        reader = PdfReader(f)
+        for number, page in enumerate(reader.pages, start=1):
+            text = (page.extract_text() or "").strip()
+            if not text:
+                continue
+            if offset:
+                text = "\n\n" + text
+            yield Section(text, offset, page=number)
+            offset += len(text)
@@ -0,0 +1,178 @@
+"""Metadata pre-filter index.
+
+Every document's chunks occupy one contiguous row range, so per-document
+metadata (company, source type, date) maps to row ranges without storing a
+value per row. Filters resolve to the sorted rows they allow before any
+similarity scoring, so a filtered query costs time proportional to the
+matching rows rather than to the whole index.
+
+Metadata is read from the document where it says so, so one index can hold
+several companies' documents:
+
+- `company`: the `company:` key of a front-matter block (a `---` fenced block
+  of `key: value` lines opening a text or Markdown file), else the company
+  the index was ingested for.
+- `date`: the front-matter `date:`, else a `YYYY-MM-DD` or `YYYYMMDD` date in
+  the file name, else the file's modification time. The last changes when a
+  file is copied or checked out, so date filters are only as good as it.
+
+Filters (`retrieve(..., filters=...)`):
+- `company`, `source_type`: a value or a list of accepted values; companies
+  compare by slug, so `"Acme"` matches `"ACME"`.
+- `date_from`, `date_to`: inclusive ISO dates (`YYYY-MM-DD`).
+"""
+
+from __future__ import annotations
+
+import bisect
+import re
+from datetime import UTC, date, datetime
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+from app.retrieval.indexing.manifest import IndexManifest
+from app.retrieval.layout import company_slug
+from app.retrieval.loaders import TEXT_SUFFIXES
+
+FILTER_KEYS = ("company", "source_type", "date_from", "date_to")
+
+# Front matter is looked for in this much of the file
+_FRONT_MATTER_CHARS = 4096
+_FRONT_MATTER_LINE = re.compile(r"^\s*([A-Za-z_][\w-]*)\s*:\s*(.*?)\s*$")
+_FILENAME_DATE = re.compile(r"(?<!\d)(\d{4})-?(\d{2})-?(\d{2})(?!\d)")
+
+
+def front_matter(path: Path) -> dict[str, str]:
+    """`key: value` pairs of a front-matter block opening a text file."""
+    if path.suffix.lower() not in TEXT_SUFFIXES:
+        return {}
+    with path.open("r", encoding="utf-8", errors="replace") as f:
+        head = f.read(_FRONT_MATTER_CHARS)
+    lines = head.lstrip("\ufeff").splitlines()
+    if not lines or lines[0].strip() != "---":
+        return {}
+    meta: dict[str, str] = {}
+    for line in lines[1:]:
+        if line.strip() in ("---", "..."):
+            return meta
+        match = _FRONT_MATTER_LINE.match(line)
+        if match:
+            meta[match.group(1).lower()] = match.group(2).strip("\"'")
+    # Unterminated within the window: not front matter
+    return {}
+
+
+def _iso_date(text: str) -> str | None:
+    try:
+        return date.fromisoformat(text[:10]).isoformat()
+    except ValueError:
+        return None
+
+
+def _filename_date(path: Path) -> str | None:
+    for match in _FILENAME_DATE.finditer(path.stem):
+        found = _iso_date("-".join(match.groups()))
+        if found:
+            return found
+    return None
+
+
+def document_metadata(company: str, path: Path) -> dict[str, str]:
+    """Metadata recorded for a source document at ingestion.
+
+    Args:
+        company: Company the index is ingested for; the default `company`.
+        path: Source file.
+    """
+    meta = front_matter(path)
+    doc_date = (
+        _iso_date(meta.get("date", ""))
+        or _filename_date(path)
+        or datetime.fromtimestamp(path.stat().st_mtime, tz=UTC).date().isoformat()
+    )
+    return {
+        "company": meta.get("company") or company,
+        "source_type": path.suffix.lower().lstrip(".") or "unknown",
+        "date": doc_date,
+    }
+
+
+def _rows(ranges: list[tuple[int, int]]) -> np.ndarray:
+    if not ranges:
+        return np.zeros(0, dtype=np.int64)
+    return np.unique(
+        np.concatenate([np.arange(s, e, dtype=np.int64) for s, e in ranges])
+    )
+
+
+class MetadataIndex:
+    """Value -> row ranges per metadata field, built from an index manifest."""
+
+    def __init__(self, manifest: IndexManifest):
+        self._ranges: dict[str, dict[str, list[tuple[int, int]]]] = {
+            "company": {},
+            "source_type": {},
+        }
+        dated: list[tuple[str, int, int]] = []
+        for rel, entry in manifest.documents.items():
+            if entry.chunk_end <= entry.chunk_start:
+                continue
+            span = (entry.chunk_start, entry.chunk_end)
+            meta = entry.metadata
+            # Entries written before metadata was recorded
+            company = company_slug(meta.get("company") or manifest.company)
+            source_type = meta.get("source_type") or (
+                Path(rel).suffix.lower().lstrip(".") or "unknown"
+            )
+            self._ranges["company"].setdefault(company, []).append(span)
+            self._ranges["source_type"].setdefault(source_type, []).append(span)
+            if meta.get("date"):
+                dated.append((meta["date"], *span))
+        dated.sort()
+        self._dates = [d for d, _, _ in dated]
+        self._dated_spans = [(s, e) for _, s, e in dated]
+
+    def values(self, key: str) -> list[str]:
+        return sorted(self._ranges.get(key, {}))
+
+    def rows(self, filters: dict[str, Any]) -> np.ndarray | None:
+        """Sorted global rows matching every filter (live or not).
+
+        Returns None when no filter is set, i.e. every row is allowed.
+
+        Raises:
+            ValueError: On an unknown filter key.
+        """
+        unknown = set(filters) - set(FILTER_KEYS)
+        if unknown:
+            raise ValueError(f"Unsupported filter keys: {sorted(unknown)}")
+
+        selected: np.ndarray | None = None
+        for key in ("company", "source_type"):
+            if filters.get(key) in (None, "", []):
+                continue
+            wanted = filters[key]
+            values = [wanted] if isinstance(wanted, str) else list(wanted)
+            if key == "company":
+                values = [company_slug(str(v)) for v in values]
+            ranges = [r for v in values for r in self._ranges[key].get(str(v), [])]
+            rows = _rows(ranges)
+            selected = (
+                rows if selected is None else np.intersect1d(selected, rows, True)
+            )
+
+        if filters.get("date_from") or filters.get("date_to"):
+            lo = bisect.bisect_left(self._dates, str(filters.get("date_from") or ""))
+            hi = (
+                bisect.bisect_right(self._dates, str(filters["date_to"]))
+                if filters.get("date_to")
+                else len(self._dates)
+            )
+            rows = _rows(self._dated_spans[lo:hi])
+            selected = (
+                rows if selected is None else np.intersect1d(selected, rows, True)
+            )
+
+        return selected
@@ -0,0 +1,181 @@
+"""Compressed vector codes for index segments.
+
+Schemes (`index.quantization`):
+- `none`: search the float32 vectors directly.
+- `int8`: per-dimension symmetric scalar quantization, 4x smaller.
+- `pq`: product quantization with 256 centroids per subvector, one byte per
+  subvector (`index.pq_subvectors`), e.g. 16 bytes per 768-dim vector.
+
+Codes are derived from the segment's float32 vectors, which stay on disk so the
+best candidates can be re-scored exactly.
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+
+import numpy as np
+
+QUANTIZATION_SCHEMES = ("none", "int8", "pq")
+_BLOCK_ROWS = 8192
+_PQ_CENTROIDS = 256
+_PQ_TRAIN_ROWS = 10_000
+_KMEANS_ITERS = 12
+
+
+def _blocks(n: int):
+    for start in range(0, n, _BLOCK_ROWS):
+        yield start, min(start + _BLOCK_ROWS, n)
+
+
+class ScalarQuantizer:
+    def __init__(self, scale: np.ndarray):
+        self.scale = scale.astype(np.float32)
+
+    @classmethod
+    def train(cls, vectors: np.ndarray) -> ScalarQuantizer:
+        peak = np.zeros(vectors.shape[1], dtype=np.float32)
+        for lo, hi in _blocks(len(vectors)):
+            np.maximum(peak, np.abs(vectors[lo:hi]).max(axis=0), out=peak)
+        peak[peak == 0] = 1.0
+        return cls(peak / 127.0)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        return np.clip(np.rint(vectors / self.scale), -127, 127).astype(np.int8)
+
+    def scores(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        """Scores of `codes` against one query (dim,) or a batch (n, dim)."""
+        q = (np.atleast_2d(query) * self.scale).astype(np.float32)
+        out = np.empty((len(q), len(codes)), dtype=np.float32)
+        for lo, hi in _blocks(len(codes)):
+            out[:, lo:hi] = q @ codes[lo:hi].astype(np.float32).T
+        return out[0] if query.ndim == 1 else out
+
+    def save(self, path: Path) -> None:
+        with path.open("wb") as f:
+            np.savez(f, scheme="int8", scale=self.scale)
+
+
+def _kmeans(x: np.ndarray, k: int, rng: np.random.Generator) -> np.ndarray:
+    x = np.ascontiguousarray(x)
+    centroids = x[rng.choice(len(x), size=k, replace=False)].copy()
+    for _ in range(_KMEANS_ITERS):
+        # ||x||^2 is constant per row, so it doesn't change the nearest centroid
+        dist = x @ (-2 * centroids.T)
+        dist += (centroids**2).sum(axis=1)
+        assign = dist.argmin(axis=1)
+        counts = np.bincount(assign, minlength=k)
+        sums = np.stack(
+            [
+                np.bincount(assign, weights=x[:, d], minlength=k)
+                for d in range(x.shape[1])
+            ],
+            axis=1,
+        )
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+    return centroids
+
+
+class ProductQuantizer:
+    def __init__(self, centroids: np.ndarray):
+        # (m, k, dsub)
+        self.centroids = centroids.astype(np.float32)
+
+    @property
+    def m(self) -> int:
+        return self.centroids.shape[0]
+
+    @classmethod
+    def train(cls, vectors: np.ndarray, m: int, *, seed: int = 0) -> ProductQuantizer:
+        n, dim = vectors.shape
+        m = max(1, min(m, dim))
+        while dim % m:
+            m -= 1
+        rng = np.random.default_rng(seed)
+        sample = np.asarray(
+            vectors[np.sort(rng.choice(n, size=min(n, _PQ_TRAIN_ROWS), replace=False))],
+            dtype=np.float32,
+        )
+        k = min(_PQ_CENTROIDS, len(sample))
+        dsub = dim // m
+        centroids = np.stack(
+            [_kmeans(sample[:, j * dsub : (j + 1) * dsub], k, rng) for j in range(m)]
+        )
+        return cls(centroids)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        m, _, dsub = self.centroids.shape
+        codes = np.empty((len(vectors), m), dtype=np.uint8)
+        for j in range(m):
+            sub = vectors[:, j * dsub : (j + 1) * dsub]
+            c = self.centroids[j]
+            dist = sub @ (-2 * c.T)
+            dist += (c**2).sum(axis=1)
+            codes[:, j] = dist.argmin(axis=1)
+        return codes
+
+    def scores(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        """Scores of `codes` against one query (dim,) or a batch (n, dim)."""
+        # Asymmetric distance computation: one lookup table per query
+        m, _, dsub = self.centroids.shape
+        q = np.atleast_2d(query)
+        lut = np.einsum("mkd,nmd->nmk", self.centroids, q.reshape(len(q), m, dsub))
+        out = np.empty((len(q), len(codes)), dtype=np.float32)
+        cols = np.arange(m)
+        for lo, hi in _blocks(len(codes)):
+            out[:, lo:hi] = lut[:, cols, codes[lo:hi]].sum(axis=2)
+        return out[0] if query.ndim == 1 else out
+
+    def save(self, path: Path) -> None:
+        with path.open("wb") as f:
+            np.savez(f, scheme="pq", centroids=self.centroids)
+
+
+Quantizer = ScalarQuantizer | ProductQuantizer
+
+
+def codes_tag(scheme: str, pq_subvectors: int = 0) -> str:
+    """File tag of a segment's codes under `scheme`; empty when there are none.
+
+    Codes for different settings live side by side, so re-quantizing never
+    rewrites files an older index snapshot still reads.
+    """
+    if scheme == "none":
+        return ""
+    if scheme == "pq":
+        return f"pq{pq_subvectors}"
+    return scheme
+
+
+def train_quantizer(
+    vectors: np.ndarray, scheme: str, *, pq_subvectors: int = 16
+) -> Quantizer | None:
+    if scheme == "none":
+        return None
+    if scheme == "int8":
+        return ScalarQuantizer.train(vectors)
+    if scheme == "pq":
+        return ProductQuantizer.train(vectors, pq_subvectors)
+    raise ValueError(f"Unsupported quantization scheme: {scheme}")
+
+
+def load_quantizer(path: Path) -> Quantizer | None:
+    if not path.exists():
+        return None
+    with np.load(path) as data:
+        scheme = str(data["scheme"])
+        if scheme == "int8":
+            return ScalarQuantizer(data["scale"])
+        return ProductQuantizer(data["centroids"])
+
+
+def encode_blocks(quantizer: Quantizer, vectors: np.ndarray) -> np.ndarray:
+    """Encode `vectors` (possibly a memmap) block by block."""
+    return np.concatenate(
+        [
+            quantizer.encode(np.asarray(vectors[lo:hi]))
+            for lo, hi in _blocks(len(vectors))
+        ]
+        or [quantizer.encode(np.zeros((0, vectors.shape[1]), dtype=np.float32))]
+    )
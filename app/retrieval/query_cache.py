@@ -0,0 +1,153 @@
+"""Query-level retrieval cache.
+
+Keys include the index version, generation and build id, so any re-ingestion
+of a company, or a rebuild of its index from scratch, makes its old entries
+unreachable; they age out of the LRU (and can be pruned from disk) without
+explicit invalidation.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split()).strip(" ?.!")
+
+
+def cache_key(
+    company: str,
+    query: str,
+    *,
+    top_k: int,
+    min_score: float,
+    mode: str,
+    index_version: str,
+    options: dict[str, Any] | None = None,
+) -> str:
+    """Key of one retrieval; `options` holds any other settings shaping the result."""
+    raw = json.dumps(
+        [
+            company,
+            normalize_query(query),
+            top_k,
+            round(min_score, 6),
+            mode,
+            index_version,
+            options or {},
+        ],
+        sort_keys=True,
+    )
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class QueryCache:
+    """In-process LRU of retrieval results with an optional on-disk tier.
+
+    Values are JSON-serialisable dicts; the retriever stores the rows and
+    scores of a result, not the passages themselves.
+    """
+
+    def __init__(self, max_entries: int = 4096, disk_dir: Path | None = None):
+        self.max_entries = max(1, max_entries)
+        self.disk_dir = disk_dir
+        self._entries: OrderedDict[str, dict[str, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _disk_path(self, key: str) -> Path | None:
+        if self.disk_dir is None:
+            return None
+        return self.disk_dir / key[:2] / f"{key}.json"
+
+    def _remember(self, key: str, value: dict[str, Any]) -> None:
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key: str) -> dict[str, Any] | None:
+        """Cached value of `key`, or None.
+
+        Entries in an older format (anything but a dict) count as misses, so
+        the caller recomputes and overwrites them.
+        """
+        with self._lock:
+            value = self._entries.get(key)
+            if isinstance(value, dict):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+
+        path = self._disk_path(key)
+        if path is not None and path.exists():
+            try:
+                value = json.loads(path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                value = None
+            if isinstance(value, dict):
+                with self._lock:
+                    self.disk_hits += 1
+                    self._remember(key, value)
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, value: dict[str, Any]) -> None:
+        with self._lock:
+            self._remember(key, value)
+        path = self._disk_path(key)
+        if path is not None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(f".{threading.get_ident()}.tmp")
+            tmp.write_text(json.dumps(value, ensure_ascii=False), encoding="utf-8")
+            tmp.replace(path)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
+
+
+_default_cache: QueryCache | None = None
+_default_lock = threading.Lock()
+
+
+def get_query_cache(config: dict[str, Any] | None = None) -> QueryCache | None:
+    """Return the process-wide cache configured by `retriever.cache`, if enabled."""
+    global _default_cache
+    cache_cfg = dict(((config or {}).get("retriever", {}) or {}).get("cache", {}) or {})
+    if not cache_cfg.get("enabled", True):
+        return None
+    with _default_lock:
+        if _default_cache is None:
+            disk_dir = str(cache_cfg.get("disk_dir", "") or "")
+            _default_cache = QueryCache(
+                max_entries=int(cache_cfg.get("max_entries", 4096)),
+                disk_dir=Path(disk_dir) if disk_dir else None,
+            )
+        return _default_cache
+
+
+def default_query_cache() -> QueryCache | None:
+    """Return the process-wide cache if one has been created, without creating it."""
+    return _default_cache
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Benchmark memory saved versus recall lost by the index quantization schemes.
+
+Builds a synthetic clustered corpus of L2-normalised vectors, encodes it with
+each scheme and compares top-k results against exact float32 search, with and
+without exact re-scoring of the best candidates.
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from app.retrieval.quantization import encode_blocks, train_quantizer
+
+
+def _corpus(n: int, dim: int, clusters: int, rng: np.random.Generator) -> np.ndarray:
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    x = centers[rng.integers(0, clusters, n)] + 0.3 * rng.standard_normal(
+        (n, dim)
+    ).astype(np.float32)
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+def benchmark(
+    n: int = 20_000,
+    dim: int = 256,
+    queries: int = 200,
+    k: int = 10,
+    rescore_factor: int = 4,
+    pq_subvectors: int = 32,
+) -> list[dict[str, float | str]]:
+    rng = np.random.default_rng(42)
+    corpus = _corpus(n, dim, 64, rng)
+    qs = _corpus(queries, dim, 64, rng)
+    truth = [set(_top_k(corpus @ q, k).tolist()) for q in qs]
+
+    rows: list[dict[str, float | str]] = []
+    for scheme in ("none", "int8", "pq"):
+        t0 = time.perf_counter()
+        quantizer = train_quantizer(corpus, scheme, pq_subvectors=pq_subvectors)
+        codes = encode_blocks(quantizer, corpus) if quantizer else corpus
+        build_s = time.perf_counter() - t0
+
+        for rescore in (0, rescore_factor) if quantizer else (0,):
+            hits = 0
+            t0 = time.perf_counter()
+            for q, expected in zip(qs, truth):
+                scores = quantizer.scores(codes, q) if quantizer else corpus @ q
+                top = _top_k(scores, k * rescore if rescore else k)
+                if rescore:
+                    top = top[np.argsort(-(corpus[top] @ q))[:k]]
+                hits += len(expected & set(top.tolist()))
+            rows.append(
+                {
+                    "scheme": scheme,
+                    "rescore_factor": rescore,
+                    "bytes_per_vector": codes.nbytes / n,
+                    "memory_saved": 1.0 - codes.nbytes / corpus.nbytes,
+                    f"recall@{k}": hits / (k * queries),
+                    "query_ms": 1000 * (time.perf_counter() - t0) / queries,
+                    "build_s": build_s,
+                }
+            )
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--n", type=int, default=20_000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--rescore-factor", type=int, default=4)
+    parser.add_argument("--pq-subvectors", type=int, default=32)
+    args = parser.parse_args()
+
+    rows = benchmark(
+        n=args.n,
+        dim=args.dim,
+        queries=args.queries,
+        k=args.k,
+        rescore_factor=args.rescore_factor,
+        pq_subvectors=args.pq_subvectors,
+    )
+    recall_key = f"recall@{args.k}"
+    print(
+        f"{'scheme':<6} {'rescore':>7} {'B/vec':>7} {'saved':>6} "
+        f"{recall_key:>10} {'ms/query':>9} {'build s':>8}"
+    )
+    for r in rows:
+        print(
+            f"{r['scheme']:<6} {r['rescore_factor']:>7} {r['bytes_per_vector']:>7.0f} "
+            f"{r['memory_saved']:>6.0%} {r[recall_key]:>10.3f} "
+            f"{r['query_ms']:>9.2f} {r['build_s']:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+"""Web search package: provider adapters and HTTP transport (V002)."""
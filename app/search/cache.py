@@ -0,0 +1,218 @@
+"""Search result cache with TTL and stale-while-revalidate.
+
+Company research asks the same queries across questions and across runs.
+Results are cached per (provider, normalised query, max_results) in an
+in-process LRU with an optional on-disk tier. Every entry records when it was
+fetched:
+
+- younger than `ttl_s`: served as a fresh hit;
+- up to `stale_s` past the TTL: served immediately as a stale hit, while one
+  background refresh per key fetches a replacement;
+- older: a miss, fetched in the foreground.
+
+Data is therefore never older than `ttl_s + stale_s`. Errors are not cached;
+a failed background refresh leaves the stale entry in place.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any
+
+from app.retrieval.query_cache import normalize_query
+
+logger = logging.getLogger(__name__)
+
+FRESH, STALE, MISS = "fresh", "stale", "miss"
+
+
+def search_cache_key(provider: str, query: str, max_results: int) -> str:
+    raw = json.dumps([provider, normalize_query(query), max_results])
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class SearchCache:
+    """In-process LRU of search results with an optional on-disk tier.
+
+    Values are `{"results": [...], "fetched_at": <epoch seconds>}`.
+    """
+
+    def __init__(
+        self,
+        ttl_s: float = 86400.0,
+        stale_s: float = 0.0,
+        max_entries: int = 2048,
+        disk_dir: Path | None = None,
+        refresh_workers: int = 2,
+    ):
+        self.ttl_s = max(0.0, ttl_s)
+        self.stale_s = max(0.0, stale_s)
+        self.max_entries = max(1, max_entries)
+        self.disk_dir = disk_dir
+        self._entries: OrderedDict[str, dict[str, Any]] = OrderedDict()
+        self._refreshing: set[str] = set()
+        self._lock = threading.Lock()
+        self._refresher = ThreadPoolExecutor(
+            max_workers=max(1, refresh_workers), thread_name_prefix="search-refresh"
+        )
+        self.hits = 0
+        self.disk_hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+
+    def _disk_path(self, key: str) -> Path | None:
+        if self.disk_dir is None:
+            return None
+        return self.disk_dir / key[:2] / f"{key}.json"
+
+    def _remember(self, key: str, value: dict[str, Any]) -> None:
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _state(self, value: dict[str, Any]) -> str:
+        age = time.time() - float(value.get("fetched_at", 0.0))
+        if age < self.ttl_s:
+            return FRESH
+        if age < self.ttl_s + self.stale_s:
+            return STALE
+        return MISS
+
+    def lookup(self, key: str) -> tuple[list[dict[str, Any]] | None, str]:
+        """Cached results for `key` and their state (`fresh`, `stale`, `miss`).
+
+        Results are copies; None on a miss.
+        """
+        disk = False
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+
+        if value is None:
+            path = self._disk_path(key)
+            if path is not None and path.exists():
+                try:
+                    value = json.loads(path.read_text(encoding="utf-8"))
+                except (OSError, ValueError):
+                    value = None
+                if isinstance(value, dict):
+                    disk = True
+                    with self._lock:
+                        self._remember(key, value)
+                else:
+                    value = None
+
+        state = MISS if value is None else self._state(value)
+        with self._lock:
+            if state == MISS:
+                self.misses += 1
+            elif state == STALE:
+                self.stale_hits += 1
+            elif disk:
+                self.disk_hits += 1
+            else:
+                self.hits += 1
+        if state == MISS:
+            return None, MISS
+        return [dict(r) for r in value.get("results", [])], state
+
+    def put(self, key: str, results: list[Any]) -> None:
+        value = {"results": [dict(r) for r in results], "fetched_at": time.time()}
+        with self._lock:
+            self._remember(key, value)
+        path = self._disk_path(key)
+        if path is not None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(f".{threading.get_ident()}.tmp")
+            tmp.write_text(json.dumps(value, ensure_ascii=False), encoding="utf-8")
+            tmp.replace(path)
+
+    def refresh(self, key: str, fetch: Callable[[], list[Any]]) -> bool:
+        """Re-fetch `key` in the background unless a refresh is already running.
+
+        Returns:
+            bool: Whether a refresh was started.
+        """
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            self.refreshes += 1
+        try:
+            self._refresher.submit(self._run_refresh, key, fetch)
+        except RuntimeError:  # executor shut down at interpreter exit
+            with self._lock:
+                self._refreshing.discard(key)
+            return False
+        return True
+
+    def _run_refresh(self, key: str, fetch: Callable[[], list[Any]]) -> None:
+        try:
+            self.put(key, fetch())
+        except Exception as exc:
+            with self._lock:
+                self.refresh_errors += 1
+            logger.warning(f"Background search refresh failed: {exc}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.stale_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "refreshes": self.refreshes,
+                "refresh_errors": self.refresh_errors,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "stale_rate": self.stale_hits / lookups if lookups else 0.0,
+                "miss_rate": self.misses / lookups if lookups else 0.0,
+            }
+
+
+_default_cache: SearchCache | None = None
+_default_lock = threading.Lock()
+
+
+def get_search_cache(config: dict[str, Any] | None = None) -> SearchCache | None:
+    """Return the process-wide cache configured by `search.cache`, if enabled."""
+    global _default_cache
+    cache_cfg = dict(((config or {}).get("search", {}) or {}).get("cache", {}) or {})
+    if not cache_cfg.get("enabled", True):
+        return None
+    with _default_lock:
+        if _default_cache is None:
+            disk_dir = str(cache_cfg.get("disk_dir", "") or "")
+            _default_cache = SearchCache(
+                ttl_s=float(cache_cfg.get("ttl_s", 86400)),
+                stale_s=float(cache_cfg.get("stale_s", 0)),
+                max_entries=int(cache_cfg.get("max_entries", 2048)),
+                disk_dir=Path(disk_dir) if disk_dir else None,
+                refresh_workers=int(cache_cfg.get("refresh_workers", 2)),
+            )
+        return _default_cache
+
+
+def default_search_cache() -> SearchCache | None:
+    """Return the process-wide cache if one has been created, without creating it."""
+    return _default_cache
@@ -0,0 +1,272 @@
+"""Record/replay cassettes for web search and page fetches (V002).
+
+`search.mode` selects how outbound calls are served:
+
+- `live` (default): calls go to the network.
+- `record`: calls go to the network, bypassing the search and page caches,
+  and every outcome (results, page, or error) is written to the cassette
+  with its latency.
+- `replay`: calls are served from the cassette only, after a simulated
+  latency (`search.cassette.latency_s`: `recorded`, or a fixed number of
+  seconds, times `latency_scale`). A call missing from the cassette fails
+  with `SearchError`; nothing touches the network.
+
+A cassette is a directory holding `cassette.bin` (zlib-compressed JSON
+records, appended) and `index.json` (key -> offset and length). Replay reads
+one record per lookup, without loading the whole store. Keys identify the
+call: provider, normalised query and `max_results` for searches, and the
+canonical URL for pages.
+"""
+
+from __future__ import annotations
+
+import atexit
+import hashlib
+import json
+import threading
+import time
+import zlib
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any
+
+from app.search.transport import (
+    CancelToken,
+    ResponseTooLarge,
+    SearchCancelled,
+    SearchError,
+    SearchTimeout,
+)
+
+LIVE, RECORD, REPLAY = "live", "record", "replay"
+SEARCH_MODES = (LIVE, RECORD, REPLAY)
+
+_ERRORS: dict[str, type[SearchError]] = {
+    cls.__name__: cls
+    for cls in (SearchError, SearchTimeout, SearchCancelled, ResponseTooLarge)
+}
+
+
+def cassette_key(kind: str, *parts: Any) -> str:
+    raw = json.dumps([kind, *parts], ensure_ascii=False)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class Cassette:
+    """Indexed store of recorded calls, in `record` or `replay` mode."""
+
+    def __init__(
+        self,
+        path: Path,
+        mode: str = REPLAY,
+        latency_s: float | str = "recorded",
+        latency_scale: float = 1.0,
+        flush_every: int = 32,
+    ):
+        if mode not in (RECORD, REPLAY):
+            raise ValueError(f"Cassettes are for record or replay, not {mode!r}")
+        self.path = path
+        self.mode = mode
+        self.latency_s = latency_s
+        self.latency_scale = max(0.0, latency_scale)
+        self.flush_every = max(1, flush_every)
+        self._data = path / "cassette.bin"
+        self._index_path = path / "index.json"
+        self._lock = threading.Lock()
+        self._index: dict[str, list[int]] = {}
+        self._failed: set[str] = set()
+        if self._index_path.exists():
+            self._index = json.loads(self._index_path.read_text(encoding="utf-8"))
+        elif mode == REPLAY:
+            raise FileNotFoundError(f"No cassette at {path}; record one first")
+        self._dirty = 0
+        self.hits = 0
+        self.misses = 0
+        self.recorded = 0
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def _read(self, key: str) -> dict[str, Any] | None:
+        with self._lock:
+            span = self._index.get(key)
+            if span is None:
+                return None
+            with self._data.open("rb") as f:
+                f.seek(span[0])
+                blob = f.read(span[1])
+        return json.loads(zlib.decompress(blob))
+
+    def _write(self, key: str, entry: dict[str, Any]) -> None:
+        blob = zlib.compress(json.dumps(entry, ensure_ascii=False).encode("utf-8"))
+        with self._lock:
+            # A success recorded by one attempt (e.g. a winning hedge) is kept
+            # over a later failure of a duplicate
+            if "error" in entry and key in self._index and key not in self._failed:
+                return
+            self.path.mkdir(parents=True, exist_ok=True)
+            with self._data.open("ab") as f:
+                offset = f.seek(0, 2)
+                f.write(blob)
+            self._index[key] = [offset, len(blob)]
+            if "error" in entry:
+                self._failed.add(key)
+            else:
+                self._failed.discard(key)
+            self.recorded += 1
+            self._dirty += 1
+            flush = self._dirty >= self.flush_every
+        if flush:
+            self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            if not self._dirty:
+                return
+            index = json.dumps(self._index, separators=(",", ":"))
+            self._dirty = 0
+        tmp = self._index_path.with_suffix(f".{threading.get_ident()}.tmp")
+        tmp.write_text(index, encoding="utf-8")
+        tmp.replace(self._index_path)
+
+    def record(
+        self,
+        key: str,
+        call: Callable[[], Any],
+        *,
+        encode: Callable[[Any], Any] | None = None,
+        meta: dict[str, Any] | None = None,
+    ) -> Any:
+        """Run `call` live and record its outcome under `key`.
+
+        `encode` turns the result into JSON data. Cancelled calls and None
+        results (nothing served, e.g. a page this run already had) are not
+        recorded: they belong to the run, not to the call.
+        """
+        started = time.perf_counter()
+        entry: dict[str, Any] = {"meta": meta or {}}
+        try:
+            result = call()
+        except SearchCancelled:
+            raise
+        except SearchError as e:
+            entry.update(error=str(e), error_type=type(e).__name__)
+            entry["latency_s"] = time.perf_counter() - started
+            self._write(key, entry)
+            raise
+        if result is None:
+            return None
+        entry["latency_s"] = time.perf_counter() - started
+        entry["value"] = encode(result) if encode is not None else result
+        self._write(key, entry)
+        return result
+
+    def _delay(self, entry: dict[str, Any]) -> float:
+        base = (
+            float(entry.get("latency_s", 0.0))
+            if self.latency_s == "recorded"
+            else float(self.latency_s)
+        )
+        return base * self.latency_scale
+
+    def replay(
+        self,
+        key: str,
+        *,
+        timeout_s: float,
+        cancel: CancelToken | None = None,
+        what: str = "call",
+    ) -> Any:
+        """The value recorded under `key`, after the simulated latency.
+
+        Raises:
+            SearchError: If `key` was not recorded, or re-raised as recorded.
+            SearchTimeout: If the simulated latency exceeds `timeout_s`.
+            SearchCancelled: If `cancel` fires during the simulated latency.
+        """
+        entry = self._read(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if entry is None:
+            raise SearchError(f"{what} not in cassette {self.path}")
+
+        delay = self._delay(entry)
+        if delay > 0:
+            woken = threading.Event()
+            unregister = cancel.register(woken.set) if cancel is not None else None
+            try:
+                woken.wait(min(delay, max(0.0, timeout_s)))
+            finally:
+                if unregister is not None:
+                    unregister()
+            if cancel is not None and cancel.cancelled:
+                raise SearchCancelled("search call cancelled")
+            if delay > timeout_s:
+                raise SearchTimeout("search call deadline exceeded")
+        if "error" in entry:
+            raise _ERRORS.get(str(entry.get("error_type")), SearchError)(entry["error"])
+        return entry.get("value")
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._index),
+                "hits": self.hits,
+                "misses": self.misses,
+                "recorded": self.recorded,
+            }
+
+
+def search_mode(config: dict[str, Any] | None = None) -> str:
+    """`search.mode` of `config`.
+
+    Raises:
+        ValueError: On an unknown mode.
+    """
+    mode = str(((config or {}).get("search", {}) or {}).get("mode", LIVE) or LIVE)
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"Unsupported search mode: {mode}")
+    return mode
+
+
+_cassettes: dict[tuple[str, str], Cassette] = {}
+_cassettes_lock = threading.Lock()
+
+
+def get_cassette(config: dict[str, Any] | None = None) -> Cassette | None:
+    """Return the process-wide cassette for `search.mode`, or None when live."""
+    mode = search_mode(config)
+    if mode == LIVE:
+        return None
+    search_cfg = dict((config or {}).get("search", {}) or {})
+    cfg = dict(search_cfg.get("cassette", {}) or {})
+    path = str(cfg.get("dir", "data/cassettes/v002"))
+    with _cassettes_lock:
+        cassette = _cassettes.get((path, mode))
+        if cassette is None:
+            latency = cfg.get("latency_s", "recorded")
+            cassette = Cassette(
+                Path(path),
+                mode=mode,
+                latency_s=latency if latency == "recorded" else float(latency),
+                latency_scale=float(cfg.get("latency_scale", 1.0)),
+                flush_every=int(cfg.get("flush_every", 32)),
+            )
+            if mode == RECORD:
+                atexit.register(cassette.flush)
+            _cassettes[(path, mode)] = cassette
+        return cassette
+
+
+def cassette_stats() -> dict[str, float]:
+    """Counters summed over the cassettes opened in this process."""
+    with _cassettes_lock:
+        cassettes = list(_cassettes.values())
+    stats: dict[str, float] = {}
+    for cassette in cassettes:
+        for name, value in cassette.stats().items():
+            stats[name] = stats.get(name, 0.0) + float(value)
+    return stats
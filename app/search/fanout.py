@@ -0,0 +1,200 @@
+"""Concurrent fan-out of independent search calls with hedged requests.
+
+A research run issues its sub-queries concurrently, at most
+`max_concurrency` at a time. A call still running after `hedge_after_s`
+(normally the provider's observed p95 latency, see `LatencyTracker`) gets a
+duplicate. Whichever finishes first wins, and the other is cancelled through
+its `CancelToken`. A few slow provider responses then cost roughly one p95
+delay instead of their full tail latency.
+
+The report keeps per-step start and end offsets. The run's latency is the
+critical path (the last step to finish), not the sum of the steps.
+"""
+
+from __future__ import annotations
+
+import threading
+from collections import deque
+from collections.abc import Callable
+from concurrent.futures import FIRST_COMPLETED, Executor, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from time import perf_counter
+from typing import Any
+
+import numpy as np
+
+from app.search.transport import CancelToken
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies for one provider."""
+
+    def __init__(self, window: int = 256):
+        self._samples: deque[float] = deque(maxlen=max(1, window))
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def quantile(self, q: float, min_samples: int = 1) -> float | None:
+        """Latency quantile `q` in seconds; None with fewer than `min_samples`."""
+        with self._lock:
+            samples = list(self._samples)
+        if len(samples) < max(1, min_samples):
+            return None
+        return float(np.quantile(samples, q))
+
+
+_trackers: dict[str, LatencyTracker] = {}
+_trackers_lock = threading.Lock()
+
+
+def get_latency_tracker(provider: str) -> LatencyTracker:
+    """Return the process-wide latency tracker of `provider`, creating it."""
+    with _trackers_lock:
+        if provider not in _trackers:
+            _trackers[provider] = LatencyTracker()
+        return _trackers[provider]
+
+
+def hedge_delay(provider: str, hedge_cfg: dict[str, Any]) -> float | None:
+    """Delay before hedging a call to `provider`, from `research.hedge`.
+
+    The configured quantile of recent latencies once `min_samples` have been
+    seen, `initial_delay_s` before that, never below `min_delay_s`. None
+    disables hedging.
+    """
+    if not hedge_cfg.get("enabled", True):
+        return None
+    observed = get_latency_tracker(provider).quantile(
+        float(hedge_cfg.get("quantile", 0.95)),
+        int(hedge_cfg.get("min_samples", 20)),
+    )
+    delay = (
+        observed
+        if observed is not None
+        else float(hedge_cfg.get("initial_delay_s", 1.0))
+    )
+    return max(float(hedge_cfg.get("min_delay_s", 0.05)), delay)
+
+
+def hedged_call(
+    call: Callable[[CancelToken], Any],
+    executor: Executor,
+    hedge_after_s: float | None,
+) -> tuple[Any, bool, bool]:
+    """Run `call`, duplicating it if it's still running after `hedge_after_s`.
+
+    Returns:
+        tuple: The first successful result, whether a hedge was sent, and
+        whether the hedge won.
+
+    Raises:
+        Exception: The primary's error when every attempt failed.
+    """
+    tokens = [CancelToken()]
+    attempts = {executor.submit(call, tokens[0]): 0}
+    done, _ = wait(attempts, timeout=hedge_after_s)
+    if not done and hedge_after_s is not None:
+        tokens.append(CancelToken())
+        attempts[executor.submit(call, tokens[1])] = 1
+
+    errors: list[BaseException] = []
+    pending = set(attempts)
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in sorted(done, key=attempts.__getitem__):
+            error = future.exception()
+            if error is not None:
+                errors.append(error)
+                continue
+            for loser in pending:
+                tokens[attempts[loser]].cancel()
+            return future.result(), len(tokens) > 1, attempts[future] == 1
+    raise errors[0]
+
+
+@dataclass
+class FanOutStep:
+    query: str
+    results: Any = None
+    error: str = ""
+    # Offsets from the start of the fan-out, in seconds
+    start_s: float = 0.0
+    end_s: float = 0.0
+    hedged: bool = False
+    hedge_won: bool = False
+
+    @property
+    def elapsed_s(self) -> float:
+        return self.end_s - self.start_s
+
+
+@dataclass
+class FanOutReport:
+    steps: list[FanOutStep] = field(default_factory=list)
+
+    @property
+    def critical_path_s(self) -> float:
+        """When the last step finished, from the common origin of the steps."""
+        return max((s.end_s for s in self.steps), default=0.0)
+
+    @property
+    def sequential_s(self) -> float:
+        """What the steps would have taken one after another."""
+        return sum(s.elapsed_s for s in self.steps)
+
+    def summary(self) -> dict[str, float]:
+        return {
+            "steps": float(len(self.steps)),
+            "errors": float(sum(1 for s in self.steps if s.error)),
+            "hedged": float(sum(1 for s in self.steps if s.hedged)),
+            "hedge_wins": float(sum(1 for s in self.steps if s.hedge_won)),
+            "critical_path_s": self.critical_path_s,
+            "sequential_s": self.sequential_s,
+        }
+
+
+def fan_out(
+    queries: list[str],
+    call: Callable[[str, CancelToken], Any],
+    *,
+    max_concurrency: int = 4,
+    hedge_after_s: float | None = None,
+    started: float | None = None,
+) -> FanOutReport:
+    """Run `call(query, cancel)` for every query concurrently.
+
+    Failed steps keep their error message and no results; they don't fail
+    the run. Steps are reported in query order. Offsets are measured from
+    `started` (a `perf_counter()` value, default now), so the steps of
+    successive fan-outs sharing an origin can go in one report.
+    """
+    report = FanOutReport(steps=[FanOutStep(query=q) for q in queries])
+    if not queries:
+        return report
+    workers = max(1, min(max_concurrency, len(queries)))
+    t0 = perf_counter() if started is None else started
+    # Each step may have a primary and a hedge in flight
+    calls = ThreadPoolExecutor(max_workers=2 * workers, thread_name_prefix="search")
+    steps = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="research")
+
+    def run_step(step: FanOutStep) -> None:
+        step.start_s = perf_counter() - t0
+        try:
+            step.results, step.hedged, step.hedge_won = hedged_call(
+                lambda cancel: call(step.query, cancel), calls, hedge_after_s
+            )
+        except Exception as exc:
+            step.error = str(exc) or type(exc).__name__
+        step.end_s = perf_counter() - t0
+
+    try:
+        for future in [steps.submit(run_step, s) for s in report.steps]:
+            future.result()
+    finally:
+        steps.shutdown(wait=True)
+        # Cancelled losers may still be unwinding; don't wait for them
+        calls.shutdown(wait=False, cancel_futures=True)
+    return report
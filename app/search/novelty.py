@@ -0,0 +1,62 @@
+"""Novelty of search results against the evidence gathered so far.
+
+The research loop issues its sub-queries in rounds. A round's results are
+shingled (hashed word n-grams of title and snippet) and compared with the
+shingles of everything gathered before. Novelty is the share of the round's
+shingles that are new. Results whose URL was already gathered contribute
+nothing, so a round that only repeats earlier hits scores 0. Once a round
+scores below the threshold, further queries are unlikely to add information,
+and the loop stops.
+"""
+
+from __future__ import annotations
+
+import re
+from collections.abc import Iterable
+from typing import Any
+
+_WORDS = re.compile(r"\w+")
+
+
+def shingles(text: str, size: int = 3) -> set[int]:
+    """Hashes of the word `size`-grams of `text` (one gram if it's shorter)."""
+    words = _WORDS.findall(text.lower())
+    if not words:
+        return set()
+    if len(words) <= size:
+        return {hash(tuple(words))}
+    return {hash(tuple(words[i : i + size])) for i in range(len(words) - size + 1)}
+
+
+class NoveltyTracker:
+    """Shingles and URLs of the evidence gathered so far in one run."""
+
+    def __init__(self, shingle_size: int = 3):
+        self.shingle_size = max(1, shingle_size)
+        self._urls: set[str] = set()
+        self._shingles: set[int] = set()
+
+    @property
+    def empty(self) -> bool:
+        return not self._shingles
+
+    def add(self, results: Iterable[dict[str, Any]]) -> float:
+        """Add a round of results and return its novelty in [0, 1].
+
+        Returns:
+            float: Share of the round's shingles not seen before; 0.0 when the
+                round brought no result with a new URL.
+        """
+        batch: set[int] = set()
+        for result in results:
+            url = str(result.get("url", ""))
+            if url in self._urls:
+                continue
+            self._urls.add(url)
+            text = f"{result.get('title', '')} {result.get('snippet', '')}"
+            batch |= shingles(text, self.shingle_size)
+        if not batch:
+            return 0.0
+        novelty = len(batch - self._shingles) / len(batch)
+        self._shingles |= batch
+        return novelty
@@ -0,0 +1,511 @@
+"""Page fetching and text extraction for research runs (V002).
+
+Search snippets are too thin to synthesise from, so the research loop fetches
+the pages behind its top results:
+
+- URLs are canonicalised first (`canonicalize_url`): lower-case scheme and
+  host, no default port, credentials, fragment or tracking parameters, and
+  sorted query parameters. The canonical URL is what gets fetched and what
+  identifies a page.
+- A `PageFetcher` lives for one run. It fetches each canonical URL at most
+  once, redirect targets included, and drops pages whose extracted text
+  matches an earlier page (mirrors, `www.` variants).
+- Bodies are streamed and capped at `max_page_kb`. HTML is fed to the stream
+  extractor as it arrives, and reading stops once `max_chars` of text have
+  been extracted, so neither a large page nor a slow one costs more than its
+  caps.
+- Extracted text is cached on disk per canonical URL (`PageCache`). A page
+  fetched by an earlier run is read back without a request until `ttl_s`
+  has passed.
+- With a cassette (`search.mode` record or replay, see `app.search.cassette`)
+  pages are recorded as fetched, or replayed without the network.
+"""
+
+from __future__ import annotations
+
+import codecs
+import hashlib
+import json
+import re
+import threading
+import time
+from collections.abc import Callable, Iterable
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+from urllib.parse import parse_qsl, urlencode, urljoin, urlsplit, urlunsplit
+
+import requests
+
+from app.retrieval.loaders import HTML_SKIP_TAGS, HtmlTextExtractor
+from app.search.cassette import REPLAY, Cassette, cassette_key
+from app.search.fanout import fan_out
+from app.search.transport import (
+    BodyStream,
+    CancelToken,
+    Deadline,
+    SearchError,
+    open_stream,
+)
+
+if TYPE_CHECKING:
+    from app.search.scheduler import HostScheduler
+
+_TRACKING_PARAMS = frozenset(
+    {
+        "_ga", "_gl", "cmpid", "dclid", "fbclid", "gclid", "gclsrc", "igshid",
+        "mc_cid", "mc_eid", "msclkid", "ocid", "ref_src", "spm", "yclid",
+    }
+)  # fmt: skip
+_TRACKING_PREFIXES = ("utm_", "pk_", "hsa_")
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+_PERCENT = re.compile(r"%[0-9a-fA-F]{2}")
+# Page chrome rather than content
+PAGE_SKIP_TAGS = HTML_SKIP_TAGS | {
+    "aside", "button", "footer", "form", "header", "iframe", "nav", "select",
+    "svg",
+}  # fmt: skip
+_HTML_TYPES = {"text/html", "application/xhtml+xml"}
+_REDIRECT_STATUSES = {301, 302, 303, 307, 308}
+_ACCEPT = "text/html,application/xhtml+xml,text/plain;q=0.9"
+
+
+def _remove_dot_segments(path: str) -> str:
+    if "/." not in path:
+        return path
+    out: list[str] = []
+    segments = path.split("/")
+    for seg in segments:
+        if seg == ".":
+            continue
+        if seg == "..":
+            if len(out) > 1:
+                out.pop()
+            continue
+        out.append(seg)
+    if segments[-1] in (".", ".."):
+        out.append("")
+    return "/".join(out) or "/"
+
+
+def canonicalize_url(url: str) -> str:
+    """Canonical form of an http(s) URL, used to fetch and to deduplicate.
+
+    Raises:
+        ValueError: If `url` is not an absolute http(s) URL.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    if scheme not in _DEFAULT_PORTS or not parts.hostname:
+        raise ValueError(f"Not an http(s) URL: {url!r}")
+    host = parts.hostname.rstrip(".")  # already lower-cased
+    try:
+        host = host.encode("idna").decode("ascii")
+    except UnicodeError:
+        pass
+    if ":" in host:  # IPv6 literal
+        host = f"[{host}]"
+    port = parts.port
+    netloc = host if port in (None, _DEFAULT_PORTS[scheme]) else f"{host}:{port}"
+
+    path = _remove_dot_segments(parts.path or "/")
+    path = _PERCENT.sub(lambda m: m.group(0).upper(), path)
+    query = urlencode(
+        sorted(
+            (k, v)
+            for k, v in parse_qsl(parts.query, keep_blank_values=True)
+            if k.lower() not in _TRACKING_PARAMS
+            and not k.lower().startswith(_TRACKING_PREFIXES)
+        )
+    )
+    return urlunsplit((scheme, netloc, path, query, ""))
+
+
+def content_hash(text: str) -> str:
+    """Hash of `text` insensitive to case and whitespace."""
+    return hashlib.sha1(" ".join(text.lower().split()).encode("utf-8")).hexdigest()
+
+
+@dataclass
+class Page:
+    """Extracted text of one fetched page.
+
+    Attributes:
+        url: Canonical URL that was requested.
+        final_url: Canonical URL after redirects.
+        text: Extracted text, at most `max_chars`.
+        content_hash: `content_hash(text)`.
+        bytes_read: Body bytes downloaded.
+        truncated: Whether the byte or character cap cut the page short.
+        cached: Whether the page was read from the disk cache.
+    """
+
+    url: str
+    final_url: str
+    text: str
+    content_hash: str
+    bytes_read: int = 0
+    truncated: bool = False
+    cached: bool = False
+
+
+def _content_type(header: str) -> tuple[str, str]:
+    mime, _, params = header.partition(";")
+    charset = ""
+    for param in params.split(";"):
+        name, _, value = param.partition("=")
+        if name.strip().lower() == "charset":
+            charset = value.strip().strip("\"'")
+    try:
+        charset = codecs.lookup(charset).name if charset else "utf-8"
+    except LookupError:
+        charset = "utf-8"
+    return mime.strip().lower(), charset
+
+
+def _extract(stream: BodyStream, max_bytes: int, max_chars: int) -> tuple[str, bool]:
+    """Text of the streamed body and whether a cap cut it short."""
+    mime, charset = _content_type(stream.headers.get("Content-Type", ""))
+    if mime in _HTML_TYPES:
+        extractor: HtmlTextExtractor | None = HtmlTextExtractor(PAGE_SKIP_TAGS)
+    elif mime.startswith("text/"):
+        extractor = None
+    else:
+        raise SearchError(f"page at {stream.url} has unsupported type {mime or '?'}")
+    decoder = codecs.getincrementaldecoder(charset)(errors="replace")
+
+    parts: list[str] = []
+    chars = 0
+    for chunk in stream.iter_chunks(max_bytes, truncate=True):
+        text = decoder.decode(chunk)
+        if extractor is not None:
+            extractor.feed(text)
+            text = extractor.drain()
+        parts.append(text)
+        chars += len(text)
+        if chars >= max_chars:
+            return "".join(parts)[:max_chars].strip(), True
+    text = decoder.decode(b"", final=True)
+    if extractor is not None:
+        extractor.feed(text)
+        extractor.close()
+        text = extractor.drain()
+    parts.append(text)
+    return "".join(parts)[:max_chars].strip(), not stream.complete
+
+
+def fetch_page(
+    session: requests.Session,
+    url: str,
+    *,
+    deadline: Deadline,
+    max_bytes: int = 2 << 20,
+    max_chars: int = 20000,
+    connect_timeout_s: float = 3.0,
+    max_redirects: int = 5,
+    claim: Callable[[str], bool] | None = None,
+    scheduler: HostScheduler | None = None,
+) -> Page | None:
+    """Fetch `url` and extract its text as the body streams in.
+
+    Redirects are followed here rather than by `requests`, so that each
+    target can be checked with `claim(canonical_url)` before it is
+    downloaded. A redirect back to `url` itself (say, to drop tracking
+    parameters or set a cookie) is the same fetch and is not checked.
+
+    Returns:
+        Page | None: The page, or None when `claim` refused a redirect target.
+
+    Raises:
+        SearchTimeout: Past the deadline.
+        SearchCancelled: Cancelled through the deadline's token.
+        SearchError: On HTTP errors, redirect loops and non-text content types.
+    """
+    target = url
+    for _ in range(max_redirects + 1):
+        with open_stream(
+            session,
+            target,
+            deadline=deadline,
+            headers={"Accept": _ACCEPT},
+            connect_timeout_s=connect_timeout_s,
+            allow_redirects=False,
+            scheduler=scheduler,
+        ) as stream:
+            location = stream.headers.get("Location", "")
+            if stream.status in _REDIRECT_STATUSES and location:
+                try:
+                    target = canonicalize_url(urljoin(target, location))
+                except ValueError as e:
+                    raise SearchError(f"page at {url} redirects off the web") from e
+                if claim is not None and target != url and not claim(target):
+                    return None
+                continue
+            if stream.status >= 400:
+                raise SearchError(
+                    f"page fetch from {target} failed: HTTP {stream.status}"
+                )
+            text, truncated = _extract(stream, max_bytes, max_chars)
+            return Page(
+                url=url,
+                final_url=target,
+                text=text,
+                content_hash=content_hash(text),
+                bytes_read=stream.bytes_read,
+                truncated=truncated,
+            )
+    raise SearchError(f"page at {url} redirects more than {max_redirects} times")
+
+
+class PageCache:
+    """On-disk cache of extracted page text, one JSON file per canonical URL."""
+
+    def __init__(self, disk_dir: Path, ttl_s: float = 604800.0):
+        self.disk_dir = disk_dir
+        self.ttl_s = max(0.0, ttl_s)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, url: str) -> Path:
+        key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        return self.disk_dir / key[:2] / f"{key}.json"
+
+    def get(self, url: str) -> Page | None:
+        path = self._path(url)
+        value = None
+        if path.exists():
+            try:
+                value = json.loads(path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                value = None
+        fresh = (
+            isinstance(value, dict)
+            and value.get("url") == url
+            and time.time() - float(value.get("fetched_at", 0.0)) < self.ttl_s
+        )
+        with self._lock:
+            if fresh:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if not fresh:
+            return None
+        fields = {k: v for k, v in value.items() if k in Page.__dataclass_fields__}
+        return Page(**{**fields, "cached": True})
+
+    def put(self, page: Page) -> None:
+        path = self._path(page.url)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        value = {**asdict(page), "cached": False, "fetched_at": time.time()}
+        tmp = path.with_suffix(f".{threading.get_ident()}.tmp")
+        tmp.write_text(json.dumps(value, ensure_ascii=False), encoding="utf-8")
+        tmp.replace(path)
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+class PageFetcher:
+    """Fetches pages for one research run, each at most once.
+
+    Configured by the `fetch` section: `max_pages` per run, `max_concurrency`,
+    `timeout_s` per page, `max_page_kb` of body and `max_chars` of text.
+    """
+
+    def __init__(
+        self,
+        session: requests.Session,
+        fetch_cfg: dict[str, Any],
+        cache: PageCache | None = None,
+        scheduler: HostScheduler | None = None,
+        cassette: Cassette | None = None,
+    ):
+        self.session = session
+        self.cache = cache
+        self.scheduler = scheduler
+        self.cassette = cassette
+        self.max_pages = int(fetch_cfg.get("max_pages", 5))
+        self.max_concurrency = int(fetch_cfg.get("max_concurrency", 4))
+        self.timeout_s = float(fetch_cfg.get("timeout_s", 8.0))
+        self.connect_timeout_s = float(fetch_cfg.get("connect_timeout_s", 3.0))
+        self.max_bytes = int(fetch_cfg.get("max_page_kb", 2048)) * 1024
+        self.max_chars = int(fetch_cfg.get("max_chars", 20000))
+        # Claimed canonical URL -> the requested URL whose fetch claimed it
+        self._owners: dict[str, str] = {}
+        self._attempted = 0
+        self._seen_hashes: set[str] = set()
+        # Canonical URLs whose page another requested URL already covers
+        self.duplicates: set[str] = set()
+        self._lock = threading.Lock()
+        self.counts = dict.fromkeys(
+            (
+                "requested",
+                "invalid_urls",
+                "duplicate_urls",
+                "duplicate_content",
+                "empty",
+                "over_budget",
+                "cache_hits",
+                "fetched",
+                "errors",
+                "bytes_read",
+            ),
+            0,
+        )
+        self.critical_path_s = 0.0
+
+    def _count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.counts[name] += n
+
+    def _claim(self, url: str, owner: str = "") -> bool:
+        """Reserve `url` for this run; False if it was already fetched or claimed.
+
+        A redirect target is claimed on behalf of the requested URL `owner`,
+        and a fetch may revisit the targets it claimed itself.
+        """
+        with self._lock:
+            held = self._owners.get(url)
+            if held is None:
+                self._owners[url] = owner or url
+                return True
+            return bool(owner) and held == owner
+
+    def _replay(self, cassette: Cassette, url: str, cancel: CancelToken) -> Page | None:
+        page = Page(
+            **cassette.replay(
+                cassette_key("page", url),
+                timeout_s=self.timeout_s,
+                cancel=cancel,
+                what=f"page {url}",
+            )
+        )
+        # Replay the claim `fetch_page` made on the redirect target
+        if page.final_url != url and not self._claim(page.final_url, url):
+            return None
+        self._count("fetched")
+        self._count("bytes_read", page.bytes_read)
+        return page
+
+    def _load(self, url: str, cancel: CancelToken) -> Page | None:
+        if self.cassette is not None:
+            if self.cassette.mode == REPLAY:
+                return self._replay(self.cassette, url, cancel)
+            return self.cassette.record(
+                cassette_key("page", url),
+                lambda: self._fetch(url, cancel),
+                encode=asdict,
+                meta={"url": url},
+            )
+        return self._fetch(url, cancel)
+
+    def _fetch(self, url: str, cancel: CancelToken) -> Page | None:
+        if self.cache is not None:
+            page = self.cache.get(url)
+            if page is not None:
+                self._count("cache_hits")
+                return page
+        page = fetch_page(
+            self.session,
+            url,
+            deadline=Deadline(self.timeout_s, cancel),
+            max_bytes=self.max_bytes,
+            max_chars=self.max_chars,
+            connect_timeout_s=self.connect_timeout_s,
+            claim=lambda target: self._claim(target, url),
+            scheduler=self.scheduler,
+        )
+        if page is None:
+            return None
+        self._count("fetched")
+        self._count("bytes_read", page.bytes_read)
+        if self.cache is not None:
+            self.cache.put(page)
+        return page
+
+    def fetch(self, urls: Iterable[str]) -> list[Page]:
+        """Fetch the pages of `urls` not seen before in this run.
+
+        Returns:
+            list[Page]: Pages with text, in `urls` order, without URL or
+                content duplicates. Failed fetches are counted and left out;
+                duplicates are also added to `duplicates`.
+        """
+        pending: list[str] = []
+        for url in urls:
+            self._count("requested")
+            try:
+                canonical = canonicalize_url(url)
+            except ValueError:
+                self._count("invalid_urls")
+                continue
+            if self._attempted >= self.max_pages:
+                self._count("over_budget")
+                continue
+            if not self._claim(canonical):
+                self._count("duplicate_urls")
+                continue
+            self._attempted += 1
+            pending.append(canonical)
+
+        report = fan_out(pending, self._load, max_concurrency=self.max_concurrency)
+        self.critical_path_s += report.critical_path_s
+        pages: list[Page] = []
+        for step in report.steps:
+            if step.error:
+                self._count("errors")
+                continue
+            page: Page | None = step.results
+            if page is None:
+                # Redirected to a page another requested URL claimed
+                self._count("duplicate_urls")
+                self.duplicates.add(step.query)
+                continue
+            if not page.text:
+                self._count("empty")
+                continue
+            if page.content_hash in self._seen_hashes:
+                self._count("duplicate_content")
+                self.duplicates.add(page.url)
+                continue
+            self._seen_hashes.add(page.content_hash)
+            pages.append(page)
+        return pages
+
+    def stats(self) -> dict[str, float]:
+        with self._lock:
+            stats = {k: float(v) for k, v in self.counts.items()}
+        stats["critical_path_s"] = self.critical_path_s
+        return stats
+
+
+_default_cache: PageCache | None = None
+_default_lock = threading.Lock()
+
+
+def get_page_cache(config: dict[str, Any] | None = None) -> PageCache | None:
+    """Return the process-wide page cache configured by `fetch.cache`, if enabled."""
+    global _default_cache
+    fetch_cfg = dict((config or {}).get("fetch", {}) or {})
+    cache_cfg = dict(fetch_cfg.get("cache", {}) or {})
+    disk_dir = str(cache_cfg.get("disk_dir", "") or "")
+    if not cache_cfg.get("enabled", True) or not disk_dir:
+        return None
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = PageCache(
+                Path(disk_dir), ttl_s=float(cache_cfg.get("ttl_s", 604800))
+            )
+        return _default_cache
+
+
+def default_page_cache() -> PageCache | None:
+    """Return the process-wide page cache if one has been created, without creating it."""
+    return _default_cache
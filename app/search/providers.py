@@ -0,0 +1,229 @@
+"""Search provider adapters.
+
+Each adapter turns one query into an HTTP call over the shared session, then
+normalises the provider's payload into `SearchResult`s. Adapters are picked
+by `search.provider`:
+
+- `http`: a generic JSON endpoint, `GET <endpoint>?q=<query>&num=<n>`.
+  Results are read from `results_key` in the response (default `results`),
+  each item giving `title`, `url` (or `link`) and `snippet` (or
+  `description`). A local stub server speaking this format stands in for a
+  provider in tests.
+- `google_cse`: the Google Programmable Search JSON API. Credentials come
+  from `GOOGLE_CSE_API_KEY` and `GOOGLE_CSE_ID`, or from `api_key` and
+  `engine_id` in the section.
+
+Transient failures (connection errors, 429 and 5xx) are retried with
+exponential backoff, only while the call's deadline leaves room. The latency
+of each successful request is recorded per provider, which sets the hedging
+delay of concurrent research runs.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import time
+from typing import TYPE_CHECKING, Any, TypedDict
+
+import requests
+
+from app.search.fanout import get_latency_tracker
+from app.search.transport import (
+    Deadline,
+    ResponseTooLarge,
+    SearchCancelled,
+    SearchError,
+    SearchTimeout,
+    open_stream,
+)
+
+if TYPE_CHECKING:
+    from app.search.scheduler import HostScheduler
+
+_RETRY_STATUSES = {429, 500, 502, 503, 504}
+_URL_KEYS = ("url", "link", "href")
+_SNIPPET_KEYS = ("snippet", "description", "content", "body")
+
+
+class SearchResult(TypedDict):
+    title: str
+    url: str
+    snippet: str
+
+
+def _first(item: dict[str, Any], keys: tuple[str, ...]) -> str:
+    for key in keys:
+        value = item.get(key)
+        if isinstance(value, str) and value.strip():
+            return value
+    return ""
+
+
+def normalize_results(items: list[Any], max_results: int) -> list[SearchResult]:
+    """Coerce raw result items into `SearchResult`s; items without a URL are dropped."""
+    results: list[SearchResult] = []
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        url = _first(item, _URL_KEYS).strip()
+        if not url:
+            continue
+        results.append(
+            {
+                "title": " ".join(str(item.get("title", "") or "").split()),
+                "url": url,
+                "snippet": " ".join(_first(item, _SNIPPET_KEYS).split()),
+            }
+        )
+        if len(results) >= max_results:
+            break
+    return results
+
+
+class JsonSearchProvider:
+    """Generic JSON search endpoint (`search.provider: http`)."""
+
+    name = "http"
+
+    def __init__(
+        self,
+        session: requests.Session,
+        search_cfg: dict[str, Any],
+        scheduler: HostScheduler | None = None,
+    ):
+        self.session = session
+        self.scheduler = scheduler
+        self.endpoint = str(search_cfg.get("endpoint", "") or "")
+        self.results_key = str(search_cfg.get("results_key", "results"))
+        self.max_response_bytes = int(search_cfg.get("max_response_kb", 1024)) * 1024
+        self.connect_timeout_s = float(search_cfg.get("connect_timeout_s", 3.0))
+        self.retries = max(0, int(search_cfg.get("retries", 1)))
+        self.backoff_s = float(search_cfg.get("backoff_s", 0.2))
+
+    def _params(self, query: str, max_results: int) -> dict[str, Any]:
+        return {"q": query, "num": max_results}
+
+    def search(
+        self, query: str, *, max_results: int, deadline: Deadline
+    ) -> list[SearchResult]:
+        """Run `query` within `deadline`.
+
+        Raises:
+            SearchTimeout: Past the deadline.
+            SearchCancelled: Cancelled through the deadline's token.
+            SearchError: On an unconfigured provider, an HTTP error after
+                retries, or an unreadable payload.
+        """
+        if not self.endpoint:
+            raise SearchError(f"search.endpoint is not set for provider {self.name}")
+        params = self._params(query, max_results)
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                with open_stream(
+                    self.session,
+                    self.endpoint,
+                    deadline=deadline,
+                    params=params,
+                    headers={"Accept": "application/json"},
+                    connect_timeout_s=self.connect_timeout_s,
+                    scheduler=self.scheduler,
+                ) as stream:
+                    body = b"".join(stream.iter_chunks(self.max_response_bytes))
+                    status = stream.status
+                    # Hedging acts on provider latency, not on our own queueing
+                    latency_s = time.perf_counter() - started - stream.queued_s
+                error = None if status < 400 else f"HTTP {status}"
+                retryable = status in _RETRY_STATUSES
+            except (SearchTimeout, SearchCancelled, ResponseTooLarge):
+                raise
+            except SearchError as e:
+                status, body = 0, b""
+                error = str(e)
+                retryable = True
+            if error is None:
+                get_latency_tracker(self.name).record(latency_s)
+                break
+            pause = self.backoff_s * (2**attempt)
+            if (
+                not retryable
+                or attempt >= self.retries
+                or deadline.remaining() <= pause
+            ):
+                raise SearchError(f"{self.name} search failed: {error}")
+            attempt += 1
+            time.sleep(pause)
+
+        try:
+            payload = json.loads(body)
+        except ValueError as e:
+            raise SearchError(f"{self.name} search returned invalid JSON") from e
+        items = payload.get(self.results_key) if isinstance(payload, dict) else None
+        return normalize_results(items if isinstance(items, list) else [], max_results)
+
+
+class GoogleCseProvider(JsonSearchProvider):
+    """Google Programmable Search JSON API (`search.provider: google_cse`)."""
+
+    name = "google_cse"
+    _MAX_NUM = 10
+
+    def __init__(
+        self,
+        session: requests.Session,
+        search_cfg: dict[str, Any],
+        scheduler: HostScheduler | None = None,
+    ):
+        super().__init__(
+            session,
+            {
+                "results_key": "items",
+                **search_cfg,
+                # An empty `endpoint` (the config default) means the built-in one
+                "endpoint": search_cfg.get("endpoint")
+                or "https://www.googleapis.com/customsearch/v1",
+            },
+            scheduler,
+        )
+        self.api_key = str(
+            search_cfg.get("api_key") or os.getenv("GOOGLE_CSE_API_KEY", "")
+        )
+        self.engine_id = str(
+            search_cfg.get("engine_id") or os.getenv("GOOGLE_CSE_ID", "")
+        )
+
+    def _params(self, query: str, max_results: int) -> dict[str, Any]:
+        if not self.api_key or not self.engine_id:
+            raise SearchError(
+                "GOOGLE_CSE_API_KEY and GOOGLE_CSE_ID are required for google_cse"
+            )
+        return {
+            "key": self.api_key,
+            "cx": self.engine_id,
+            "q": query,
+            "num": min(max_results, self._MAX_NUM),
+        }
+
+
+PROVIDERS: dict[str, type[JsonSearchProvider]] = {
+    JsonSearchProvider.name: JsonSearchProvider,
+    GoogleCseProvider.name: GoogleCseProvider,
+}
+
+
+def make_provider(
+    session: requests.Session,
+    search_cfg: dict[str, Any],
+    scheduler: HostScheduler | None = None,
+) -> JsonSearchProvider:
+    """Instantiate the adapter named by `search.provider`.
+
+    Raises:
+        ValueError: On an unknown provider name.
+    """
+    name = str(search_cfg.get("provider", "http"))
+    if name not in PROVIDERS:
+        raise ValueError(f"Unsupported search provider: {name}")
+    return PROVIDERS[name](session, search_cfg, scheduler)
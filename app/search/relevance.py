@@ -0,0 +1,202 @@
+"""Relevance pruning of research evidence before synthesis (V002).
+
+A run gathers snippets and page text for every sub-query, far more than the
+answer needs. Before the model call the evidence is cut into passages (lines
+of page text, windowed to `passage_chars`), each scored with BM25 against the
+question, with term statistics over the run's own passages, and the passages
+are packed into the token budget with `pack_context`:
+
+- first the best passage of every source that matches the question at all
+  (the opening passage if only its title does), so a long page can't crowd
+  a relevant source out of the prompt;
+- then the remaining passages by score per token, in the budget left.
+  Passages sharing no term with the question are not sent.
+
+A source keeps its packed passages in page order. Sources with none left are
+dropped, so the sources numbered in the prompt are exactly those sent.
+"""
+
+from __future__ import annotations
+
+import math
+from collections import Counter
+from dataclasses import dataclass, field
+
+from app.retrieval.lexical import BM25_B, BM25_K1, tokenize
+from app.search.providers import SearchResult
+from app.tools.context_packer import (
+    DEFAULT_CHARS_PER_TOKEN,
+    ContextSpan,
+    estimate_tokens,
+    merge_adjacent,
+    pack_context,
+)
+
+
+def split_passages(text: str, max_chars: int = 600) -> list[tuple[int, int]]:
+    """Character ranges covering `text`: whole lines, up to `max_chars` each.
+
+    Consecutive short lines share a passage; a longer line is cut at word
+    boundaries. Ranges are contiguous, so neighbouring passages merge back
+    when both are kept.
+    """
+    max_chars = max(1, max_chars)
+    ranges: list[tuple[int, int]] = []
+    start = 0
+    end = 0
+    for line in text.splitlines(keepends=True):
+        line_end = end + len(line)
+        if line_end - start > max_chars and end > start:
+            ranges.append((start, end))
+            start = end
+        while line_end - start > max_chars:
+            cut = text.rfind(" ", start + 1, start + max_chars + 1)
+            cut = cut + 1 if cut > start else start + max_chars
+            ranges.append((start, cut))
+            start = cut
+        end = line_end
+    if end > start:
+        ranges.append((start, end))
+    return ranges
+
+
+def bm25(query: str, docs: list[str]) -> list[float]:
+    """BM25 score of each of `docs` for `query`, over `docs` as the corpus."""
+    tokens = [tokenize(doc) for doc in docs]
+    terms = set(tokenize(query))
+    if not docs or not terms:
+        return [0.0] * len(docs)
+    avg_len = max(sum(len(t) for t in tokens) / len(docs), 1e-9)
+    df = Counter(term for t in tokens for term in terms.intersection(t))
+    idf = {
+        term: math.log1p((len(docs) - n + 0.5) / (n + 0.5)) for term, n in df.items()
+    }
+    scores: list[float] = []
+    for doc in tokens:
+        tf = Counter(term for term in doc if term in idf)
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * len(doc) / avg_len)
+        scores.append(
+            sum(idf[term] * n * (BM25_K1 + 1) / (n + norm) for term, n in tf.items())
+        )
+    return scores
+
+
+@dataclass
+class PrunedEvidence:
+    """Evidence packed into a token budget.
+
+    Attributes:
+        sources: Sources with at least one passage kept, in their original
+            order; `snippet` holds the kept passages, joined with " … ".
+        budget: Tokens available for the evidence.
+        tokens: Estimated tokens of the kept snippets.
+        tokens_in: Estimated tokens of the snippets before pruning.
+        passages_kept: Passages packed, whole or cut to the budget.
+        passages_dropped: Passages left out.
+        sources_dropped: Sources left without a passage.
+    """
+
+    sources: list[SearchResult] = field(default_factory=list)
+    budget: int = 0
+    tokens: int = 0
+    tokens_in: int = 0
+    passages_kept: int = 0
+    passages_dropped: int = 0
+    sources_dropped: int = 0
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "budget": self.budget,
+            "tokens": self.tokens,
+            "tokens_in": self.tokens_in,
+            "passages_kept": self.passages_kept,
+            "passages_dropped": self.passages_dropped,
+            "sources_kept": len(self.sources),
+            "sources_dropped": self.sources_dropped,
+        }
+
+
+def prune_evidence(
+    query: str,
+    evidence: list[SearchResult],
+    budget_tokens: int,
+    *,
+    passage_chars: int = 600,
+    chars_per_token: float = DEFAULT_CHARS_PER_TOKEN,
+) -> PrunedEvidence:
+    """Rank the passages of `evidence` against `query` and pack them.
+
+    Args:
+        query: Text the passages should answer (company and question).
+        evidence: Sources with snippet or page text, deduplicated by URL.
+        budget_tokens: Tokens available for the evidence.
+        passage_chars: Longest passage, in characters.
+        chars_per_token: Ratio used by `estimate_tokens`.
+
+    Returns:
+        PrunedEvidence: Kept sources and kept/dropped counts.
+    """
+    spans: list[ContextSpan] = []
+    for source in evidence:
+        text = source["snippet"]
+        for start, end in split_passages(text, passage_chars):
+            passage = text[start:end]
+            if passage.strip():
+                spans.append(
+                    ContextSpan(
+                        source_uri=source["url"],
+                        start=start,
+                        end=end,
+                        text=passage,
+                        score=0.0,
+                        chunk_ids=[str(len(spans))],
+                    )
+                )
+    for span, score in zip(spans, bm25(query, [s.text for s in spans]), strict=True):
+        span.score = score
+    best: dict[str, ContextSpan] = {}
+    for span in spans:
+        if span.score > getattr(best.get(span.source_uri), "score", 0.0):
+            best[span.source_uri] = span
+    # A source whose title matches is seeded with its opening passage
+    titles = bm25(query, [s["title"] for s in evidence])
+    for source, score in zip(evidence, titles, strict=True):
+        if score > 0 and source["url"] not in best:
+            first = next((s for s in spans if s.source_uri == source["url"]), None)
+            if first is not None:
+                best[source["url"]] = first
+
+    seeds = pack_context(best.values(), budget_tokens, chars_per_token=chars_per_token)
+    seeded = {id(s) for s in best.values()}
+    # Passages without a query term are left out, unless none has one
+    rest = pack_context(
+        [s for s in spans if id(s) not in seeded and (s.score > 0 or not best)],
+        budget_tokens - seeds.tokens,
+        chars_per_token=chars_per_token,
+    )
+    by_source: dict[str, list[ContextSpan]] = {}
+    for span in merge_adjacent(seeds.spans + rest.spans):
+        by_source.setdefault(span.source_uri, []).append(span)
+
+    pruned = PrunedEvidence(
+        budget=budget_tokens,
+        tokens_in=sum(estimate_tokens(s["snippet"], chars_per_token) for s in evidence),
+    )
+    for source in evidence:
+        kept = sorted(by_source.get(source["url"], []), key=lambda s: s.start)
+        if not kept:
+            pruned.sources_dropped += 1
+            continue
+        pruned.passages_kept += sum(len(s.chunk_ids) for s in kept)
+        pruned.sources.append(
+            {
+                "title": source["title"],
+                "url": source["url"],
+                "snippet": " … ".join(s.text.strip() for s in kept),
+            }
+        )
+    pruned.passages_dropped = len(spans) - pruned.passages_kept
+    pruned.tokens = sum(
+        estimate_tokens(s["snippet"], chars_per_token) for s in pruned.sources
+    )
+    return pruned
@@ -0,0 +1,252 @@
+"""Per-host politeness scheduler for outbound HTTP.
+
+Concurrent research runs send many requests to the same few hosts (the
+search API, large news and investor-relations sites). Every request made
+through `open_stream` first takes a slot from the process-wide
+`HostScheduler`:
+
+- at most `max_in_flight` requests overall and `per_host` per host;
+- request starts to one host at least `min_delay_s` apart;
+- a 429 or 503 blocks the host for its `Retry-After`, or for an exponential
+  backoff from `backoff_s` (capped at `max_backoff_s`) when there is none;
+  the next successful response resets the backoff;
+- free slots go round-robin to the hosts with waiting requests, so one busy
+  host can't starve the others.
+
+`hosts` overrides `per_host` and `min_delay_s` for named hosts (e.g. the
+search API, which is built for concurrent clients). A request waits for its
+slot within its own `Deadline`, and cancelling the deadline's token stops
+the wait.
+"""
+
+from __future__ import annotations
+
+import email.utils
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any
+
+from app.search.transport import Deadline, SearchError
+
+
+def parse_retry_after(value: str | None, now: float | None = None) -> float | None:
+    """Seconds to wait from a `Retry-After` header (delta seconds or HTTP date)."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when is None:
+        return None
+    return max(0.0, when.timestamp() - (time.time() if now is None else now))
+
+
+@dataclass
+class _Waiter:
+    event: threading.Event = field(default_factory=threading.Event)
+    granted: bool = False
+
+
+@dataclass
+class _Host:
+    limit: int
+    min_delay_s: float
+    active: int = 0
+    next_start: float = 0.0
+    blocked_until: float = 0.0
+    strikes: int = 0
+    waiters: deque[_Waiter] = field(default_factory=deque)
+
+    def ready_at(self) -> float:
+        return max(self.next_start, self.blocked_until)
+
+
+class HostScheduler:
+    """Hands out request slots per host; see the module docstring."""
+
+    def __init__(
+        self,
+        max_in_flight: int = 32,
+        per_host: int = 2,
+        min_delay_s: float = 0.25,
+        backoff_s: float = 1.0,
+        max_backoff_s: float = 60.0,
+        hosts: dict[str, dict[str, Any]] | None = None,
+    ):
+        self.max_in_flight = max(1, max_in_flight)
+        self.per_host = max(1, per_host)
+        self.min_delay_s = max(0.0, min_delay_s)
+        self.backoff_s = max(0.0, backoff_s)
+        self.max_backoff_s = max(0.0, max_backoff_s)
+        self.overrides = {h.lower(): dict(v or {}) for h, v in (hosts or {}).items()}
+        self._lock = threading.Lock()
+        self._hosts: dict[str, _Host] = {}
+        # Hosts with waiting requests, in the order they get the next free slot
+        self._ring: deque[str] = deque()
+        self._active = 0
+        self.requests = 0
+        self.waited = 0
+        self.wait_s = 0.0
+        self.backoffs = 0
+
+    def _host(self, host: str) -> _Host:
+        state = self._hosts.get(host)
+        if state is None:
+            override = self.overrides.get(host, {})
+            state = _Host(
+                limit=max(1, int(override.get("per_host", self.per_host))),
+                min_delay_s=float(override.get("min_delay_s", self.min_delay_s)),
+            )
+            self._hosts[host] = state
+        return state
+
+    def _dispatch(self) -> None:
+        """Grant free slots round-robin across hosts. Call with the lock held."""
+        granted = True
+        while granted and self._ring and self._active < self.max_in_flight:
+            granted = False
+            now = time.monotonic()
+            for _ in range(len(self._ring)):
+                name = self._ring[0]
+                state = self._hosts[name]
+                if not state.waiters:
+                    self._ring.popleft()
+                    continue
+                self._ring.rotate(-1)
+                if state.active >= state.limit:
+                    continue
+                if state.ready_at() > now:
+                    # Let the next in line re-arm its timer for the new delay
+                    state.waiters[0].event.set()
+                    continue
+                waiter = state.waiters.popleft()
+                waiter.granted = True
+                state.active += 1
+                state.next_start = now + state.min_delay_s
+                self._active += 1
+                waiter.event.set()
+                granted = True
+                if self._active >= self.max_in_flight:
+                    return
+
+    def acquire(self, host: str, deadline: Deadline) -> float:
+        """Wait for a slot to `host`; pair every return with `release(host, ...)`.
+
+        Returns:
+            float: Seconds spent waiting.
+
+        Raises:
+            SearchTimeout: If the deadline passes while waiting.
+            SearchCancelled: If the deadline's token is cancelled while waiting.
+        """
+        host = host.lower()
+        waiter = _Waiter()
+        started = time.monotonic()
+        with self._lock:
+            self.requests += 1
+            state = self._host(host)
+            state.waiters.append(waiter)
+            if host not in self._ring:
+                self._ring.append(host)
+            self._dispatch()
+        if waiter.granted:
+            return 0.0
+
+        cancel = deadline.cancel
+        unregister = cancel.register(waiter.event.set) if cancel is not None else None
+        try:
+            while True:
+                try:
+                    remaining = deadline.check()
+                except SearchError:
+                    with self._lock:
+                        if not waiter.granted:
+                            state.waiters.remove(waiter)
+                            raise
+                    # Granted while giving up: hand the slot back
+                    self.release(host)
+                    raise
+                with self._lock:
+                    # Woken by a grant, a cancel, or the host's delay running out
+                    if not waiter.granted:
+                        self._dispatch()
+                    if waiter.granted:
+                        waited = time.monotonic() - started
+                        self.waited += 1
+                        self.wait_s += waited
+                        return waited
+                    waiter.event.clear()
+                    delay = state.ready_at() - time.monotonic()
+                if cancel is not None and cancel.cancelled:
+                    continue  # cancelled before the clear; don't sleep through it
+                waiter.event.wait(min(remaining, delay) if delay > 0 else remaining)
+        finally:
+            if unregister is not None:
+                unregister()
+
+    def release(
+        self, host: str, status: int | None = None, retry_after: str | None = None
+    ) -> None:
+        """Free a slot to `host` and learn from the response status, if any."""
+        host = host.lower()
+        with self._lock:
+            state = self._host(host)
+            state.active = max(0, state.active - 1)
+            self._active = max(0, self._active - 1)
+            if status in (429, 503):
+                state.strikes += 1
+                self.backoffs += 1
+                delay = parse_retry_after(retry_after)
+                if delay is None:
+                    delay = self.backoff_s * 2 ** (state.strikes - 1)
+                until = time.monotonic() + min(delay, self.max_backoff_s)
+                state.blocked_until = max(state.blocked_until, until)
+            elif status is not None and status < 400:
+                state.strikes = 0
+            self._dispatch()
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "waited": self.waited,
+                "wait_s": self.wait_s,
+                "backoffs": self.backoffs,
+                "in_flight": self._active,
+                "hosts": len(self._hosts),
+            }
+
+
+_default_scheduler: HostScheduler | None = None
+_default_lock = threading.Lock()
+
+
+def get_host_scheduler(config: dict[str, Any] | None = None) -> HostScheduler | None:
+    """Return the process-wide scheduler configured by `search.politeness`, if enabled."""
+    global _default_scheduler
+    search_cfg = dict((config or {}).get("search", {}) or {})
+    cfg = dict(search_cfg.get("politeness", {}) or {})
+    if not cfg.get("enabled", True):
+        return None
+    with _default_lock:
+        if _default_scheduler is None:
+            _default_scheduler = HostScheduler(
+                max_in_flight=int(cfg.get("max_in_flight", 32)),
+                per_host=int(cfg.get("per_host", 2)),
+                min_delay_s=float(cfg.get("min_delay_s", 0.25)),
+                backoff_s=float(cfg.get("backoff_s", 1.0)),
+                max_backoff_s=float(cfg.get("max_backoff_s", 60.0)),
+                hosts=dict(cfg.get("hosts", {}) or {}),
+            )
+        return _default_scheduler
+
+
+def default_host_scheduler() -> HostScheduler | None:
+    """Return the process-wide scheduler if one has been created, without creating it."""
+    return _default_scheduler
@@ -0,0 +1,342 @@
+"""Shared HTTP transport for search providers.
+
+One process-wide `requests.Session` keeps connections alive in a bounded
+pool, so a research loop pays the TCP and TLS handshake once per host, not
+once per query.
+
+Every call runs under a `Deadline`, which is an absolute time limit rather
+than a per-socket timeout. The connect and read timeouts are cut to the time
+left, and the socket timeout is reset before each body read. A slow provider
+can't stretch a call past its deadline by trickling bytes.
+
+A `CancelToken` lets another thread abandon a call (e.g. the loser of a
+hedged request). Cancelling shuts the socket down, which wakes a blocked body
+read. A call still waiting for response headers ends at its deadline. Bodies
+are capped at `max_bytes` after decompression. `open_stream` hands the body
+over chunk by chunk, for callers that process it as it arrives or stop early.
+"""
+
+from __future__ import annotations
+
+import socket
+import threading
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Any
+from urllib.parse import urlsplit
+
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+
+if TYPE_CHECKING:
+    from app.search.scheduler import HostScheduler
+
+_CHUNK_BYTES = 64 * 1024
+
+
+class SearchError(RuntimeError):
+    """A search call failed (HTTP error, bad payload, oversized response)."""
+
+
+class SearchTimeout(SearchError):
+    """A search call ran past its deadline."""
+
+
+class SearchCancelled(SearchError):
+    """A search call was cancelled through its `CancelToken`."""
+
+
+class ResponseTooLarge(SearchError):
+    """A response body exceeded the caller's size cap."""
+
+
+class CancelToken:
+    """Thread-safe cancellation flag with callbacks for in-flight I/O."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cancelled = False
+        self._callbacks: list[Callable[[], None]] = []
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled
+
+    def cancel(self) -> None:
+        with self._lock:
+            if self._cancelled:
+                return
+            self._cancelled = True
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def register(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """Run `callback` on cancel (now, if already cancelled).
+
+        Returns:
+            Callable[[], None]: Unregisters the callback.
+        """
+        with self._lock:
+            if not self._cancelled:
+                self._callbacks.append(callback)
+                return lambda: self._unregister(callback)
+        callback()
+        return lambda: None
+
+    def _unregister(self, callback: Callable[[], None]) -> None:
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+
+class Deadline:
+    """Absolute time limit for one call, optionally tied to a `CancelToken`."""
+
+    def __init__(self, timeout_s: float, cancel: CancelToken | None = None):
+        self.expires_at = time.monotonic() + max(0.0, timeout_s)
+        self.cancel = cancel
+
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+    def check(self) -> float:
+        """Seconds left.
+
+        Raises:
+            SearchCancelled: If the token was cancelled.
+            SearchTimeout: If the deadline has passed.
+        """
+        if self.cancel is not None and self.cancel.cancelled:
+            raise SearchCancelled("search call cancelled")
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise SearchTimeout("search call deadline exceeded")
+        return remaining
+
+
+def _shutdown(sock: socket.socket) -> None:
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+class BodyStream:
+    """An open response whose body is read in bounded chunks (see `open_stream`)."""
+
+    def __init__(
+        self,
+        response: requests.Response,
+        url: str,
+        deadline: Deadline,
+        sock: socket.socket | None,
+        queued_s: float = 0.0,
+    ):
+        self.response = response
+        self.url = url
+        self.deadline = deadline
+        self.sock = sock
+        # Time spent waiting for a scheduler slot before the request went out
+        self.queued_s = queued_s
+        self.bytes_read = 0
+        # Set once the body was read to its end; only then is the connection reused
+        self.complete = False
+
+    @property
+    def status(self) -> int:
+        return self.response.status_code
+
+    @property
+    def headers(self) -> Any:
+        return self.response.headers
+
+    @property
+    def final_url(self) -> str:
+        """URL after redirects."""
+        return self.response.url or self.url
+
+    def iter_chunks(self, max_bytes: int, *, truncate: bool = False) -> Iterator[bytes]:
+        """Yield the body in chunks, at most `max_bytes` of it.
+
+        With `truncate`, reading stops quietly at the cap; otherwise an
+        oversized body raises `ResponseTooLarge`. A caller may also stop
+        early. Either way the unread rest is never downloaded.
+        """
+        url, deadline, cancel = self.url, self.deadline, self.deadline.cancel
+        length = self.headers.get("Content-Length", "")
+        if not truncate and length.isdigit() and int(length) > max_bytes:
+            raise ResponseTooLarge(f"response from {url} exceeds {max_bytes} bytes")
+        try:
+            while True:
+                remaining = deadline.check()
+                if self.sock is not None:
+                    self.sock.settimeout(remaining)
+                # One read per socket timeout, so trickled bytes can't extend it
+                chunk = self.response.raw.read1(_CHUNK_BYTES, decode_content=True)
+                if not chunk:
+                    break
+                if self.bytes_read + len(chunk) > max_bytes:
+                    if not truncate:
+                        raise ResponseTooLarge(
+                            f"response from {url} exceeds {max_bytes} bytes"
+                        )
+                    chunk = chunk[: max_bytes - self.bytes_read]
+                self.bytes_read += len(chunk)
+                if chunk:
+                    yield chunk
+                if truncate and self.bytes_read >= max_bytes:
+                    return
+        except (requests.RequestException, urllib3.exceptions.HTTPError, OSError) as e:
+            deadline.check()
+            if isinstance(
+                e, requests.Timeout | urllib3.exceptions.TimeoutError | TimeoutError
+            ):
+                raise SearchTimeout(f"search call to {url} timed out") from e
+            raise SearchError(f"search call to {url} failed: {e}") from e
+        # A shut-down socket can read as a clean end of body
+        if cancel is not None and cancel.cancelled:
+            raise SearchCancelled("search call cancelled")
+        self.complete = True
+
+
+@contextmanager
+def open_stream(
+    session: requests.Session,
+    url: str,
+    *,
+    deadline: Deadline,
+    params: dict[str, Any] | None = None,
+    headers: dict[str, str] | None = None,
+    connect_timeout_s: float = 3.0,
+    allow_redirects: bool = True,
+    scheduler: HostScheduler | None = None,
+) -> Iterator[BodyStream]:
+    """GET `url` within `deadline` and yield the response before its body is read.
+
+    With a `scheduler`, the request first waits for a slot to the URL's host
+    (within the deadline) and holds it until the body is done. On exit the
+    connection goes back to the pool if the body was read to its end, and is
+    dropped otherwise.
+
+    Raises:
+        SearchTimeout: Past the deadline.
+        SearchCancelled: Cancelled through the deadline's token.
+        SearchError: On connection errors.
+    """
+    deadline.check()
+    cancel = deadline.cancel
+    host = urlsplit(url).netloc
+    queued_s = scheduler.acquire(host, deadline) if scheduler is not None else 0.0
+    status: int | None = None
+    retry_after: str | None = None
+    try:
+        remaining = deadline.check()
+        try:
+            response = session.get(
+                url,
+                params=params,
+                headers=headers,
+                stream=True,
+                timeout=(min(connect_timeout_s, remaining), remaining),
+                allow_redirects=allow_redirects,
+            )
+        except requests.Timeout as e:
+            raise SearchTimeout(f"search call to {url} timed out") from e
+        except requests.RequestException as e:
+            deadline.check()
+            raise SearchError(f"search call to {url} failed: {e}") from e
+        status = response.status_code
+        retry_after = response.headers.get("Retry-After")
+
+        connection = getattr(response.raw, "connection", None)
+        sock: socket.socket | None = getattr(connection, "sock", None)
+        unregister = (
+            cancel.register(lambda: _shutdown(sock))
+            if cancel is not None and sock is not None
+            else None
+        )
+        stream = BodyStream(response, url, deadline, sock, queued_s)
+        try:
+            yield stream
+        finally:
+            if unregister is not None:
+                unregister()
+            if stream.complete:
+                response.raw.release_conn()
+            else:
+                # Drops the connection instead of returning a half-read one
+                response.close()
+    finally:
+        if scheduler is not None:
+            scheduler.release(host, status, retry_after)
+
+
+def get_bytes(
+    session: requests.Session,
+    url: str,
+    *,
+    deadline: Deadline,
+    params: dict[str, Any] | None = None,
+    headers: dict[str, str] | None = None,
+    max_bytes: int = 1 << 20,
+    connect_timeout_s: float = 3.0,
+    scheduler: HostScheduler | None = None,
+) -> tuple[int, bytes]:
+    """GET `url` within `deadline`, reading at most `max_bytes` of body.
+
+    Returns:
+        tuple[int, bytes]: HTTP status and body.
+
+    Raises:
+        SearchTimeout: Past the deadline.
+        SearchCancelled: Cancelled through the deadline's token.
+        ResponseTooLarge: On a body over `max_bytes`.
+        SearchError: On connection errors.
+    """
+    with open_stream(
+        session,
+        url,
+        deadline=deadline,
+        params=params,
+        headers=headers,
+        connect_timeout_s=connect_timeout_s,
+        scheduler=scheduler,
+    ) as stream:
+        body = b"".join(stream.iter_chunks(max_bytes))
+        return stream.status, body
+
+
+def make_session(pool_maxsize: int = 16, user_agent: str = "") -> requests.Session:
+    session = requests.Session()
+    # Retries are the provider's call: they must respect the deadline
+    adapter = HTTPAdapter(pool_connections=8, pool_maxsize=pool_maxsize, max_retries=0)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    if user_agent:
+        session.headers["User-Agent"] = user_agent
+    return session
+
+
+_default_session: requests.Session | None = None
+_default_lock = threading.Lock()
+
+
+def get_http_session(config: dict[str, Any] | None = None) -> requests.Session:
+    """Return the process-wide pooled session configured by `search`."""
+    global _default_session
+    search_cfg = dict((config or {}).get("search", {}) or {})
+    with _default_lock:
+        if _default_session is None:
+            _default_session = make_session(
+                pool_maxsize=int(search_cfg.get("pool_maxsize", 16)),
+                user_agent=str(search_cfg.get("user_agent", "") or ""),
+            )
+        return _default_session
+
+
+def default_http_session() -> requests.Session | None:
+    """Return the process-wide session if one has been created, without creating it."""
+    return _default_session
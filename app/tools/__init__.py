@@ -1 +1 @@
-"""Tool interfaces: search, retriever, ingestion (stubs)."""
+"""Tool interfaces: web search, page fetch, retriever, context packer, ingestion."""
@@ -0,0 +1,183 @@
+"""Token-budgeted packing of retrieved passages into a synthesis prompt.
+
+Passages from the same source whose character ranges overlap or touch are
+merged into one span first, so the `chunk_overlap` text is sent once. Spans are
+then packed greedily by score density (relevance per token) until the budget
+is spent, and numbered for citation in best-first order.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Iterable
+from dataclasses import dataclass, field, replace
+
+from app.tools.retriever import RetrievalResult
+
+DEFAULT_CHARS_PER_TOKEN = 4.0
+
+
+def estimate_tokens(text: str, chars_per_token: float = DEFAULT_CHARS_PER_TOKEN) -> int:
+    """Cheap token estimate; avoids a tokenizer round-trip per passage."""
+    return int(len(text) / chars_per_token) + 1 if text else 0
+
+
+def context_budget(
+    *,
+    window_tokens: int,
+    max_output_tokens: int,
+    prompt_tokens: int,
+    max_context_tokens: int = 0,
+) -> int:
+    """Tokens left for retrieved context once output and fixed prompt are reserved.
+
+    `max_context_tokens` (0 = no cap) bounds the context regardless of the
+    window, to keep prompt size and latency predictable.
+    """
+    budget = window_tokens - max_output_tokens - prompt_tokens
+    if max_context_tokens > 0:
+        budget = min(budget, max_context_tokens)
+    return max(0, budget)
+
+
+@dataclass
+class ContextSpan:
+    """A contiguous character range of one source document."""
+
+    source_uri: str
+    start: int
+    end: int  # exclusive
+    text: str
+    score: float
+    chunk_ids: list[str] = field(default_factory=list)
+    tokens: int = 0
+
+    @property
+    def citation(self) -> str:
+        # RFC 5147 character range, so citations point at exactly the packed text
+        return f"{self.source_uri}#char={self.start},{self.end}"
+
+
+@dataclass
+class PackedContext:
+    spans: list[ContextSpan]
+    budget: int
+    tokens: int = 0
+    dropped: int = 0  # spans that did not fit
+
+    @property
+    def citations(self) -> list[str]:
+        """Citation ids; `citations[n - 1]` is the span rendered as `[n]`."""
+        return [s.citation for s in self.spans]
+
+    def render(self) -> str:
+        return "\n\n".join(
+            f"[{n}] {span.citation}\n{span.text}"
+            for n, span in enumerate(self.spans, start=1)
+        )
+
+
+def spans_from_result(result: RetrievalResult) -> list[ContextSpan]:
+    """One span per retrieved chunk, read from its index record."""
+    spans = []
+    for i in range(len(result)):
+        record = result.record(i)
+        text = str(record.get("text", ""))
+        start = int(record.get("start", 0))
+        spans.append(
+            ContextSpan(
+                source_uri=result.source_uri(i),
+                start=start,
+                end=int(record.get("end", start + len(text))),
+                text=text,
+                score=float(result.scores[i]),
+                chunk_ids=[str(record.get("chunk_id", ""))],
+            )
+        )
+    return spans
+
+
+def merge_adjacent(spans: Iterable[ContextSpan]) -> list[ContextSpan]:
+    """Merge same-source spans whose ranges overlap or touch.
+
+    A merged span scores the sum of its parts: it carries all their relevance
+    while the shared overlap text is only paid for once.
+    """
+    by_source: dict[str, list[ContextSpan]] = {}
+    for span in spans:
+        by_source.setdefault(span.source_uri, []).append(span)
+
+    merged: list[ContextSpan] = []
+    for group in by_source.values():
+        group.sort(key=lambda s: (s.start, s.end))
+        current = group[0]
+        for span in group[1:]:
+            if span.start <= current.end:
+                current = replace(
+                    current,
+                    score=current.score + span.score,
+                    chunk_ids=current.chunk_ids + span.chunk_ids,
+                )
+                if span.end > current.end:
+                    tail = span.text[current.end - span.start :]
+                    current = replace(current, end=span.end, text=current.text + tail)
+            else:
+                merged.append(current)
+                current = span
+        merged.append(current)
+    return merged
+
+
+def _truncate(span: ContextSpan, tokens: int, chars_per_token: float) -> ContextSpan:
+    limit = max(0, int((tokens - 1) * chars_per_token))
+    cut = span.text.rfind(" ", 0, limit + 1)
+    if cut <= 0:
+        cut = limit
+    return replace(span, text=span.text[:cut], end=span.start + cut)
+
+
+def pack_context(
+    spans: Iterable[ContextSpan],
+    budget_tokens: int,
+    *,
+    chars_per_token: float = DEFAULT_CHARS_PER_TOKEN,
+    separator_tokens: int = 16,
+    min_span_tokens: int = 64,
+) -> PackedContext:
+    """Merge spans and pack them greedily by score per token within the budget.
+
+    A span that no longer fits is cut at a word boundary to the remaining
+    budget, as long as at least `min_span_tokens` of text would remain.
+
+    Args:
+        spans: Scored spans, e.g. from `spans_from_result`.
+        budget_tokens: Tokens available for the rendered context.
+        chars_per_token: Ratio used by `estimate_tokens`.
+        separator_tokens: Per-span cost of the citation header and separators.
+        min_span_tokens: Smallest truncated span worth packing.
+
+    Returns:
+        PackedContext: Packed spans, best score first.
+    """
+    candidates = merge_adjacent(spans)
+    for span in candidates:
+        span.tokens = estimate_tokens(span.text, chars_per_token) + separator_tokens
+    candidates.sort(key=lambda s: max(s.score, 0.0) / s.tokens, reverse=True)
+
+    packed: list[ContextSpan] = []
+    used = 0
+    for span in candidates:
+        room = budget_tokens - used
+        if span.tokens > room:
+            if room - separator_tokens < min_span_tokens:
+                continue
+            span = _truncate(span, room - separator_tokens, chars_per_token)
+            span.tokens = estimate_tokens(span.text, chars_per_token) + separator_tokens
+        packed.append(span)
+        used += span.tokens
+    packed.sort(key=lambda s: s.score, reverse=True)
+    return PackedContext(
+        spans=packed,
+        budget=budget_tokens,
+        tokens=used,
+        dropped=len(candidates) - len(packed),
+    )
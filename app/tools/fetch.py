@@ -0,0 +1,41 @@
+from __future__ import annotations
+
+from typing import Any
+
+from app.search.cassette import get_cassette
+from app.search.pages import (
+    Page,
+    PageFetcher,
+    canonicalize_url,
+    get_page_cache,
+)
+from app.search.scheduler import get_host_scheduler
+from app.search.transport import get_http_session
+
+__all__ = ["Page", "canonicalize_url", "page_fetcher"]
+
+
+def page_fetcher(config: dict[str, Any] | None = None) -> PageFetcher | None:
+    """A page fetcher for one research run, configured by `fetch`.
+
+    Create one per run: it is what guarantees that no page is downloaded or
+    extracted twice within the run. Pages go through the shared keep-alive
+    session, the per-host politeness scheduler and the disk cache of
+    `fetch.cache`. In `search.mode` record or replay, pages are recorded to
+    or replayed from the cassette instead, without the disk cache.
+
+    Returns:
+        PageFetcher | None: None when `fetch.enabled` is false.
+    """
+    cfg = config or {}
+    fetch_cfg = dict(cfg.get("fetch", {}) or {})
+    if not fetch_cfg.get("enabled", True):
+        return None
+    cassette = get_cassette(cfg)
+    return PageFetcher(
+        get_http_session(cfg),
+        fetch_cfg,
+        get_page_cache(cfg) if cassette is None else None,
+        get_host_scheduler(cfg),
+        cassette,
+    )
@@ -0,0 +1,624 @@
+"""Incremental RAG ingestion over `data/sources/<company>/` (V003).
+
+Indexes are written to `data/indexes/<company>/<version>/`. Each run that
+changes an index publishes a new immutable snapshot and swaps the `CURRENT`
+pointer to it, so concurrent readers never see a half-written index
+(see `app.retrieval.indexing.snapshots`).
+
+Every run hashes the company's source files and compares them with the
+`IndexManifest`. Only new or changed documents are chunked and embedded, into
+one new append-only segment; rows belonging to changed or deleted documents are
+tombstoned instead of rewritten.
+
+The work is pipelined: a process pool reads and chunks documents, and a single
+embedding stage consumes their chunks over a bounded queue and appends them to
+the segment on disk. Chunk text admitted into the pipeline is capped by
+`ingestion.max_memory_mb`, so memory stays flat however large the corpus is.
+Documents are read through the streaming loaders in `app.retrieval.loaders`
+(text, Markdown, HTML, PDF). One too large for a quarter of that budget skips
+the pool: the embedding stage pulls its chunks lazily from the loader, batch by
+batch, so memory stays flat however large a single document is.
+"""
+
+from __future__ import annotations
+
+import bisect
+import hashlib
+import logging
+import os
+import queue
+import secrets
+import threading
+import time
+from collections.abc import Iterator
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from dataclasses import dataclass, field
+from itertools import islice
+from pathlib import Path
+from typing import Any
+
+from app.retrieval.index_cache import default_index_cache
+from app.retrieval.indexing.chunking import iter_chunks
+from app.retrieval.indexing.embeddings import embed_matrix
+from app.retrieval.indexing.manifest import DocumentEntry, IndexManifest, SegmentEntry
+from app.retrieval.indexing.segments import SegmentWriter, segment_paths, write_codes
+from app.retrieval.indexing.snapshots import (
+    collect_garbage,
+    load_snapshot,
+    publish_snapshot,
+)
+from app.retrieval.layout import company_slug, index_dir_for
+from app.retrieval.loaders import iter_sections, supported_suffixes
+from app.retrieval.metadata import document_metadata
+
+logger = logging.getLogger(__name__)
+
+EMBED_BATCH_SIZE = 64
+DEFAULT_MAX_MEMORY_MB = 256
+_HASH_BLOCK = 1 << 20
+# Documents costing more than this share of the memory budget are streamed
+_STREAM_SHARE = 4
+_DONE = object()
+
+
+@dataclass
+class StageStats:
+    items: int = 0
+    bytes: int = 0
+    seconds: float = 0.0
+
+    @property
+    def rate(self) -> float:
+        return self.items / self.seconds if self.seconds > 0 else 0.0
+
+
+@dataclass
+class IngestReport:
+    company: str
+    added: int = 0
+    changed: int = 0
+    removed: int = 0
+    unchanged: int = 0
+    chunks_embedded: int = 0
+    rebuilt: bool = False
+    generation: int = 0
+    elapsed_s: float = 0.0
+    # Busy time per pipeline stage: chunk (docs, summed over workers), embed
+    # and write (chunks)
+    stages: dict[str, StageStats] = field(default_factory=dict)
+
+    def summary(self) -> str:
+        text = (
+            f"{self.company}: +{self.added} ~{self.changed} -{self.removed} "
+            f"={self.unchanged} docs, {self.chunks_embedded} chunks embedded, "
+            f"generation {self.generation}, {self.elapsed_s:.2f}s"
+            + (" (full rebuild)" if self.rebuilt else "")
+        )
+        if self.stages:
+            text += (
+                " ["
+                + ", ".join(
+                    f"{name} {s.items} @ {s.rate:.0f}/s"
+                    for name, s in self.stages.items()
+                )
+                + "]"
+            )
+        return text
+
+
+def file_hash(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        while block := f.read(_HASH_BLOCK):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def scan_sources(source_dir: Path) -> dict[str, Path]:
+    """Map POSIX paths relative to `source_dir` to ingestible files."""
+    if not source_dir.is_dir():
+        return {}
+    suffixes = supported_suffixes()
+    return {
+        p.relative_to(source_dir).as_posix(): p
+        for p in sorted(source_dir.rglob("*"))
+        if p.is_file() and not p.name.startswith(".") and p.suffix.lower() in suffixes
+    }
+
+
+def iter_document_chunks(
+    path: Path,
+    rel: str,
+    source_uri: str,
+    company: str,
+    chunk_size: int,
+    chunk_overlap: int,
+) -> Iterator[dict[str, Any]]:
+    """Stream the chunk records of one document from its loader.
+
+    `start`/`end` are offsets into the loader's text; chunks of paged
+    documents also record the page their first character is on.
+    """
+    page_starts: list[int] = []
+    page_numbers: list[int] = []
+
+    def texts() -> Iterator[str]:
+        for section in iter_sections(path):
+            if section.page is not None:
+                page_starts.append(section.start)
+                page_numbers.append(section.page)
+            yield section.text
+
+    for i, (s, e, text) in enumerate(iter_chunks(texts(), chunk_size, chunk_overlap)):
+        record: dict[str, Any] = {
+            "chunk_id": f"{rel}#chunk-{i + 1}",
+            "source_uri": source_uri,
+            "doc": rel,
+            "start": s,
+            "end": e,
+            "text": text,
+            "company": company,
+        }
+        if page_starts:
+            record["page"] = page_numbers[bisect.bisect_right(page_starts, s) - 1]
+        yield record
+
+
+def _chunk_document(
+    path: Path,
+    rel: str,
+    source_uri: str,
+    company: str,
+    chunk_size: int,
+    chunk_overlap: int,
+) -> tuple[list[dict[str, Any]], int, float]:
+    """Read and chunk one document (runs in a worker process).
+
+    Returns:
+        tuple: Chunk records, characters of text read, and seconds spent.
+    """
+    t0 = time.perf_counter()
+    records = list(
+        iter_document_chunks(path, rel, source_uri, company, chunk_size, chunk_overlap)
+    )
+    n_chars = records[-1]["end"] if records else 0
+    return records, n_chars, time.perf_counter() - t0
+
+
+class _ByteBudget:
+    """Admission control for chunk text in flight between pipeline stages.
+
+    A document larger than the whole budget is still admitted once nothing else
+    is in flight, so the pipeline can't deadlock on it.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._used = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def try_acquire(self, n: int) -> bool:
+        with self._cond:
+            if self._used and self._used + n > self.max_bytes:
+                return False
+            self._used += n
+            return True
+
+    def acquire(self, n: int) -> None:
+        with self._cond:
+            while self._used and self._used + n > self.max_bytes and not self._closed:
+                self._cond.wait()
+            self._used += n
+
+    def release(self, n: int) -> None:
+        with self._cond:
+            self._used -= n
+            self._cond.notify_all()
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+def _feed_chunks(
+    pool: Executor,
+    jobs: list[tuple[str, tuple[Any, ...], int]],
+    budget: _ByteBudget,
+    out: queue.Queue,
+    stop: threading.Event,
+    max_inflight: int,
+) -> None:
+    """Submit chunking jobs within the byte budget and forward their results.
+
+    Each result is put on `out` whole, so one document's chunks reach the
+    embedding stage contiguously. Documents too large for their share of the
+    budget are forwarded as lazy chunk iterators instead.
+    """
+    try:
+        inflight: dict[Future, tuple[str, int]] = {}
+        pending = list(reversed(jobs))
+        while (pending or inflight) and not stop.is_set():
+            while pending and len(inflight) < max_inflight:
+                rel, args, cost = pending[-1]
+                if cost > budget.max_bytes // _STREAM_SHARE:
+                    pending.pop()
+                    _put(out, (rel, 0, iter_document_chunks(*args), 0, 0.0), stop)
+                    continue
+                if inflight:
+                    if not budget.try_acquire(cost):
+                        break
+                else:
+                    budget.acquire(cost)
+                pending.pop()
+                inflight[pool.submit(_chunk_document, *args)] = (rel, cost)
+            if not inflight:
+                continue
+            done, _ = wait(inflight, return_when=FIRST_COMPLETED)
+            for future in done:
+                rel, cost = inflight.pop(future)
+                _put(out, (rel, cost, *future.result()), stop)
+        _put(out, _DONE, stop)
+    except Exception as exc:  # surfaced by the embedding stage
+        _put(out, exc, stop)
+
+
+def _put(out: queue.Queue, item: Any, stop: threading.Event) -> None:
+    # Give up once the consumer has stopped, instead of blocking on a full queue
+    while not stop.is_set():
+        try:
+            out.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            continue
+
+
+def _drop_dead_segments(manifest: IndexManifest) -> None:
+    """Forget segments whose rows are all tombstoned, and their tombstones.
+
+    Their files are removed by `collect_garbage` once no kept snapshot uses them.
+    """
+    for segment in list(manifest.segments):
+        start, end = segment.row_start, segment.row_start + segment.rows
+        dead = sum(
+            min(e, end) - max(s, start)
+            for s, e in manifest.tombstones
+            if s < end and e > start
+        )
+        if dead < segment.rows:
+            continue
+        manifest.segments.remove(segment)
+        manifest.tombstones = [
+            [s, e] for s, e in manifest.tombstones if not (s >= start and e <= end)
+        ]
+
+
+def _make_pool(workers: int) -> Executor:
+    # One worker means no process overhead: chunk on a helper thread instead
+    if workers <= 1:
+        return ThreadPoolExecutor(max_workers=1)
+    return ProcessPoolExecutor(max_workers=workers)
+
+
+def ingest_company(
+    company: str,
+    source_dir: Path,
+    index_root: Path,
+    *,
+    embedding_model: str = "text-embedding-004",
+    chunk_size: int = 800,
+    chunk_overlap: int = 150,
+    index_version: str = "v1",
+    quantization: str = "none",
+    pq_subvectors: int = 16,
+    keep_snapshots: int = 3,
+    workers: int = 1,
+    max_memory_mb: int = DEFAULT_MAX_MEMORY_MB,
+    embed_batch_size: int = EMBED_BATCH_SIZE,
+    pool: Executor | None = None,
+) -> IngestReport:
+    """Bring the index for `company` in line with the files in `source_dir`.
+
+    Args:
+        company: Company name; its slug names the index directory.
+        source_dir: Directory holding the company's raw documents.
+        index_root: Root directory for all indexes (e.g. `data/indexes`).
+        embedding_model: Embedding model; changing it forces a full rebuild.
+        chunk_size: Chunk size in characters; changing it forces a full rebuild.
+        chunk_overlap: Chunk overlap in characters; changing it forces a full rebuild.
+        index_version: Index version; names the directory under the company.
+        quantization: Vector codes to build: `none`, `int8` or `pq`. Changing
+            it re-encodes stored vectors without re-embedding.
+        pq_subvectors: Bytes per vector for `pq`.
+        keep_snapshots: Published snapshots kept for readers still using them.
+        workers: Chunking worker processes (size of `pool` when one is given).
+        max_memory_mb: Ceiling on chunk text held between stages.
+        embed_batch_size: Chunks per embedding call.
+        pool: Executor to run hashing and chunking on; shared across companies
+            by `ingest_from_config`.
+
+    Returns:
+        IngestReport: Per-document counts, stage throughput and timing.
+    """
+    t0 = time.perf_counter()
+    slug = company_slug(company)
+    index_dir = index_dir_for(index_root, company, index_version)
+    report = IngestReport(company=company)
+    own_pool = pool is None
+    pool = pool or _make_pool(workers)
+    try:
+        return _ingest(
+            report,
+            pool,
+            company=company,
+            slug=slug,
+            source_dir=source_dir,
+            index_dir=index_dir,
+            embedding_model=embedding_model,
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            index_version=index_version,
+            quantization=quantization,
+            pq_subvectors=pq_subvectors,
+            keep_snapshots=keep_snapshots,
+            max_inflight=2 * max(1, workers),
+            max_bytes=max_memory_mb * 1024 * 1024,
+            embed_batch_size=max(1, embed_batch_size),
+            t0=t0,
+        )
+    finally:
+        if own_pool:
+            pool.shutdown(cancel_futures=True)
+
+
+def _ingest(
+    report: IngestReport,
+    pool: Executor,
+    *,
+    company: str,
+    slug: str,
+    source_dir: Path,
+    index_dir: Path,
+    embedding_model: str,
+    chunk_size: int,
+    chunk_overlap: int,
+    index_version: str,
+    quantization: str,
+    pq_subvectors: int,
+    keep_snapshots: int,
+    max_inflight: int,
+    max_bytes: int,
+    embed_batch_size: int,
+    t0: float,
+) -> IngestReport:
+    wanted = IndexManifest(
+        company=company,
+        version=index_version,
+        embedding_model=embedding_model,
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+    )
+    _, manifest = load_snapshot(index_dir)
+    if manifest is None or not manifest.same_settings(wanted):
+        if manifest is not None:
+            report.rebuilt = True
+            wanted.generation = manifest.generation
+        wanted.build_id = secrets.token_hex(8)
+        manifest = wanted
+
+    if quantization != "pq":
+        pq_subvectors = 0
+    requantize = (manifest.quantization, manifest.pq_subvectors) != (
+        quantization,
+        pq_subvectors,
+    ) or any(
+        not segment_paths(index_dir, s.name, manifest.codes_tag)["codes"].exists()
+        for s in manifest.segments
+        if manifest.codes_tag
+    )
+    if requantize:
+        for segment in manifest.segments:
+            write_codes(
+                index_dir,
+                segment.name,
+                segment.rows,
+                manifest.dim,
+                quantization,
+                pq_subvectors=pq_subvectors,
+            )
+        manifest.quantization = quantization
+        manifest.pq_subvectors = pq_subvectors
+
+    sources = scan_sources(source_dir)
+    hashes = dict(zip(sources, pool.map(file_hash, sources.values())))
+
+    for rel in [r for r in manifest.documents if r not in sources]:
+        entry = manifest.documents.pop(rel)
+        manifest.tombstone(entry.chunk_start, entry.chunk_end)
+        report.removed += 1
+
+    pending = [
+        rel
+        for rel in sources
+        if rel not in manifest.documents
+        or manifest.documents[rel].content_hash != hashes[rel]
+    ]
+    report.unchanged = len(sources) - len(pending)
+
+    if pending:
+        name = f"seg-{manifest.generation + 1:06d}"
+        segment_start = max(
+            (s.row_start + s.rows for s in manifest.segments), default=0
+        )
+        stats = {k: StageStats() for k in ("chunk", "embed", "write")}
+        report.stages = stats
+        # Budget cost of a document: its text plus the overlap repeated in chunks
+        expansion = 1.0 + chunk_overlap / max(chunk_size, 1)
+        uris = {rel: f"doc://kb/{slug}/{rel}" for rel in pending}
+        jobs = [
+            (
+                rel,
+                (
+                    sources[rel],
+                    rel,
+                    uris[rel],
+                    company,
+                    chunk_size,
+                    chunk_overlap,
+                ),
+                int(sources[rel].stat().st_size * expansion) + 1,
+            )
+            for rel in pending
+        ]
+        budget = _ByteBudget(max_bytes)
+        chunks: queue.Queue = queue.Queue(maxsize=max_inflight)
+        stop = threading.Event()
+        feeder = threading.Thread(
+            target=_feed_chunks,
+            args=(pool, jobs, budget, chunks, stop, max_inflight),
+            name=f"ingest-feed-{slug}",
+            daemon=True,
+        )
+        writer = SegmentWriter(index_dir, name, manifest.dim)
+        feeder.start()
+        try:
+            row = segment_start
+            while (item := chunks.get()) is not _DONE:
+                if isinstance(item, BaseException):
+                    raise item
+                # `records` is a list, or a lazy iterator for streamed documents
+                rel, cost, records, n_bytes, chunk_s = item
+
+                old = manifest.documents.get(rel)
+                if old is not None:
+                    manifest.tombstone(old.chunk_start, old.chunk_end)
+                    report.changed += 1
+                else:
+                    report.added += 1
+                pull = iter(records)
+                n_records = 0
+                while True:
+                    t = time.perf_counter()
+                    batch = list(islice(pull, embed_batch_size))
+                    chunk_s += time.perf_counter() - t
+                    if not batch:
+                        break
+                    n_records += len(batch)
+                    n_bytes = max(n_bytes, int(batch[-1]["end"]))
+                    t = time.perf_counter()
+                    vectors = embed_matrix([r["text"] for r in batch], embedding_model)
+                    stats["embed"].seconds += time.perf_counter() - t
+                    stats["embed"].items += len(batch)
+                    t = time.perf_counter()
+                    writer.append(vectors, batch)
+                    stats["write"].seconds += time.perf_counter() - t
+                    stats["write"].items += len(batch)
+                stats["chunk"].items += 1
+                stats["chunk"].bytes += n_bytes
+                stats["chunk"].seconds += chunk_s
+                manifest.documents[rel] = DocumentEntry(
+                    content_hash=hashes[rel],
+                    segment=name,
+                    chunk_start=row,
+                    chunk_end=row + n_records,
+                    source_uri=uris[rel],
+                    metadata=document_metadata(company, sources[rel]),
+                )
+                row += n_records
+                report.chunks_embedded += n_records
+                budget.release(cost)
+        except BaseException:
+            stop.set()
+            budget.close()
+            writer.discard()
+            raise
+        finally:
+            feeder.join()
+        if writer.rows:
+            t = time.perf_counter()
+            writer.close()
+            write_codes(
+                index_dir,
+                name,
+                writer.rows,
+                writer.dim,
+                quantization,
+                pq_subvectors=pq_subvectors,
+            )
+            stats["write"].seconds += time.perf_counter() - t
+            manifest.segments.append(
+                SegmentEntry(name=name, row_start=segment_start, rows=writer.rows)
+            )
+            manifest.dim = writer.dim
+        else:
+            writer.discard()
+
+    if pending or report.removed or report.rebuilt or requantize:
+        _drop_dead_segments(manifest)
+        manifest.generation += 1
+        publish_snapshot(manifest, index_dir)
+        collect_garbage(index_dir, keep_snapshots)
+        # Handles opened by this process must not keep serving the old generation
+        if (cache := default_index_cache()) is not None:
+            cache.evict(company, index_version)
+
+    report.generation = manifest.generation
+    report.elapsed_s = time.perf_counter() - t0
+    return report
+
+
+def ingest_from_config(
+    config: dict[str, Any], *, company: str = "", source_dir: str = ""
+) -> list[IngestReport]:
+    """Ingest one company (or every company folder under the source root).
+
+    Settings come from the V003 config sections `ingestion`, `index`,
+    `embedding` and `chunking`. One worker pool is shared by all companies.
+    """
+    ingestion_cfg = dict(config.get("ingestion", {}) or {})
+    index_cfg = dict(config.get("index", {}) or {})
+    chunk_cfg = dict(config.get("chunking", {}) or {})
+    settings = {
+        "embedding_model": str(
+            (config.get("embedding", {}) or {}).get("model", "text-embedding-004")
+        ),
+        "chunk_size": int(chunk_cfg.get("size", 800)),
+        "chunk_overlap": int(chunk_cfg.get("overlap", 150)),
+        "index_version": str(index_cfg.get("version", "v1")),
+        "quantization": str(index_cfg.get("quantization", "none")),
+        "pq_subvectors": int(index_cfg.get("pq_subvectors", 16)),
+        "keep_snapshots": int(index_cfg.get("keep_snapshots", 3)),
+        "max_memory_mb": int(ingestion_cfg.get("max_memory_mb", DEFAULT_MAX_MEMORY_MB)),
+        "embed_batch_size": int(
+            ingestion_cfg.get("embed_batch_size", EMBED_BATCH_SIZE)
+        ),
+        "workers": int(ingestion_cfg.get("workers", 0) or 0) or os.cpu_count() or 1,
+    }
+    index_root = Path(str(index_cfg.get("dir", "data/indexes")))
+    source_root = Path(str(ingestion_cfg.get("source_dir", "data/sources")))
+
+    if company:
+        targets = [(company, Path(source_dir) if source_dir else source_root / company)]
+    else:
+        root = Path(source_dir) if source_dir else source_root
+        targets = [
+            (p.name, p)
+            for p in sorted(root.iterdir() if root.is_dir() else [])
+            if p.is_dir() and not p.name.startswith(".")
+        ]
+
+    reports: list[IngestReport] = []
+    with _make_pool(settings["workers"]) as pool:
+        for name, path in targets:
+            report = ingest_company(name, path, index_root, pool=pool, **settings)
+            logger.info(report.summary())
+            reports.append(report)
+    return reports
@@ -1,4 +1,62 @@
-from typing import TypedDict
+"""Retriever over per-company indexes (V003).
+
+Modes (`retriever.mode`):
+- `vector`: cosine similarity against the embedded chunks.
+- `lexical`: BM25 over the inverted index; needs no embedding call.
+- `hybrid`: both candidate lists fused with reciprocal rank fusion (RRF).
+
+Results are columnar (`RetrievalResult`): parallel arrays of index rows, scores
+and source ids, with chunk text and metadata read from the index only when a
+passage view is accessed. They are cached as rows and scores per (company
+slug, normalised query, top_k, min_score, mode, index build and generation,
+and every other result-shaping retriever setting) when
+`retriever.cache.enabled` is set.
+
+`retrieve_many` serves bulk workloads (evaluation runs, multi-step plans): one
+embedding call and one matrix product for the whole batch. Query embeddings
+are looked up in the persistent embedding table first
+(`retriever.embedding_table`), so recurring question templates skip the
+embedding call altogether.
+
+`filters` restrict a query to rows whose document metadata matches
+(`company`, `source_type`, `date_from`/`date_to`); they are resolved to allowed
+rows before any scoring (see `app.retrieval.metadata`).
+
+With `retriever.diversify.enabled`, `top_k * fetch_factor` candidates are
+fetched, near-duplicates collapsed (`dedup: cosine | minhash | none`) and the
+final `top_k` picked by maximal marginal relevance (`mmr_lambda`).
+"""
+
+from __future__ import annotations
+
+import logging
+from collections.abc import Callable, Iterator, Mapping
+from typing import Any, TypedDict, overload
+
+import numpy as np
+
+from app.retrieval.backends import FlatIndex
+from app.retrieval.diversify import (
+    DEDUP_METHODS,
+    collapse_duplicates,
+    minhash_signatures,
+    minhash_similarity,
+    mmr_select,
+    scale_scores,
+)
+from app.retrieval.embedding_table import (
+    EmbeddingTable,
+    default_embedding_table,
+    embed_queries,
+    get_embedding_table,
+)
+from app.retrieval.index_cache import default_index_cache, get_index_cache
+from app.retrieval.layout import company_slug
+from app.retrieval.query_cache import cache_key, default_query_cache, get_query_cache
+
+logger = logging.getLogger(__name__)
+
+RETRIEVER_MODES = ("vector", "lexical", "hybrid")
 
 
 class Passage(TypedDict):
@@ -9,14 +67,433 @@ class Passage(TypedDict):
     metadata: dict[str, str]
 
 
-def retrieve(query: str, *, top_k: int = 8, min_score: float = 0.3) -> list[Passage]:
-    # Placeholder implementation
-    return [
-        {
-            "text": "Company overview...",
-            "source_uri": "doc://kb/acme/overview.md",
-            "chunk_id": "1",
-            "score": 0.85,
-            "metadata": {"company": "acme"},
-        }
-    ]
+def _vector_candidates(
+    index: FlatIndex,
+    queries: list[str],
+    k: int,
+    min_score: float,
+    rescore_factor: int,
+    allowed: np.ndarray | None = None,
+    table: EmbeddingTable | None = None,
+) -> list[tuple[np.ndarray, np.ndarray]]:
+    q = embed_queries(queries, index.manifest.embedding_model, table)
+    rows, scores = index.search_many(q, k, rescore_factor=rescore_factor, rows=allowed)
+    keep = scores >= min_score  # also drops the -1/-inf padding
+    return [(r[m], s[m]) for r, s, m in zip(rows, scores, keep)]
+
+
+def rrf_fuse(ranked: list[np.ndarray], *, k: int = 60) -> tuple[np.ndarray, np.ndarray]:
+    """Reciprocal rank fusion of several best-first row lists.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: Fused rows and scores, best first.
+    """
+    parts = [r for r in ranked if len(r)]
+    if not parts:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    rows = np.concatenate(parts)
+    contrib = np.concatenate([1.0 / (k + 1 + np.arange(len(r))) for r in parts])
+    unique, inverse = np.unique(rows, return_inverse=True)
+    scores = np.bincount(inverse, weights=contrib)
+    order = np.argsort(-scores, kind="stable")
+    return unique[order], scores[order].astype(np.float32)
+
+
+_PASSAGE_KEYS = ("text", "source_uri", "chunk_id", "score", "metadata")
+
+
+class PassageView(Mapping[str, Any]):
+    """Read-only, `Passage`-compatible view of one row of a `RetrievalResult`.
+
+    The chunk record is read from the index on first access to `text`,
+    `chunk_id` or `metadata`; `score` and `source_uri` come from the columns.
+    """
+
+    __slots__ = ("_i", "_record", "_result")
+
+    def __init__(self, result: RetrievalResult, i: int):
+        self._result = result
+        self._i = i
+        self._record: dict[str, Any] | None = None
+
+    def _rec(self) -> dict[str, Any]:
+        if self._record is None:
+            self._record = self._result.record(self._i)
+        return self._record
+
+    def __getitem__(self, key: str) -> Any:
+        if key == "score":
+            return float(self._result.scores[self._i])
+        if key == "source_uri":
+            return self._result.source_uri(self._i)
+        if key == "text":
+            return self._rec().get("text", "")
+        if key == "chunk_id":
+            return self._rec().get("chunk_id", str(int(self._result.rows[self._i])))
+        if key == "metadata":
+            record = self._rec()
+            return {
+                "company": str(record.get("company", "")),
+                "doc": str(record.get("doc", "")),
+            }
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(_PASSAGE_KEYS)
+
+    def __len__(self) -> int:
+        return len(_PASSAGE_KEYS)
+
+    def __repr__(self) -> str:
+        return f"PassageView(row={int(self._result.rows[self._i])}, score={self['score']:.4f})"
+
+
+class RetrievalResult:
+    """Columnar retrieval result, best first.
+
+    Attributes:
+        rows: Global index rows (int64); the chunk identity within the index.
+        scores: Scores (float32), aligned with `rows`.
+        source_ids: Positions in `sources` (int32), -1 if the index doesn't
+            know the row's source and it has to be read from the chunk record.
+        sources: Interned source URIs, shared with the index.
+
+    Iterating and indexing yield `PassageView`s and slicing a sub-result, so
+    callers written against `list[Passage]` keep working; `to_passages()`
+    materialises plain dicts.
+    """
+
+    __slots__ = ("_read", "rows", "scores", "source_ids", "sources")
+
+    def __init__(
+        self,
+        rows: np.ndarray,
+        scores: np.ndarray,
+        source_ids: np.ndarray,
+        sources: list[str],
+        read: Callable[[int], dict[str, Any]] | None,
+    ):
+        self.rows = rows
+        self.scores = scores
+        self.source_ids = source_ids
+        self.sources = sources
+        self._read = read
+
+    @classmethod
+    def empty(cls) -> RetrievalResult:
+        return cls(
+            np.zeros(0, dtype=np.int64),
+            np.zeros(0, dtype=np.float32),
+            np.zeros(0, dtype=np.int32),
+            [],
+            None,
+        )
+
+    @classmethod
+    def from_index(
+        cls, index: FlatIndex, rows: np.ndarray, scores: np.ndarray
+    ) -> RetrievalResult:
+        rows = np.asarray(rows, dtype=np.int64)
+        return cls(
+            rows,
+            np.asarray(scores, dtype=np.float32),
+            index.row_sources[rows],
+            index.sources,
+            index.chunk_reader(),
+        )
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __iter__(self) -> Iterator[PassageView]:
+        return (PassageView(self, i) for i in range(len(self.rows)))
+
+    @overload
+    def __getitem__(self, i: int) -> PassageView: ...
+
+    @overload
+    def __getitem__(self, i: slice) -> RetrievalResult: ...
+
+    def __getitem__(self, i: int | slice) -> PassageView | RetrievalResult:
+        if isinstance(i, slice):
+            return self.take(np.arange(len(self.rows))[i])
+        if not -len(self.rows) <= i < len(self.rows):
+            raise IndexError(i)
+        return PassageView(self, i % len(self.rows))
+
+    def record(self, i: int) -> dict[str, Any]:
+        """Read the chunk record behind position `i`."""
+        if self._read is None:
+            raise IndexError(i)
+        return self._read(int(self.rows[i]))
+
+    def source_uri(self, i: int) -> str:
+        sid = int(self.source_ids[i])
+        if sid >= 0:
+            return self.sources[sid]
+        return str(self.record(i).get("source_uri", ""))
+
+    def take(self, positions: np.ndarray | list[int]) -> RetrievalResult:
+        """Sub-result at `positions`, in that order."""
+        idx = np.asarray(positions, dtype=np.int64)
+        return RetrievalResult(
+            self.rows[idx],
+            self.scores[idx],
+            self.source_ids[idx],
+            self.sources,
+            self._read,
+        )
+
+    def to_passages(self) -> list[Passage]:
+        return [
+            {
+                "text": p["text"],
+                "source_uri": p["source_uri"],
+                "chunk_id": p["chunk_id"],
+                "score": p["score"],
+                "metadata": p["metadata"],
+            }
+            for p in self
+        ]
+
+
+def _search(
+    index: FlatIndex,
+    queries: list[str],
+    *,
+    mode: str,
+    top_k: int,
+    min_score: float,
+    retriever_cfg: dict[str, Any],
+    allowed: np.ndarray | None = None,
+    table: EmbeddingTable | None = None,
+) -> list[tuple[np.ndarray, np.ndarray]]:
+    if mode == "lexical":
+        return [index.search_lexical(q, top_k, rows=allowed) for q in queries]
+    rescore_factor = int(retriever_cfg.get("rescore_factor", 4))
+    if mode == "vector":
+        return _vector_candidates(
+            index, queries, top_k, min_score, rescore_factor, allowed, table
+        )
+
+    candidates = max(top_k, int(retriever_cfg.get("candidates", 50)))
+    rrf_k = int(retriever_cfg.get("rrf_k", 60))
+    fused = []
+    for query, (vec_rows, _) in zip(
+        queries,
+        _vector_candidates(
+            index, queries, candidates, min_score, rescore_factor, allowed, table
+        ),
+    ):
+        lex_rows, _ = index.search_lexical(query, candidates, rows=allowed)
+        rows, scores = rrf_fuse([vec_rows, lex_rows], k=rrf_k)
+        fused.append((rows[:top_k], scores[:top_k]))
+    return fused
+
+
+def _diversify(
+    index: FlatIndex, result: RetrievalResult, top_k: int, div_cfg: dict[str, Any]
+) -> RetrievalResult:
+    """Collapse near-duplicates, then order the best `top_k` by MMR.
+
+    Scores are left as retrieved; only membership and order change.
+    """
+    if not len(result):
+        return result
+    vectors = index.row_vectors(result.rows)
+    cosine = vectors @ vectors.T
+    dedup = str(div_cfg.get("dedup", "cosine"))
+    if dedup == "cosine":
+        keep = collapse_duplicates(cosine, float(div_cfg.get("cosine_threshold", 0.95)))
+    elif dedup == "minhash":
+        texts = [result.record(i).get("text", "") for i in range(len(result))]
+        signatures = minhash_signatures(
+            texts,
+            shingle_size=int(div_cfg.get("shingle_size", 5)),
+            num_perm=int(div_cfg.get("minhash_perms", 64)),
+        )
+        keep = collapse_duplicates(
+            minhash_similarity(signatures),
+            float(div_cfg.get("minhash_threshold", 0.8)),
+        )
+    else:
+        keep = np.ones(len(result), dtype=bool)
+    positions = np.flatnonzero(keep)
+    picked = mmr_select(
+        scale_scores(result.scores[positions]),
+        cosine[np.ix_(positions, positions)],
+        top_k,
+        float(div_cfg.get("mmr_lambda", 0.7)),
+    )
+    return result.take(positions[picked])
+
+
+def _result_options(
+    index: FlatIndex,
+    retriever_cfg: dict[str, Any],
+    div_cfg: dict[str, Any],
+    filters: dict[str, Any] | None,
+) -> dict[str, Any]:
+    """Settings besides the cache key's own fields that shape a result."""
+    return {
+        "embedding_model": index.manifest.embedding_model,
+        "candidates": int(retriever_cfg.get("candidates", 50)),
+        "rrf_k": int(retriever_cfg.get("rrf_k", 60)),
+        "rescore_factor": int(retriever_cfg.get("rescore_factor", 4)),
+        "diversify": div_cfg,
+        "filters": filters or {},
+    }
+
+
+def retrieve(
+    query: str,
+    *,
+    top_k: int = 8,
+    min_score: float = 0.3,
+    company: str = "",
+    mode: str | None = None,
+    filters: dict[str, Any] | None = None,
+    config: dict[str, Any] | None = None,
+) -> RetrievalResult:
+    """Retrieve the `top_k` best passages for `query` from `company`'s index.
+
+    `min_score` thresholds cosine similarity, so it only filters vector
+    candidates. Lexical results carry BM25 scores and hybrid results RRF scores.
+
+    Args:
+        query: Natural-language query.
+        top_k: Number of passages to return.
+        min_score: Minimum cosine similarity for vector candidates.
+        company: Company whose index is searched.
+        mode: `vector`, `lexical` or `hybrid`; defaults to `retriever.mode`.
+        filters: Metadata filters (`company`, `source_type`, `date_from`,
+            `date_to`); only matching chunks are scored.
+        config: App config; supplies the `retriever` and `index` sections.
+
+    Returns:
+        RetrievalResult: Passages, best first. Empty if the company has no index.
+
+    Raises:
+        ValueError: On an unsupported mode, dedup method or filter key.
+    """
+    return retrieve_many(
+        [query],
+        top_k=top_k,
+        min_score=min_score,
+        company=company,
+        mode=mode,
+        filters=filters,
+        config=config,
+    )[0]
+
+
+def retrieve_many(
+    queries: list[str],
+    *,
+    top_k: int = 8,
+    min_score: float = 0.3,
+    company: str = "",
+    mode: str | None = None,
+    filters: dict[str, Any] | None = None,
+    config: dict[str, Any] | None = None,
+) -> list[RetrievalResult]:
+    """Batched `retrieve` over one company's index.
+
+    Queries missing from the query cache are embedded in one call and scored
+    against the index with a single matrix product, with top-k selected per
+    query row. Lexical scoring stays per query.
+
+    Returns:
+        list[RetrievalResult]: One result per query, in input order.
+    """
+    cfg = config or {}
+    retriever_cfg = dict(cfg.get("retriever", {}) or {})
+    mode = mode or str(retriever_cfg.get("mode", "hybrid"))
+    if mode not in RETRIEVER_MODES:
+        raise ValueError(f"Unsupported retriever mode: {mode}")
+    div_cfg = dict(retriever_cfg.get("diversify", {}) or {})
+    if not div_cfg.get("enabled", False):
+        div_cfg = {}
+    elif str(div_cfg.get("dedup", "cosine")) not in DEDUP_METHODS:
+        raise ValueError(f"Unsupported dedup method: {div_cfg['dedup']}")
+    results = [RetrievalResult.empty() for _ in queries]
+    todo = [i for i, q in enumerate(queries) if q.strip()]
+    if not todo or not company:
+        return results
+
+    version = str((cfg.get("index", {}) or {}).get("version", "v1"))
+    try:
+        index = get_index_cache(cfg).get(company, version)
+    except FileNotFoundError:
+        logger.warning(f"No index for company '{company}' (version {version})")
+        return results
+    allowed = index.filter_rows(filters)
+    if allowed is not None and not len(allowed):
+        return results
+
+    cache = get_query_cache(cfg)
+    keys: dict[int, str] = {}
+    if cache is not None:
+        manifest = index.manifest
+        index_version = f"{manifest.version}@{manifest.generation}@{manifest.build_id}"
+        options = _result_options(index, retriever_cfg, div_cfg, filters)
+        misses = []
+        for i in todo:
+            keys[i] = cache_key(
+                company_slug(company),
+                queries[i],
+                top_k=top_k,
+                min_score=min_score,
+                mode=mode,
+                index_version=index_version,
+                options=options,
+            )
+            cached = cache.get(keys[i])
+            if cached is not None:
+                results[i] = RetrievalResult.from_index(
+                    index, cached["rows"], cached["scores"]
+                )
+            else:
+                misses.append(i)
+        todo = misses
+    if not todo:
+        return results
+
+    fetch = top_k * max(1, int(div_cfg.get("fetch_factor", 3))) if div_cfg else top_k
+    found = _search(
+        index,
+        [queries[i] for i in todo],
+        mode=mode,
+        top_k=fetch,
+        min_score=min_score,
+        retriever_cfg=retriever_cfg,
+        allowed=allowed,
+        table=get_embedding_table(cfg),
+    )
+    for i, (rows, scores) in zip(todo, found):
+        results[i] = RetrievalResult.from_index(index, rows, scores)
+        if div_cfg:
+            results[i] = _diversify(index, results[i], top_k, div_cfg)
+        if cache is not None:
+            cache.put(
+                keys[i],
+                {
+                    "rows": results[i].rows.tolist(),
+                    "scores": results[i].scores.tolist(),
+                },
+            )
+    return results
+
+
+def retrieval_stats() -> dict[str, float]:
+    """Cumulative counters of the process-wide retrieval caches, as flat metrics."""
+    stats: dict[str, float] = {}
+    for prefix, cache in (
+        ("query_cache", default_query_cache()),
+        ("index_cache", default_index_cache()),
+        ("embedding_table", default_embedding_table()),
+    ):
+        if cache is not None:
+            for name, value in cache.stats().items():
+                stats[f"{prefix}.{name}"] = float(value)
+    return stats
@@ -1,20 +1,119 @@
-from typing import TypedDict
+from __future__ import annotations
 
+from typing import Any
 
-class SearchResult(TypedDict):
-    title: str
-    url: str
-    snippet: str
+from app.search.cache import (
+    STALE,
+    default_search_cache,
+    get_search_cache,
+    search_cache_key,
+)
+from app.search.cassette import REPLAY, cassette_key, cassette_stats, get_cassette
+from app.search.providers import SearchResult, make_provider
+from app.search.scheduler import default_host_scheduler, get_host_scheduler
+from app.search.transport import CancelToken, Deadline, get_http_session
+
+__all__ = ["SearchResult", "search_stats", "web_search"]
 
 
 def web_search(
-    query: str, *, timeout_s: float = 10.0, max_results: int = 5
+    query: str,
+    *,
+    timeout_s: float = 10.0,
+    max_results: int = 5,
+    config: dict[str, Any] | None = None,
+    cancel: CancelToken | None = None,
 ) -> list[SearchResult]:
-    # Placeholder implementation
-    return [
-        {
-            "title": "Example",
-            "url": "https://example.com",
-            "snippet": f"Result for {query}",
-        }
-    ]
+    """Search the web through the provider configured in `search`.
+
+    Connections come from the process-wide keep-alive pool, and requests
+    wait their turn in the per-host politeness scheduler. The whole call,
+    retries included, is bounded by `timeout_s`. With `search.cache.enabled`,
+    fresh cached results are returned without a call. Stale ones (within
+    `stale_s` past `ttl_s`) are returned at once and refreshed in the
+    background. `search.mode` record sends every call to the provider and
+    records it to the cassette; replay serves calls from the cassette only.
+
+    Args:
+        query: Search query.
+        timeout_s: Hard deadline for the call, in seconds.
+        max_results: Maximum number of results returned.
+        config: App config; supplies the `search` section.
+        cancel: Token that abandons the call when cancelled from another thread.
+
+    Returns:
+        list[SearchResult]: Normalised results, in provider rank order.
+
+    Raises:
+        SearchError: On failure; `SearchTimeout` past the deadline and
+            `SearchCancelled` after cancellation.
+    """
+    if not query.strip() or max_results <= 0:
+        return []
+    cfg = config or {}
+    search_cfg = dict(cfg.get("search", {}) or {})
+    cassette = get_cassette(cfg)
+    if cassette is not None:
+        key = cassette_key(
+            "search",
+            search_cache_key(
+                str(search_cfg.get("provider", "http")), query, max_results
+            ),
+        )
+        if cassette.mode == REPLAY:
+            return cassette.replay(
+                key, timeout_s=timeout_s, cancel=cancel, what=f"search {query!r}"
+            )
+
+    provider = make_provider(get_http_session(cfg), search_cfg, get_host_scheduler(cfg))
+    if cassette is not None:
+        # Recording bypasses the cache so the cassette holds provider calls
+        return cassette.record(
+            key,
+            lambda: provider.search(
+                query, max_results=max_results, deadline=Deadline(timeout_s, cancel)
+            ),
+            meta={"query": query, "provider": provider.name},
+        )
+    cache = get_search_cache(cfg)
+    if cache is None:
+        return provider.search(
+            query, max_results=max_results, deadline=Deadline(timeout_s, cancel)
+        )
+
+    key = search_cache_key(provider.name, query, max_results)
+    cached, state = cache.lookup(key)
+    if state == STALE:
+        cache.refresh(
+            key,
+            lambda: provider.search(
+                query, max_results=max_results, deadline=Deadline(timeout_s)
+            ),
+        )
+    if cached is not None:
+        return cached  # type: ignore[return-value]
+    results = provider.search(
+        query, max_results=max_results, deadline=Deadline(timeout_s, cancel)
+    )
+    cache.put(key, results)
+    return results
+
+
+def search_stats() -> dict[str, float]:
+    """Cumulative counters of the search cache, cassettes and HTTP scheduler."""
+    stats: dict[str, float] = {}
+    cache = default_search_cache()
+    if cache is not None:
+        stats.update(
+            {f"search_cache.{name}": float(v) for name, v in cache.stats().items()}
+        )
+    stats.update({f"cassette.{name}": v for name, v in cassette_stats().items()})
+    scheduler = default_host_scheduler()
+    if scheduler is not None:
+        stats.update(
+            {
+                f"http_scheduler.{name}": float(v)
+                for name, v in scheduler.stats().items()
+            }
+        )
+    return stats